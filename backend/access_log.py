@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+DEFAULT_PATH = os.environ.get('PESU_ACCESS_LOG_PATH') or os.path.join(tempfile.gettempdir(), 'pesu_access.sqlite3')
+# A request counts half as much after this many seconds
+HALF_LIFE = int(os.environ.get('PESU_ACCESS_HALF_LIFE', 3 * 24 * 60 * 60))
+FLUSH_INTERVAL = 30
+
+
+def _decayed(score, since, now, half_life):
+    return score * 0.5 ** (max(0.0, now - since) / half_life)
+
+
+class AccessLog:
+    """
+    Per-course request frequency, decayed over time so recent interest
+    outweighs old popularity. Hits are buffered in memory and flushed to
+    SQLite at most every FLUSH_INTERVAL seconds, so recording one costs a
+    dict update; the file is shared by every worker. With a catalog, only
+    course IDs it knows are recorded.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, half_life=HALF_LIFE, catalog=None):
+        self.path = path
+        self.half_life = half_life
+        self.catalog = catalog
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushed_at = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS course_access ("
+            "course_id TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, score REAL NOT NULL DEFAULT 0, "
+            "last_seen REAL NOT NULL DEFAULT 0, warmed_at REAL)"
+        )
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.create_function('decayed', 4, _decayed, deterministic=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, course_id):
+        if not course_id:
+            return
+        # Course IDs come from the request; unknown ones would grow the table without bound
+        if self.catalog is not None and self.catalog.get(course_id) is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._pending[str(course_id)] = self._pending.get(str(course_id), 0) + 1
+            due = now - self._flushed_at >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.time()
+        if not pending:
+            return
+        now = time.time()
+        conn = self._conn()
+        # Decayed in the upsert itself, so concurrent flushes from other workers add up instead of overwriting
+        conn.executemany(
+            "INSERT INTO course_access (course_id, hits, score, last_seen) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(course_id) DO UPDATE SET hits = hits + ?, "
+            "score = decayed(score, last_seen, ?, ?) + ?, last_seen = MAX(last_seen, ?)",
+            [(course_id, hits, hits, now, hits, now, self.half_life, hits, now) for course_id, hits in pending.items()]
+        )
+        conn.commit()
+
+    def top(self, limit=None):
+        """Returns [(course_id, score)] by current decayed score, highest first."""
+        self.flush()
+        now = time.time()
+        scored = [
+            (course_id, _decayed(score, last_seen, now, self.half_life))
+            for course_id, score, last_seen in self._conn().execute(
+                "SELECT course_id, score, last_seen FROM course_access WHERE hits > 0"
+            )
+        ]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit] if limit else scored
+
+    def warmed_at(self, course_id):
+        row = self._conn().execute(
+            "SELECT warmed_at FROM course_access WHERE course_id = ?", (str(course_id),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark_warmed(self, course_id):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO course_access (course_id, warmed_at) VALUES (?, ?) "
+            "ON CONFLICT(course_id) DO UPDATE SET warmed_at = excluded.warmed_at",
+            (str(course_id), time.time())
+        )
+        conn.commit()
+
+    def stats(self):
+        self.flush()
+        courses, hits = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM course_access WHERE hits > 0"
+        ).fetchone()
+        return {"courses": courses, "hits": hits, "top": [[c, round(s, 2)] for c, s in self.top(10)]}
@@ -1,43 +1,104 @@
-from flask import Flask, jsonify, request, session
+import time
+_import_started = time.monotonic()
+
+from flask import Flask, abort, jsonify, request, session, Response
 from flask_cors import CORS
 from pesu_client import PESUClient
+from catalog import CourseCatalog, DEFAULT_LIMIT
+from metadata_cache import MetadataCache
+from session_store import SessionStore
+from jobs import JobScheduler, QueueFull, DONE, sse_stream
+from access_log import AccessLog
+from cache_warmer import CacheWarmer, ENABLED as WARMER_ENABLED
+from warmup import get_warmup
+from pdf_optimize import DEFAULT_QUALITY, QUALITIES
+from static_assets import StaticAssets
+from workspace import FILE_ESTIMATE as WORKSPACE_FILE_ESTIMATE, WorkspaceFull, get_workspaces
+import metrics
 import os
-import os
+import threading
 # Set this BEFORE importing any library that relies on .NET (like Spire) via pdf_utils check
 os.environ['DOTNET_SYSTEM_GLOBALIZATION_INVARIANT'] = '1'
 
 import json
 
-app = Flask(__name__, static_folder='static', static_url_path='/')
+app = Flask(__name__, static_folder=None)
+static_assets = StaticAssets()
 
 @app.route('/')
 def serve():
-    return app.send_static_file('index.html')
+    return static_assets.send_index() or not_found(None)
+
+@app.route('/<path:filename>')
+def static_file(filename):
+    response = static_assets.send(filename)
+    if response is None:
+        abort(404)
+    return response
 
 @app.errorhandler(404)
 def not_found(e):
     if request.path.startswith('/api/'):
         return jsonify({"error": "Not found"}), 404
-    return app.send_static_file('index.html')
+    # A missing bundle is a stale reference from an older build, not a client-side route
+    if not request.path.startswith('/assets/'):
+        response = static_assets.send_index()
+        if response is not None:
+            return response
+    return "Not found", 404
 app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24)) # Required for session management
 CORS(app, supports_credentials=True) # Enable CORS for all routes with credentials
 
-# Global client store (simple version for single user demo, ideally use session-based storage or redis)
-# For a multi-user web app, we shouldn't store the client globally like this.
-# Instead, we should probably re-create the session or store cookies.
-# However, since we can't easily serialize the requests.Session object, 
-# we will store a map of session_id -> PESUClient.
-clients = {}
+@app.before_request
+def start_request_trace():
+    from flask import g
+    g.request_started = time.monotonic()
+    g.trace = metrics.start_trace(f"{request.method} {request.path}", user=session.get('user_id'))
+
+@app.after_request
+def observe_request(response):
+    from flask import g
+    if metrics.ENABLED and request.path.startswith('/api/'):
+        rule = request.url_rule.rule if request.url_rule else "other"
+        metrics.REQUEST_SECONDS.observe(time.monotonic() - g.request_started, rule, str(response.status_code))
+    trace = g.get('trace')
+    if trace is not None:
+        # Streamed bodies are still being produced, so the trace ends when the response is closed
+        response.call_on_close(lambda: metrics.finish_trace(trace, status=response.status_code))
+    return response
+
+# Per-job scratch directories; init_app() starts removing leftovers of crashed processes
+workspaces = get_workspaces()
+
+def workspace_full(e):
+    response = jsonify({"error": str(e)})
+    response.headers['Retry-After'] = '30'
+    return response, 503
+
+# Live PESUClient per user, bounded and evicted by idle time / LRU.
+# Cookie jars are persisted so evicted or restarted sessions don't need a new login.
+session_store = SessionStore()
 
 def get_client(session_id):
-    if session_id not in clients:
-        clients[session_id] = PESUClient()
-    return clients[session_id]
+    return session_store.get(session_id)
+
+def logged_in():
+    # Set only by a successful login; every data route checks it
+    return bool(session.get('authenticated')) and 'user_id' in session
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy", "message": "PESU Scrape Backend is running"})
 
+@app.route('/api/ready', methods=['GET'])
+def ready_check():
+    # Liveness is /api/health; this turns 200 only once the conversion runtime is warm
+    warmup = get_warmup()
+    stats = warmup.stats()
+    if not warmup.ready():
+        return jsonify({"status": "warming", **stats}), 503
+    return jsonify({"status": "ready", **stats})
+
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.json
@@ -50,35 +111,69 @@ def login():
     # Create a new client for this session
     # In a real app, we'd manage session IDs properly. 
     # Here we'll just use the Flask session ID or generate one.
-    if 'user_id' not in session:
-        session['user_id'] = os.urandom(16).hex()
-    
-    user_id = session['user_id']
+    user_id = session.get('user_id') or os.urandom(16).hex()
     client = get_client(user_id)
     
     success, message = client.authenticate(username, password)
     
     if success:
+        # Only now does the session count as logged in: cached course material is
+        # served without asking upstream, so a session id alone must not be enough
+        session['user_id'] = user_id
+        session['authenticated'] = True
+        session_store.save(user_id, client)
         return jsonify({"status": "success", "message": message})
     else:
+        # A failed login also ends any earlier login in this session
+        session.pop('authenticated', None)
+        session_store.discard(user_id)
         return jsonify({"status": "error", "message": message}), 401
 
+# Course catalog is loaded by init_app() and reloaded when courses.json changes
+catalog = CourseCatalog(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'courses.json'), load=False)
+
+def catalog_full_response():
+    etag = f'"{catalog.etag}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=304)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = Response(catalog.full_gzip, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(catalog.full_json, mimetype='application/json')
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/api/courses', methods=['GET'])
 def get_courses():
     try:
-        if 'user_id' not in session:
+        if not logged_in():
             return jsonify({"error": "Unauthorized"}), 401
             
-        # Try to load local courses.json first as requested
-        courses_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'courses.json')
-        if os.path.exists(courses_path):
+        # Serve the local courses.json catalog first as requested
+        catalog.reload_if_changed()
+        if catalog.available():
+            args = request.args
+            if not any(k in args for k in ('q', 'prefix', 'limit', 'offset')):
+                # Unfiltered list keeps the old array shape for existing clients
+                return catalog_full_response()
+
             try:
-                with open(courses_path, 'r') as f:
-                    courses_data = json.load(f)
-                    return jsonify(courses_data)
-            except Exception as json_e:
-                print(f"Error reading courses.json: {json_e}")
-                # Fallthrough to client fetch
+                limit = int(args.get('limit', DEFAULT_LIMIT))
+                offset = int(args.get('offset', 0))
+            except ValueError:
+                return jsonify({"error": "limit and offset must be integers"}), 400
+
+            total, items = catalog.search(args.get('q'), args.get('prefix'), limit, offset)
+            next_offset = offset + len(items)
+            return jsonify({
+                "items": items,
+                "total": total,
+                "offset": offset,
+                "next_offset": next_offset if next_offset < total else None
+            })
         
         user_id = session['user_id']
         client = get_client(user_id)
@@ -89,29 +184,122 @@ def get_courses():
         print(f"Error fetching courses: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Unit and class lists are the same for every student, so they are cached across users
+metadata_cache = MetadataCache()
+
+# Per-course request frequency, used to decide what the cache warmer fetches first
+access_log = AccessLog(catalog=catalog)
+cache_warmer = CacheWarmer(metadata_cache, catalog, access_log)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    if not logged_in():
+        return jsonify({"error": "Unauthorized"}), 401
+    from blob_cache import get_blob_cache
+    from conversion_cache import get_conversion_cache
+    from merged_cache import get_merged_cache
+    return jsonify({
+        "metadata": metadata_cache.stats(),
+        "documents": get_blob_cache().stats(),
+        "conversions": get_conversion_cache().stats(),
+        "merged": get_merged_cache().stats(),
+        "access": access_log.stats(),
+        "warmer": cache_warmer.stats()
+    })
+
+@app.route('/api/transport/stats', methods=['GET'])
+def transport_stats():
+    if not logged_in():
+        return jsonify({"error": "Unauthorized"}), 401
+    from http_transport import get_transport
+    from download_engine import get_engine
+    from upstream_limiter import get_limiter
+    return jsonify({
+        "http": get_transport().stats(),
+        "downloads": get_engine().stats(),
+        "limiter": get_limiter().stats()
+    })
+
+@app.route('/api/workspaces/stats', methods=['GET'])
+def workspace_stats():
+    if not logged_in():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(workspaces.stats())
+
+def _cache_counts():
+    from blob_cache import get_blob_cache
+    from conversion_cache import get_conversion_cache
+    from merged_cache import get_merged_cache
+    merged = get_merged_cache()
+    hits = {("metadata",): metadata_cache.hits + metadata_cache.stale_hits, ("documents",): get_blob_cache().hits,
+            ("conversions",): get_conversion_cache().hits, ("merged",): merged.hits + merged.slices}
+    misses = {("metadata",): metadata_cache.misses, ("documents",): get_blob_cache().misses,
+              ("conversions",): get_conversion_cache().misses, ("merged",): merged.builds}
+    return hits, misses
+
+def _cache_hit_ratio():
+    hits, misses = _cache_counts()
+    return {key: hits[key] / (hits[key] + misses[key]) if hits[key] + misses[key] else None for key in hits}
+
+def _pool_depths():
+    from conversion_pool import get_pool
+    from download_engine import get_engine
+    from upstream_limiter import get_limiter
+    jobs = job_scheduler.stats()
+    conversions = get_pool().stats()
+    depths = {("jobs", "queued"): jobs["queued"], ("jobs", "running"): jobs["running"],
+              ("conversions", "queued"): conversions["queued"], ("conversions", "running"): conversions["running"],
+              ("downloads", "running"): get_engine().stats()["in_flight"]}
+    limiter = get_limiter().stats()
+    depths[("upstream", "running")] = limiter["in_flight"]
+    for priority, waiting in limiter["waiting"].items():
+        depths[(f"upstream_{priority}", "queued")] = waiting
+    return depths
+
+metrics.Gauge("pesu_cache_hits_total", "Cache hits by cache.", lambda: _cache_counts()[0], ("cache",), "counter")
+metrics.Gauge("pesu_cache_misses_total", "Cache misses by cache.", lambda: _cache_counts()[1], ("cache",), "counter")
+metrics.Gauge("pesu_cache_hit_ratio", "Share of lookups served from cache since start.", _cache_hit_ratio, ("cache",))
+metrics.Gauge("pesu_sessions_active", "Live PESU sessions held in memory.", lambda: len(session_store))
+metrics.Gauge("pesu_queue_depth", "Work waiting or running per queue.", _pool_depths, ("queue", "state"))
+
+def _upstream_limit():
+    from upstream_limiter import get_limiter
+    return get_limiter().limit
+
+metrics.Gauge("pesu_upstream_concurrency_limit", "Current adaptive upstream concurrency limit.", _upstream_limit)
+metrics.Gauge("pesu_workspaces_active", "Job scratch directories in use.", lambda: workspaces.stats()["workspaces"])
+metrics.Gauge("pesu_workspace_bytes", "Scratch bytes charged to live jobs.", lambda: workspaces.used)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/units/<course_id>', methods=['GET'])
 def get_units(course_id):
-    if 'user_id' not in session:
+    if not logged_in():
         return jsonify({"error": "Unauthorized"}), 401
     
     user_id = session['user_id']
     client = get_client(user_id)
-    units = client.get_units(course_id)
+    access_log.record(course_id)
+    units = metadata_cache.get_or_fetch(f"units:{course_id}", lambda: client.get_units(course_id))
     return jsonify(units)
 
 @app.route('/api/classes/<unit_id>', methods=['GET'])
 def get_classes(unit_id):
-    if 'user_id' not in session:
+    if not logged_in():
         return jsonify({"error": "Unauthorized"}), 401
     
     user_id = session['user_id']
     client = get_client(user_id)
-    classes = client.get_classes(unit_id)
+    classes = metadata_cache.get_or_fetch(f"classes:{unit_id}", lambda: client.get_classes(unit_id))
     return jsonify(classes)
 
 @app.route('/api/download', methods=['POST'])
 def download_merged():
-    if 'user_id' not in session:
+    if not logged_in():
         return jsonify({"error": "Unauthorized"}), 401
     
     data = request.json
@@ -121,143 +309,278 @@ def download_merged():
     unit_name = data.get('unit_name', 'Unit')
     
     resource_type = data.get('resource_type', '2') # Default to Slides (2)
+    quality = data.get('quality', DEFAULT_QUALITY)
     
     if not files_to_download or not course_id:
         return jsonify({"error": "No files or course ID selected"}), 400
+    if quality not in QUALITIES:
+        return jsonify({"error": f"quality must be one of {', '.join(QUALITIES)}"}), 400
 
     user_id = session['user_id']
     client = get_client(user_id)
+    access_log.record(course_id)
     
-    # Create temp directory using absolute path
-    # Create temp directory using system temp path
-    import tempfile
-    base_temp = tempfile.gettempdir()
-    temp_dir = os.path.join(base_temp, f"pesu_temp_{user_id}")
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    downloaded_pdfs = []
+    # Every request gets its own scratch directory, so concurrent downloads never share files
+    try:
+        workspace = workspaces.create(expected_bytes=len(files_to_download) * WORKSPACE_FILE_ESTIMATE)
+    except WorkspaceFull as e:
+        return workspace_full(e)
+    temp_dir = workspace.path
     
-    from pdf_utils import convert_pptx_to_pdf, convert_docx_to_pdf, merge_pdfs
-    import concurrent.futures
-    import shutil
-    import zipfile
-
-    def process_file(file_info):
-        class_id = file_info.get('classId')
-        name = file_info.get('name', 'unknown')
-        
-        print(f"Downloading file: {name} (Class ID: {class_id}, Type: {resource_type})")
-        
-        temp_path = os.path.join(temp_dir, f"{class_id}_temp")
-        success, final_paths = client.download_file(course_id, class_id, temp_path, resource_type)
-        
-        processed_pdfs = []
-        
-        if success:
-            for final_path in final_paths:
-                print(f"Successfully downloaded to {final_path}")
-                is_pdf = False
-                
-                # Detect file type
-                try:
-                    with open(final_path, 'rb') as f:
-                        header = f.read(4)
-                        if header.startswith(b'%PDF'):
-                            is_pdf = True
-                except Exception as e:
-                    print(f"Error reading file header: {e}")
-
-                if is_pdf:
-                    new_path = final_path + ".pdf"
-                    os.rename(final_path, new_path)
-                    processed_pdfs.append(new_path)
-                else:
-                    # Try PPTX/DOCX conversion
-                    is_zip = False
-                    try:
-                        with open(final_path, 'rb') as f:
-                            header = f.read(2)
-                            if header == b'PK':
-                                is_zip = True
-                    except:
-                        pass
-                        
-                    if is_zip:
-                        # Inspect zip contents to determine type
-                        try:
-                            with zipfile.ZipFile(final_path, 'r') as z:
-                                filenames = z.namelist()
-                                if any(f.startswith('ppt/') for f in filenames):
-                                    # It's likely a PPTX
-                                    pptx_path = final_path + ".pptx"
-                                    os.rename(final_path, pptx_path)
-                                    pdf_path = pptx_path.replace('.pptx', '.pdf')
-                                    if convert_pptx_to_pdf(pptx_path, pdf_path):
-                                        processed_pdfs.append(pdf_path)
-                                elif any(f.startswith('word/') for f in filenames):
-                                    # It's likely a DOCX
-                                    docx_path = final_path + ".docx"
-                                    os.rename(final_path, docx_path)
-                                    pdf_path = docx_path.replace('.docx', '.pdf')
-                                    if convert_docx_to_pdf(docx_path, pdf_path):
-                                        processed_pdfs.append(pdf_path)
-                                else:
-                                    # Fallback or unknown zip
-                                    print(f"Unknown zip content for {name}")
-                        except Exception as e:
-                            print(f"Error inspecting zip for {name}: {e}")
-                    else:
-                            print(f"File {name} is not a PDF or Office file")
-        else:
-            print(f"Failed to download {name}")
-            
-        return processed_pdfs
+    from pipeline import iter_unit_pdf, output_filename, PipelineError
+    from flask import stream_with_context
 
-    # Use ThreadPoolExecutor for parallel downloads
-    # Use ThreadPoolExecutor for sequential downloads/conversions to prevent OOM on Render
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        results = list(executor.map(process_file, files_to_download))
+    if QUALITIES[quality] is not None:
+        return download_optimized(client, course_id, files_to_download, resource_type, course_name, unit_name,
+                                  workspace, data.get('unit_id'), quality)
 
-    # Flatten results
-    downloaded_pdfs = [pdf for sublist in results for pdf in sublist]
-            
-    if not downloaded_pdfs:
-        shutil.rmtree(temp_dir, ignore_errors=True)
-        return jsonify({"error": "Failed to download or convert any files"}), 500
-        
-    # Sanitize filename
-    import re
-    safe_course_name = re.sub(r'[^\w\-_.]', '_', course_name)
-    safe_unit_name = re.sub(r'[^\w\-_.]', '_', unit_name)
-    output_filename = f"{safe_course_name}_{safe_unit_name}.pdf"
-    output_path = os.path.join(temp_dir, output_filename)
-    
+    # Parts are merged and sent in order as each one is converted, so the
+    # response starts before the last file is done and the merged document
+    # is never held in memory.
+    chunks = iter_unit_pdf(client, course_id, files_to_download, resource_type, temp_dir,
+                           unit_id=data.get('unit_id'))
     try:
-        merge_pdfs(downloaded_pdfs, output_path)
-        
-        from flask import send_file, after_this_request
-        
-        @after_this_request
-        def remove_temp_dir(response):
-            try:
-                # We can delete the temp dir using a deferred approach or just try to delete
-                # non-locked files. Or better, use a background thread to delete after a delay.
-                # Since we are returning the file, we can't delete it immediately if it's being streamed.
-                # However, Flask send_file with as_attachment=True usually buffers or streams.
-                # A robust way is to register a cleanup.
-                # For this script, we will simply try to delete it.
-                # Note: On Linux, you can unlink an open file.
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            except Exception as e:
-                print(f"Error cleaning up: {e}")
-            return response
+        # Waits for the first part so a total failure can still be reported as an error
+        first_chunk = next(chunks)
+    except PipelineError as e:
+        workspace.close()
+        return jsonify({"error": str(e)}), 500
+    except WorkspaceFull as e:
+        workspace.close()
+        return workspace_full(e)
+    except Exception as e:
+        print(f"Error building PDF: {e}")
+        workspace.close()
+        return jsonify({"error": "Failed to merge PDFs"}), 500
 
-        return send_file(output_path, as_attachment=True)
-        
+    def generate():
+        try:
+            yield first_chunk
+            yield from chunks
+        except Exception as e:
+            # Headers are already sent; all we can do is end the stream early
+            print(f"Error streaming merged PDF: {e}")
+        finally:
+            chunks.close()
+            workspace.close()
+
+    response = Response(stream_with_context(generate()), mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="{output_filename(course_name, unit_name)}"'
+    return response
+
+def download_optimized(client, course_id, files, resource_type, course_name, unit_name, workspace, unit_id, quality):
+    """
+    Optimizing needs the whole merged document, so unlike the default path
+    the response starts only once the PDF is merged and optimized. The
+    size reduction and time taken are reported in response headers.
+    """
+    from pipeline import build_merged_pdf, optimize_output, PipelineError, output_filename
+    from flask import stream_with_context
+
+    stats = {}
+    try:
+        path = build_merged_pdf(client, course_id, files, resource_type, course_name, unit_name, workspace.path,
+                                unit_id=unit_id)
+        stats = optimize_output(path, quality) or {}
+    except PipelineError as e:
+        workspace.close()
+        return jsonify({"error": str(e)}), 500
+    except WorkspaceFull as e:
+        workspace.close()
+        return workspace_full(e)
     except Exception as e:
-        print(f"Error merging PDFs: {e}")
+        print(f"Error building PDF: {e}")
+        workspace.close()
         return jsonify({"error": "Failed to merge PDFs"}), 500
 
+    def generate():
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(256 * 1024), b''):
+                    yield chunk
+        finally:
+            workspace.close()
+
+    response = Response(stream_with_context(generate()), mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="{output_filename(course_name, unit_name)}"'
+    response.headers['Content-Length'] = str(os.path.getsize(path))
+    if stats:
+        response.headers['X-PDF-Original-Bytes'] = str(stats['input_bytes'])
+        response.headers['X-PDF-Saved-Bytes'] = str(stats['saved_bytes'])
+        response.headers['X-PDF-Optimize-Ms'] = str(round(stats['seconds'] * 1000))
+    return response
+
+@app.route('/api/courses/<course_id>/export', methods=['GET'])
+def export_course(course_id):
+    if not logged_in():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    from course_export import MODES, MERGED, iter_course_zip
+    from pipeline import safe_name
+    from flask import stream_with_context
+
+    mode = request.args.get('mode', MERGED)
+    if mode not in MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(MODES)}"}), 400
+    resource_type = request.args.get('resource_type', '2')
+    course_name = request.args.get('course_name', 'Course')
+
+    user_id = session['user_id']
+    client = get_client(user_id)
+    access_log.record(course_id)
+    units = metadata_cache.get_or_fetch(f"units:{course_id}", lambda: client.get_units(course_id))
+    if not units:
+        return jsonify({"error": "No units found for this course"}), 404
+
+    def list_classes(unit_id):
+        return metadata_cache.get_or_fetch(f"classes:{unit_id}", lambda: client.get_classes(unit_id))
+
+    try:
+        workspace = workspaces.create()
+    except WorkspaceFull as e:
+        return workspace_full(e)
+
+    # Entries are appended as units finish, so the archive starts downloading
+    # right away and is never held in memory or on disk as a whole.
+    chunks = iter_course_zip(client, course_id, course_name, units, list_classes, resource_type, mode, workspace)
+
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            print(f"Error streaming course export: {e}")
+        finally:
+            chunks.close()
+            # The generator may never have started, so its own cleanup may not have run
+            workspace.close()
+
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{safe_name(course_name)}.zip"'
+    return response
+
+def run_download_job(job):
+    from pipeline import build_merged_pdf
+    params = job.params
+    client = get_client(job.user_id)
+    trace = metrics.start_trace("job", job=job.id, user=job.user_id)
+    status = "failed"
+    try:
+        path = build_merged_pdf(client, params['course_id'], params['files'], params['resource_type'],
+                                params['course_name'], params['unit_name'], job.temp_dir,
+                                progress=job.progress, unit_id=params.get('unit_id'),
+                                quality=params['quality'])
+        status = "done"
+        return path
+    finally:
+        metrics.finish_trace(trace, status=status)
+
+# Background download jobs, run by an in-process broker (no Redis needed)
+job_scheduler = JobScheduler(run_download_job)
+
+def get_user_job(job_id):
+    job = job_scheduler.get(job_id)
+    if job is None or not logged_in() or job.user_id != session.get('user_id'):
+        return None
+    return job
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    if not logged_in():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.json or {}
+    params = {
+        "files": data.get('files', []),
+        "course_id": data.get('course_id'),
+        "course_name": data.get('course_name', 'Course'),
+        "unit_name": data.get('unit_name', 'Unit'),
+        "resource_type": data.get('resource_type', '2'),
+        "unit_id": data.get('unit_id'),
+        "quality": data.get('quality', DEFAULT_QUALITY)
+    }
+    if not params['files'] or not params['course_id']:
+        return jsonify({"error": "No files or course ID selected"}), 400
+    if params['quality'] not in QUALITIES:
+        return jsonify({"error": f"quality must be one of {', '.join(QUALITIES)}"}), 400
+
+    access_log.record(params['course_id'])
+    try:
+        job = job_scheduler.submit(session['user_id'], params)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({"error": "Not found"}), 404
+    job_scheduler.cancel(job)
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({"error": "Not found"}), 404
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        last_seq = -1
+    response = Response(sse_stream(job, last_seq), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({"error": "Not found"}), 404
+    if job.status != DONE:
+        return jsonify({"error": "Job not finished", "status": job.status}), 409
+
+    from flask import send_file
+    return send_file(job.result_path, as_attachment=True)
+
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_app():
+    """
+    Starts the background work of a serving process: loads the course
+    catalog, starts workspace GC and the cache warmer (if enabled) and warms
+    up this process's conversion pool. Runs once per process.
+    """
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return app
+        _initialized = True
+    get_warmup().imported(time.monotonic() - _import_started)
+    catalog.reload_if_changed()
+    workspaces.start_gc()
+    if WARMER_ENABLED:
+        cache_warmer.start()
+    if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Under the debug reloader only the child process serves requests
+        get_warmup().start()
+    return app
+
+# Each gunicorn worker imports the app after forking, so this runs once per
+# worker process. Conversion workers are spawned, and spawn re-runs the main
+# script (python app.py) in each of them under the name __mp_main__, before
+# multiprocessing.parent_process() is set; nothing may start there.
+if __name__ != '__mp_main__':
+    init_app()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
 
@@ -0,0 +1,53 @@
+"""
+Measures how long `import app` takes in a fresh interpreter, which is what
+every gunicorn worker pays before /api/health and the browse routes can
+answer, and lists the slowest modules. Warm-up is disabled for the run so
+only the import itself is timed. Exits with status 1 when the total is
+over PESU_IMPORT_BUDGET_MS (default 1000).
+
+    python bench/import_budget.py [--top N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile():
+    """[(cumulative_us, self_us, module)] from -X importtime for `import app`."""
+    with tempfile.TemporaryDirectory(prefix="pesu_import_") as work_dir:
+        env = dict(os.environ, TMPDIR=work_dir, PESU_PRELOAD='0', PESU_WARMER_ENABLED='0')
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=BACKEND_DIR,
+                                env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=15, help="modules to list")
+    args = parser.parse_args()
+
+    budget_ms = float(os.environ.get('PESU_IMPORT_BUDGET_MS', 1000))
+    rows = import_profile()
+    total_ms = next(cumulative for cumulative, _, module in rows if module.strip() == 'app') / 1000
+
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative, self_us, module in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}{self_us / 1000:>10.1f}  {module.strip()}")
+    print(f"import app: {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    sys.exit(0 if total_ms <= budget_ms else 1)
+
+
+if __name__ == '__main__':
+    main()
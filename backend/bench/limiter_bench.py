@@ -0,0 +1,147 @@
+"""
+Drives the upstream limiter against a local stub of an overloaded PESU
+Academy and compares it with running unlimited.
+
+The stub serves CAPACITY requests comfortably; beyond that every extra
+concurrent request adds latency, and past twice the capacity it answers
+429. Bulk document GETs go through the download engine while interactive
+unit lookups go through the shared transport, like in production.
+
+    python bench/limiter_bench.py [--bulk N] [--interactive N] [--rate R] [--unlimited]
+"""
+import argparse
+import asyncio
+import http.server
+import os
+import socketserver
+import statistics
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('PESU_HTTP_BACKOFF_BASE', '0.05')
+
+import aiohttp  # noqa: E402
+
+import upstream_limiter  # noqa: E402
+
+CAPACITY = 6
+BASE_LATENCY = 0.02
+BODY = b"x" * 32 * 1024
+
+
+class OverloadedUpstream(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    lock = threading.Lock()
+    active = 0
+    served = 0
+    rejected = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = OverloadedUpstream
+        with cls.lock:
+            cls.active += 1
+            active = cls.active
+        try:
+            if active > 2 * CAPACITY:
+                with cls.lock:
+                    cls.rejected += 1
+                self.send_response(429)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            time.sleep(BASE_LATENCY * (1 + max(0, active - CAPACITY)))
+            body = b'<option value="1">Unit 1</option>' if '/getCourse/' in self.path else BODY
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with cls.lock:
+                cls.served += 1
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bulk', type=int, default=300)
+    parser.add_argument('--interactive', type=int, default=60)
+    parser.add_argument('--rate', type=float, default=upstream_limiter.RATE, help="token bucket rate, 0 for none")
+    parser.add_argument('--unlimited', action='store_true', help="disable the limiter for comparison")
+    args = parser.parse_args()
+
+    if args.unlimited:
+        upstream_limiter._limiter = upstream_limiter.AdaptiveLimiter(
+            rate=0, initial=10000, min_limit=10000, max_limit=10000)
+    else:
+        upstream_limiter._limiter = upstream_limiter.AdaptiveLimiter(rate=args.rate)
+    from download_engine import get_engine
+    from http_transport import get_transport
+
+    server = Server(('127.0.0.1', 0), OverloadedUpstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    engine = get_engine()
+    bulk_failures = []
+
+    async def bulk():
+        async with aiohttp.ClientSession(connector=engine._connector, connector_owner=False) as http:
+            async def one(i):
+                async with engine._get(http, f"{base}/doc/{i}") as response:
+                    await response.read()
+                    if response.status != 200:
+                        bulk_failures.append(response.status)
+            await asyncio.gather(*(one(i) for i in range(args.bulk)))
+
+    interactive_latency = []
+
+    def interactive():
+        session = get_transport().session()
+        for i in range(args.interactive):
+            started = time.monotonic()
+            session.get(f"{base}/Academy/a/i/getCourse/{i}")
+            interactive_latency.append(time.monotonic() - started)
+            time.sleep(0.02)
+
+    started = time.monotonic()
+    bulk_future = asyncio.run_coroutine_threadsafe(bulk(), engine._ensure_loop())
+    time.sleep(0.1)
+    threads = [threading.Thread(target=interactive) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    bulk_future.result()
+    elapsed = time.monotonic() - started
+
+    limiter = upstream_limiter.get_limiter().stats()
+    print(f"mode:                {'unlimited' if args.unlimited else 'adaptive'}")
+    print(f"wall time:           {elapsed:.2f}s")
+    print(f"bulk throughput:     {args.bulk / elapsed:.1f} req/s ({len(bulk_failures)} failed)")
+    print(f"interactive p50/p99: {statistics.median(interactive_latency) * 1000:.0f} / "
+          f"{percentile(interactive_latency, 0.99) * 1000:.0f} ms")
+    print(f"upstream 429s:       {OverloadedUpstream.rejected} (served {OverloadedUpstream.served})")
+    print(f"engine retries:      {engine.retries}")
+    print(f"final limit:         {limiter['limit']} (decreases {limiter['decreases']}, "
+          f"spikes {limiter['latency_spikes']}, overloads {limiter['overloads']})")
+    print(f"avg wait:            {limiter['avg_wait']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Drives the Flask app with N concurrent users against the local PESU
+Academy simulator and reports latency, throughput and peak memory.
+
+The backend runs in its own process (the Flask threaded server, or
+gunicorn with the Docker settings) with fresh caches in a temporary
+directory. Each user logs in, then for every round browses (course search,
+units, classes) and downloads a merged unit PDF through /api/download.
+Users pick from --courses courses, so later rounds and overlapping users
+exercise the caches. Peak RSS covers the backend and its conversion
+workers together.
+
+    python bench/load_test.py [--users N] [--rounds N] [--files N] [--courses N] [--server flask|gunicorn]
+                              [simulator options, see pesu_sim.py]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import requests  # noqa: E402
+
+import pesu_sim  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def tree_rss(pid):
+    """Resident bytes of a process and all its descendants."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, tree_rss(self.pid))
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak
+
+
+def start_backend(server, port, env):
+    if server == "gunicorn":
+        command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--timeout', '120',
+                   '--threads', '4', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with status {process.returncode}")
+        try:
+            # Wait for warm-up so cold conversion workers don't skew the first downloads
+            if requests.get(f"{base}/api/ready", timeout=1).status_code == 200:
+                return process, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Backend did not become ready")
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.errors = {}
+        self.bytes = 0
+
+    def record(self, operation, seconds, ok, size=0):
+        with self.lock:
+            self.latency.setdefault(operation, []).append(seconds)
+            if not ok:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+            self.bytes += size
+
+
+def timed(results, operation, fn):
+    started = time.monotonic()
+    try:
+        response = fn()
+        ok = response.status_code < 400
+        size = len(response.content)
+    except requests.RequestException:
+        response, ok, size = None, False, 0
+    results.record(operation, time.monotonic() - started, ok, size)
+    return response if ok else None
+
+
+def run_user(base, args, course_ids, password, results, seed):
+    rng = random.Random(seed)
+    http = requests.Session()
+    if timed(results, "login", lambda: http.post(f"{base}/api/login", json={"username": f"user{seed}",
+                                                                             "password": password})) is None:
+        return
+    for _ in range(args.rounds):
+        course_id = rng.choice(course_ids)
+        timed(results, "browse:courses", lambda: http.get(f"{base}/api/courses", params={"q": "data", "limit": 20}))
+        response = timed(results, "browse:units", lambda: http.get(f"{base}/api/units/{course_id}"))
+        if not response or not response.json():
+            continue
+        unit = rng.choice(response.json())
+        response = timed(results, "browse:classes", lambda: http.get(f"{base}/api/classes/{unit['unitId']}"))
+        if not response or not response.json():
+            continue
+        classes = response.json()[:args.files]
+        body = {"course_id": course_id, "unit_id": unit['unitId'], "course_name": "Bench", "unit_name": unit['title'],
+                "resource_type": "2", "files": [{"classId": c['classId'], "name": c['title']} for c in classes]}
+        timed(results, "download", lambda: http.post(f"{base}/api/download", json=body, timeout=300))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--files', type=int, default=4, help="classes per download")
+    parser.add_argument('--courses', type=int, default=5, help="distinct courses users choose from")
+    parser.add_argument('--server', choices=("flask", "gunicorn"), default="flask")
+    parser.add_argument('--upstream', help="use a running simulator (its /Academy URL) instead of starting one")
+    pesu_sim.add_arguments(parser)
+    args = parser.parse_args()
+
+    sim = None
+    if args.upstream:
+        upstream = args.upstream.rstrip('/')
+    else:
+        sim = pesu_sim.from_arguments(args)
+        upstream = sim.start()
+
+    work_dir = tempfile.mkdtemp(prefix="pesu_load_")
+    env = dict(os.environ, PESU_BASE_URL=upstream, TMPDIR=work_dir, SECRET_KEY="load-test")
+    process, base = start_backend(args.server, free_port(), env)
+    sampler = RssSampler(process.pid)
+    sampler.start()
+
+    results = Results()
+    course_ids = [str(20000 + n) for n in range(args.courses)]
+    password = sim.password if sim else "password"
+    started = time.monotonic()
+    try:
+        users = [threading.Thread(target=run_user, args=(base, args, course_ids, password, results, n))
+                 for n in range(args.users)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.monotonic() - started
+        # Stats routes need a logged-in session like the rest of the API
+        http = requests.Session()
+        http.post(f"{base}/api/login", json={"username": "stats", "password": password})
+        cache_stats = http.get(f"{base}/api/cache/stats").json()
+    finally:
+        peak_rss = sampler.stop()
+        process.terminate()
+        process.wait(10)
+        if sim is not None:
+            sim.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total = sum(len(v) for v in results.latency.values())
+    print(f"users {args.users}, rounds {args.rounds}, files per download {args.files}, server {args.server}")
+    print(f"{'operation':<16}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for operation, values in results.latency.items():
+        print(f"{operation:<16}{len(values):>7}{results.errors.get(operation, 0):>8}"
+              f"{statistics.median(values) * 1000:>10.0f}{percentile(values, 0.99) * 1000:>10.0f}")
+    print(f"wall time:       {elapsed:.2f}s")
+    print(f"throughput:      {total / elapsed:.1f} req/s, {len(results.latency.get('download', [])) / elapsed:.2f} "
+          f"downloads/s, {results.bytes / elapsed / 1024 ** 2:.1f} MiB/s served")
+    print(f"peak RSS:        {peak_rss / 1024 ** 2:.0f} MiB (backend and conversion workers)")
+    print("cache hits:      " + ", ".join(f"{name} {cache_stats[name]['hits']}"
+                                          for name in ("metadata", "documents", "conversions", "merged")))
+    if sim is not None:
+        print(f"upstream:        {json.dumps(dict(sim.stats))}")
+
+
+if __name__ == '__main__':
+    main()
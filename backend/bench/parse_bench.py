@@ -0,0 +1,87 @@
+"""
+Compares the regex extractors in html_extract with the BeautifulSoup
+reference implementations on the PESU fixture corpus.
+
+For every fixture it checks that both paths return the same result, then
+reports the mean time per call and the peak allocations of a single call.
+
+    python bench/parse_bench.py [--iterations N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import html_extract  # noqa: E402
+
+FIXTURES_DIR = os.path.join(BACKEND_DIR, 'fixtures', 'pesu')
+
+
+def clean_options(options):
+    # Same ID cleanup PESUClient applies before using option values
+    cleaned = [(str(v).strip().replace('\\', '').strip('"').strip("'"), name) for v, name in options if v]
+    return [(v, name) for v, name in cleaned if v]
+
+
+CASES = [
+    ("login.html", "csrf", html_extract.extract_csrf_token, html_extract.csrf_token_bs4, None),
+    ("subjects.html", "options", html_extract.extract_options, html_extract.options_bs4, clean_options),
+    ("units.html", "options", html_extract.extract_options, html_extract.options_bs4, clean_options),
+    ("classes.html", "options", html_extract.extract_options, html_extract.options_bs4, clean_options),
+    ("classes_json.txt", "options", html_extract.extract_options, html_extract.options_bs4, clean_options),
+    ("slides_iframe.html", "links", html_extract.extract_download_urls, html_extract.download_urls_bs4, None),
+    ("slides_coursedoc.html", "links", html_extract.extract_download_urls, html_extract.download_urls_bs4, None),
+]
+
+
+def time_per_call(fn, content, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(content)
+    return (time.perf_counter() - started) / iterations
+
+
+def peak_allocations(fn, content):
+    tracemalloc.start()
+    try:
+        fn(content)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<24}{'kind':<9}{'regex us':>10}{'bs4 us':>10}{'speedup':>9}{'regex KiB':>11}{'bs4 KiB':>10}")
+    mismatches = 0
+    for name, kind, fast, reference, normalize in CASES:
+        with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+            content = f.read()
+
+        fast_result, reference_result = fast(content), reference(content)
+        if normalize:
+            fast_result, reference_result = normalize(fast_result), normalize(reference_result)
+        if fast_result != reference_result:
+            mismatches += 1
+            print(f"MISMATCH in {name}:\n  regex: {fast_result!r}\n  bs4:   {reference_result!r}")
+
+        fast_time = time_per_call(fast, content, args.iterations)
+        reference_time = time_per_call(reference, content, max(1, args.iterations // 10))
+        print(f"{name:<24}{kind:<9}{fast_time * 1e6:>10.1f}{reference_time * 1e6:>10.1f}"
+              f"{reference_time / fast_time:>8.1f}x"
+              f"{peak_allocations(fast, content) / 1024:>11.1f}{peak_allocations(reference, content) / 1024:>10.1f}")
+
+    if mismatches:
+        print(f"{mismatches} fixture(s) parsed differently")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,501 @@
+"""
+Local stand-in for PESU Academy, for benchmarks and load tests without a
+live account.
+
+Serves the login flow (CSRF page, j_spring_security_check, profile check),
+getSubjectsCode, getCourse, getCourseClasses, studentProfilePESUAdmin and
+the downloadslidecoursedoc links. Every course, unit and class id is
+accepted and expands deterministically; a class either returns its file
+directly or an HTML fragment linking one or two documents. Documents are
+generated PDF, PPTX and DOCX files, unique per document so caches behave
+as they would upstream, with ETag, Last-Modified and Range support.
+
+Latency, bandwidth and failures (503s and connections cut mid-body) can
+be injected. Counters are served as JSON at /__sim/stats.
+
+    python bench/pesu_sim.py [--port 8765] [--latency MS] [--bandwidth KBPS] [--error-rate F] ...
+
+then run the backend with PESU_BASE_URL=http://127.0.0.1:8765/Academy.
+"""
+import argparse
+import collections
+import email.utils
+import hashlib
+import html
+import http.server
+import io
+import json
+import os
+import random
+import re
+import socketserver
+import struct
+import sys
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(BACKEND_DIR, 'fixtures', 'pesu')
+
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+LAST_MODIFIED = email.utils.formatdate(1700000000, usegmt=True)
+WRITE_CHUNK = 16 * 1024
+
+
+def _noise_png(width, height, seed):
+    """An RGB PNG of random pixels; it does not compress, so its size is about width*height*3."""
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b""))
+
+
+def make_pdf(doc_id, pages, image_bytes):
+    """A PDF with a line of text and a random-pixel image of about image_bytes on every page."""
+    rng = random.Random(doc_id)
+    side = max(1, int((image_bytes / 3) ** 0.5))
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    next_id = 4
+    for page in range(pages):
+        page_id, content_id, image_id = next_id, next_id + 1, next_id + 2
+        next_id += 3
+        kids.append(f"{page_id} 0 R")
+        pixels = rng.randbytes(side * side * 3)
+        objects[image_id] = (f"<< /Type /XObject /Subtype /Image /Width {side} /Height {side} "
+                             f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Length {len(pixels)} >>\nstream\n"
+                             ).encode() + pixels + b"\nendstream"
+        text = f"BT /F1 24 Tf 72 720 Td ({doc_id} page {page + 1}) Tj ET q 300 0 0 300 72 300 cm /Im0 Do Q".encode()
+        objects[content_id] = f"<< /Length {len(text)} >>\nstream\n".encode() + text + b"\nendstream"
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content_id} 0 R "
+                            f"/Resources << /Font << /F1 3 0 R >> /XObject << /Im0 {image_id} 0 R >> >> >>").encode()
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = out.tell()
+        out.write(f"{object_id} 0 obj\n".encode() + objects[object_id] + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {next_id}\n0000000000 65535 f \n".encode())
+    for object_id in range(1, next_id):
+        out.write(f"{offsets[object_id]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_pptx(doc_id, slides, image_bytes):
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    side = max(1, int((image_bytes / 3) ** 0.5))
+    presentation = Presentation()
+    layout = presentation.slide_layouts[5]
+    for n in range(slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"{doc_id} slide {n + 1}"
+        picture = io.BytesIO(_noise_png(side, side, f"{doc_id}:{n}"))
+        slide.shapes.add_picture(picture, Inches(2), Inches(2), width=Inches(4))
+    out = io.BytesIO()
+    presentation.save(out)
+    return out.getvalue()
+
+
+def make_docx(doc_id, pages, paragraph_bytes):
+    """A minimal WordprocessingML package with a heading and filler paragraphs per page."""
+    rng = random.Random(doc_id)
+    words = ["lecture", "notes", "sorting", "graph", "memory", "process", "network", "matrix", "proof", "example"]
+    body = []
+    for page in range(pages):
+        body.append(f'<w:p><w:r><w:t>{html.escape(doc_id)} page {page + 1}</w:t></w:r></w:p>')
+        text = " ".join(rng.choice(words) for _ in range(max(1, paragraph_bytes // 7)))
+        body.append(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>')
+        if page < pages - 1:
+            body.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+    parts = {
+        "[Content_Types].xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>'),
+        "_rels/.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+            'officeDocument" Target="word/document.xml"/></Relationships>'),
+        "word/document.xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            + "".join(body) + '</w:body></w:document>'),
+    }
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, data in parts.items():
+            z.writestr(name, data)
+    return out.getvalue()
+
+
+class Simulator:
+    """
+    The simulated upstream. latency and jitter are seconds before the
+    response headers, bandwidth is bytes per second per response (0 for
+    unlimited), error_rate the share of requests answered 503 and
+    reset_rate the share of document bodies cut off halfway.
+    """
+
+    def __init__(self, units=4, classes=8, kinds=("pdf", "pptx", "docx"), pages=10, doc_kb=512,
+                 latency=0.05, jitter=0.02, bandwidth=0, error_rate=0.0, reset_rate=0.0,
+                 password="password", seed=0, cache_docs=256):
+        self.units = units
+        self.classes = classes
+        self.kinds = tuple(kinds)
+        self.pages = pages
+        self.doc_bytes = doc_kb * 1024
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.password = password
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._sessions = set()
+        self._docs = collections.OrderedDict()
+        self._docs_lock = threading.Lock()
+        self.cache_docs = cache_docs
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+        self.server = None
+        with open(os.path.join(FIXTURES_DIR, 'login.html')) as f:
+            self._login_page = f.read()
+
+    # Upstream data model
+
+    def unit_ids(self, course_id):
+        return [f"{course_id}{n:02d}" for n in range(1, self.units + 1)]
+
+    def class_ids(self, unit_id):
+        return [f"{unit_id}{n:02d}" for n in range(1, self.classes + 1)]
+
+    def resource(self, class_id, resource_type):
+        """[(doc_id, kind)] for a class resource, and whether it is served directly."""
+        n = int(hashlib.sha1(f"{class_id}:{resource_type}".encode()).hexdigest()[:8], 16)
+        kind = self.kinds[n % len(self.kinds)]
+        direct = n % 2 == 0
+        count = 1 if direct else 1 + (n >> 4) % 2
+        return [(f"{class_id}-{resource_type}-{i}", kind) for i in range(count)], direct
+
+    def kind_of(self, doc_id):
+        class_id, _, rest = doc_id.partition('-')
+        resource_type, _, _ = rest.partition('-')
+        for known_id, kind in self.resource(class_id, resource_type)[0]:
+            if known_id == doc_id:
+                return kind
+        return None
+
+    def document(self, doc_id, kind):
+        with self._docs_lock:
+            data = self._docs.get(doc_id)
+            if data is not None:
+                self._docs.move_to_end(doc_id)
+                return data
+        per_page = self.doc_bytes // max(1, self.pages)
+        if kind == "pdf":
+            data = make_pdf(doc_id, self.pages, per_page)
+        elif kind == "pptx":
+            data = make_pptx(doc_id, self.pages, per_page)
+        else:
+            data = make_docx(doc_id, self.pages, per_page)
+        with self._docs_lock:
+            self._docs[doc_id] = data
+            while len(self._docs) > self.cache_docs:
+                self._docs.popitem(last=False)
+        return data
+
+    # Runtime
+
+    def chance(self, rate):
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+    def delay(self):
+        with self._rng_lock:
+            jitter = self._rng.uniform(0, self.jitter) if self.jitter else 0
+        if self.latency or jitter:
+            time.sleep(self.latency + jitter)
+
+    def count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def new_session(self):
+        token = uuid.uuid4().hex.upper()
+        self._sessions.add(token)
+        return token
+
+    def valid_session(self, token):
+        return token in self._sessions
+
+    def login_page(self):
+        # A fresh CSRF token per visit, like the real page
+        return re.sub(r'name="_csrf" value="[^"]*"', f'name="_csrf" value="{uuid.uuid4()}"', self._login_page)
+
+    def start(self, host="127.0.0.1", port=0):
+        self.server = Server((host, port), Handler)
+        self.server.sim = self
+        threading.Thread(target=self.server.serve_forever, name="pesu-sim", daemon=True).start()
+        return f"http://{host}:{self.server.server_port}/Academy"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def sim(self):
+        return self.server.sim
+
+    def _session(self):
+        for part in self.headers.get('Cookie', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == 'JSESSIONID' and self.sim.valid_session(value):
+                return value
+        return None
+
+    def _send(self, status, body=b"", content_type="text/html;charset=UTF-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _redirect(self, location, headers=None):
+        self._send(302, headers={'Location': location, **(headers or {})})
+
+    def _options(self, placeholder, items):
+        rows = [f'<option value="">{placeholder}</option>']
+        rows += [f'<option value="{value}">{html.escape(title)}</option>' for value, title in items]
+        return "\n".join(rows)
+
+    def do_GET(self):
+        sim = self.sim
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        if path == '/__sim/stats':
+            self._send(200, json.dumps(dict(sim.stats)), 'application/json')
+            return
+
+        sim.count('requests')
+        sim.delay()
+        if sim.chance(sim.error_rate):
+            sim.count('injected_errors')
+            self._send(503, "Service Unavailable", headers={'Retry-After': '1'})
+            return
+
+        if path in ('/Academy', '/Academy/login'):
+            sim.count('login_page')
+            self._send(200, sim.login_page())
+            return
+
+        if self._session() is None:
+            sim.count('unauthenticated')
+            self._redirect('/Academy/login')
+            return
+
+        match = re.fullmatch(r'/Academy/a/i/getCourse/([^/]+)', path)
+        if match:
+            sim.count('getCourse')
+            course_id = match.group(1)
+            units = [(u, f"Unit {i + 1}: Topics of {course_id}") for i, u in enumerate(sim.unit_ids(course_id))]
+            self._send(200, self._options("Select Unit", units))
+            return
+
+        match = re.fullmatch(r'/Academy/a/i/getCourseClasses/([^/]+)', path)
+        if match:
+            sim.count('getCourseClasses')
+            classes = [(c, f"{i + 1}. Lecture {i + 1}") for i, c in enumerate(sim.class_ids(match.group(1)))]
+            # Served JSON-encoded, as upstream does
+            self._send(200, json.dumps(self._options("Select Class", classes)), 'application/json')
+            return
+
+        if path == '/Academy/a/g/getSubjectsCode':
+            sim.count('getSubjectsCode')
+            subjects = [(str(20000 + n), f"UE23CS{200 + n} - Subject {n}") for n in range(20)]
+            self._send(200, self._options("Select Subject", subjects))
+            return
+
+        if path == '/Academy/s/studentProfilePESU':
+            sim.count('profile')
+            self._send(200, "<html><body>Profile</body></html>")
+            return
+
+        if path == '/Academy/s/studentProfilePESUAdmin':
+            sim.count('studentProfilePESUAdmin')
+            query = parse_qs(url.query)
+            class_id = query.get('unitid', [''])[0]
+            resource_type = query.get('id', ['2'])[0]
+            docs, direct = sim.resource(class_id, resource_type)
+            if direct:
+                self._document(*docs[0])
+            else:
+                links = "\n".join(
+                    f'<tr><td>{i + 1}</td><td>Slide deck {i + 1}</td><td><a href="javascript:void(0);" '
+                    f'class="link-preview" onclick="loadIframe(\'/Academy/a/referenceMeterials/'
+                    f'downloadslidecoursedoc/{doc_id}#view=FitH\', {i + 1}, \'{kind}\')">Download</a></td></tr>'
+                    for i, (doc_id, kind) in enumerate(docs))
+                self._send(200, f'<table class="table table-hover"><tbody>\n{links}\n</tbody></table>')
+            return
+
+        match = re.fullmatch(r'/Academy/a/referenceMeterials/downloadslidecoursedoc/([^/]+)', path)
+        kind = sim.kind_of(match.group(1)) if match else None
+        if kind is not None:
+            sim.count('downloadslidecoursedoc')
+            self._document(match.group(1), kind)
+            return
+
+        sim.count('not_found')
+        self._send(404, "Not found")
+
+    def do_POST(self):
+        sim = self.sim
+        path = urlsplit(self.path).path
+        length = int(self.headers.get('Content-Length') or 0)
+        form = parse_qs(self.rfile.read(length).decode())
+        sim.count('requests')
+        sim.delay()
+        if path != '/Academy/j_spring_security_check':
+            self._send(404, "Not found")
+            return
+        sim.count('logins')
+        if not form.get('j_username') or form.get('j_password', [''])[0] != sim.password:
+            sim.count('failed_logins')
+            self._redirect('/Academy/login?login_error=1')
+            return
+        token = sim.new_session()
+        self._redirect('/Academy/s/studentProfilePESU', {'Set-Cookie': f'JSESSIONID={token}; Path=/Academy; HttpOnly'})
+
+    def _document(self, doc_id, kind):
+        sim = self.sim
+        data = sim.document(doc_id, kind)
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': LAST_MODIFIED,
+            'Accept-Ranges': 'bytes',
+            'Content-Disposition': f'attachment; filename="{doc_id}.{kind}"',
+        }
+        if etag in self.headers.get('If-None-Match', ''):
+            sim.count('not_modified')
+            self._send(304, headers=headers)
+            return
+
+        status, start, end = 200, 0, len(data)
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match and self.headers.get('If-Range', etag) in (etag, LAST_MODIFIED):
+            start = int(match.group(1))
+            if start >= len(data):
+                self._send(416, headers={'Content-Range': f'bytes */{len(data)}'})
+                return
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{len(data) - 1}/{len(data)}'
+            sim.count('ranges')
+
+        body = memoryview(data)[start:end]
+        self.send_response(status)
+        self.send_header('Content-Type', CONTENT_TYPES[kind])
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        cut = len(body) // 2 if sim.chance(sim.reset_rate) else None
+        sent = 0
+        started = time.monotonic()
+        while sent < len(body):
+            if cut is not None and sent >= cut:
+                sim.count('injected_resets')
+                self.close_connection = True
+                return
+            chunk = body[sent:sent + WRITE_CHUNK]
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            sim.count('bytes_sent', len(chunk))
+            if sim.bandwidth:
+                ahead = sent / sim.bandwidth - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+def add_arguments(parser):
+    parser.add_argument('--units', type=int, default=4, help="units per course")
+    parser.add_argument('--classes', type=int, default=8, help="classes per unit")
+    parser.add_argument('--kinds', default="pdf,pptx,docx", help="document types to serve")
+    parser.add_argument('--pages', type=int, default=10, help="pages or slides per document")
+    parser.add_argument('--doc-kb', type=int, default=512, help="approximate size of a document")
+    parser.add_argument('--latency', type=float, default=50, help="ms before each response")
+    parser.add_argument('--jitter', type=float, default=20, help="extra random ms before each response")
+    parser.add_argument('--bandwidth', type=float, default=0, help="KB/s per response, 0 for unlimited")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument('--reset-rate', type=float, default=0.0, help="share of documents cut off halfway")
+
+
+def from_arguments(args):
+    return Simulator(units=args.units, classes=args.classes, kinds=args.kinds.split(','), pages=args.pages,
+                     doc_kb=args.doc_kb, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                     bandwidth=args.bandwidth * 1024, error_rate=args.error_rate, reset_rate=args.reset_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    sim = from_arguments(args)
+    base_url = sim.start(args.host, args.port)
+    print(f"PESU Academy simulator at {base_url} (password: {sim.password})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sim.stop()
+        print(json.dumps(dict(sim.stats), indent=2))
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
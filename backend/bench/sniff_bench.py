@@ -0,0 +1,125 @@
+"""
+Compares file-type detection and PPTX repair on large decks with the
+previous implementations: ZipFile-based detection, and a repair that read
+the whole deck into memory and wrote a sliced copy.
+
+Builds a deck of about --size-mb MB (the bundled warm-up sample plus
+stored media) and a copy with junk in front of it, then runs every case in
+a fresh process and reports its time and peak RSS above the interpreter's
+baseline.
+
+    python bench/sniff_bench.py [--size-mb N] [--members N]
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SAMPLE = os.path.join(BACKEND_DIR, 'fixtures', 'warmup', 'sample.pptx')
+JUNK = b"<html><body>Session expired</body></html>\n" * 20
+
+
+# --- previous implementations, for reference ---
+
+def detect_zipfile(path):
+    with open(path, 'rb') as f:
+        header = f.read(4)
+    if header.startswith(b'%PDF'):
+        return 'pdf'
+    if not header.startswith(b'PK'):
+        return None
+    with zipfile.ZipFile(path, 'r') as z:
+        filenames = z.namelist()
+    if any(f.startswith('ppt/') for f in filenames):
+        return 'pptx'
+    if any(f.startswith('word/') for f in filenames):
+        return 'docx'
+    return 'zip'
+
+
+def repair_read_slice(path):
+    with open(path, 'rb') as f:
+        content = f.read()
+    pk_offset = content.find(b'PK\x03\x04')
+    if pk_offset > 0:
+        content = content[pk_offset:]
+        with open(path + ".repair", 'wb') as f:
+            f.write(content)
+        os.replace(path + ".repair", path)
+    return zipfile.is_zipfile(path)
+
+
+def build_deck(path, size_mb, members):
+    shutil.copy(SAMPLE, path)
+    chunk = size_mb * 1024 * 1024 // members
+    with zipfile.ZipFile(path, 'a', compression=zipfile.ZIP_STORED) as z:
+        for i in range(members):
+            # Random bytes, like already-compressed images
+            z.writestr(f"ppt/media/bench{i}.png", os.urandom(chunk))
+
+
+def run_case(case, path):
+    """Runs one case in this process; prints seconds and peak RSS growth."""
+    from file_sniff import sniff
+    from pdf_utils import repair_pptx
+
+    functions = {
+        "detect:zipfile": detect_zipfile,
+        "detect:sniff": lambda p: sniff(p)[0],
+        "repair:read+slice": repair_read_slice,
+        "repair:mmap": repair_pptx,
+    }
+    fn = functions[case]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    result = fn(path)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    print(f"{elapsed} {peak} {result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--members', type=int, default=400, help="media files in the deck")
+    parser.add_argument('--case', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        run_case(*args.case)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="pesu_sniff_")
+    try:
+        clean = os.path.join(work_dir, 'deck.pptx')
+        build_deck(clean, args.size_mb, args.members)
+        junk = os.path.join(work_dir, 'junk.pptx')
+        with open(junk, 'wb') as out, open(clean, 'rb') as src:
+            out.write(JUNK)
+            shutil.copyfileobj(src, out)
+        with zipfile.ZipFile(clean) as z:
+            member_count = len(z.infolist())
+        print(f"deck {os.path.getsize(clean) / 1024 ** 2:.0f} MB, {member_count} members, "
+              f"junk prefix {len(JUNK)} bytes")
+        print(f"{'case':<20}{'input':<8}{'ms':>10}{'peak RSS MB':>14}  result")
+        for case in ("detect:zipfile", "detect:sniff", "repair:read+slice", "repair:mmap"):
+            for label, source in (("clean", clean), ("junk", junk)):
+                target = os.path.join(work_dir, 'target.pptx')
+                shutil.copy(source, target)
+                output = subprocess.run([sys.executable, __file__, '--case', case, target],
+                                        capture_output=True, text=True, check=True).stdout.split('\n')
+                elapsed, peak_kb, result = output[-2].split(' ', 2)
+                print(f"{case:<20}{label:<8}{float(elapsed) * 1000:>10.1f}{int(peak_kb) / 1024:>14.1f}  {result}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
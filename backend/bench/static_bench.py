@@ -0,0 +1,201 @@
+"""
+Compares serving the frontend through the static asset layer with the
+previous send_static_file setup, for a cold page load (empty browser
+cache) and a warm one (everything cached, as on a return visit).
+
+A page load fetches index.html and every file it references; the warm
+load revalidates what the cache headers require and skips the rest, the
+way a browser would. Reports requests, bytes on the wire (headers and
+bodies) and page loads per second through the Flask test client, so the
+numbers cover the Python side only; sendfile further cuts the cost of
+bodies under gunicorn.
+
+Without --dist a Vite-shaped build (hashed bundles under assets/ plus a
+file from public/) is made from the frontend sources.
+
+    python bench/static_bench.py [--dist frontend/dist] [--seconds 2]
+"""
+import argparse
+import base64
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+FRONTEND_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'frontend')
+sys.path.insert(0, BACKEND_DIR)
+
+ACCEPT_ENCODING = 'gzip, deflate, br'
+_REFERENCE = re.compile(r'(?:src|href)="(/[^"]+)"')
+
+
+def _hashed_name(stem, ext, data):
+    digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).decode()[:8]
+    return f"assets/{stem}-{digest}.{ext}"
+
+
+def make_dist(directory, bundle_bytes=200 * 1024):
+    """Writes a build shaped like `vite build` output, with bundles made of the frontend sources."""
+    sources = {'.jsx': b'', '.css': b''}
+    for dirpath, _, filenames in os.walk(os.path.join(FRONTEND_DIR, 'src')):
+        for name in sorted(filenames):
+            ext = os.path.splitext(name)[1]
+            if ext in sources:
+                with open(os.path.join(dirpath, name), 'rb') as f:
+                    sources[ext] += f.read()
+    # React and the other dependencies make up most of a real bundle; repeat the app code to a similar size
+    js = (sources['.jsx'] * (bundle_bytes // len(sources['.jsx']) + 1))[:bundle_bytes]
+    css = sources['.css']
+    js_name = _hashed_name('index', 'js', js)
+    css_name = _hashed_name('index', 'css', css)
+    index = (f'<!doctype html>\n<html lang="en">\n<head>\n<meta charset="UTF-8" />\n'
+             f'<link rel="icon" type="image/svg+xml" href="/vite.svg" />\n<title>PESU Scrape</title>\n'
+             f'<script type="module" crossorigin src="/{js_name}"></script>\n'
+             f'<link rel="stylesheet" crossorigin href="/{css_name}">\n</head>\n'
+             f'<body>\n<div id="root"></div>\n</body>\n</html>\n').encode()
+    os.makedirs(os.path.join(directory, 'assets'))
+    shutil.copy(os.path.join(FRONTEND_DIR, 'public', 'vite.svg'), directory)
+    for name, data in ((js_name, js), (css_name, css), ('index.html', index)):
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(data)
+
+
+def legacy_app(dist):
+    """The static setup app.py had before the asset layer."""
+    from flask import Flask, jsonify, request
+
+    app = Flask('legacy', static_folder=dist, static_url_path='/')
+
+    @app.route('/')
+    def serve():
+        return app.send_static_file('index.html')
+
+    @app.errorhandler(404)
+    def not_found(e):
+        if request.path.startswith('/api/'):
+            return jsonify({"error": "Not found"}), 404
+        return app.send_static_file('index.html')
+
+    return app
+
+
+def current_app(dist):
+    os.environ.setdefault('PESU_PRELOAD', '0')
+    os.environ.setdefault('PESU_WARMER_ENABLED', '0')
+    import app as app_module
+    from static_assets import StaticAssets
+    app_module.static_assets = StaticAssets(dist)
+    return app_module.app
+
+
+def _wire_bytes(response):
+    headers = sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+    return headers + len(response.get_data())
+
+
+class Browser:
+    """Fetches pages like a browser with an HTTP cache: fresh entries are reused, stale ones revalidated."""
+
+    def __init__(self, client):
+        self.client = client
+        self.cache = {}
+        self.requests = 0
+        self.bytes = 0
+
+    def get(self, url):
+        entry = self.cache.get(url)
+        if entry is not None and 'immutable' in entry['cache_control']:
+            return entry['body']
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        response = self.client.get(url, headers=headers)
+        self.requests += 1
+        self.bytes += _wire_bytes(response)
+        if response.status_code == 304:
+            return entry['body']
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        body = response.get_data()
+        self.cache[url] = {'etag': response.headers.get('ETag'),
+                           'cache_control': response.headers.get('Cache-Control', ''),
+                           'body': body, 'encoding': response.headers.get('Content-Encoding')}
+        return body
+
+    def load_page(self, url='/'):
+        self.get(url)
+        # Compressed bodies are decoded only to find references, as the browser would
+        index = _decode(self.cache[url])
+        for reference in _REFERENCE.findall(index):
+            self.get(reference)
+
+
+def _decode(entry):
+    import gzip
+    body = entry['body']
+    if entry['encoding'] == 'gzip':
+        body = gzip.decompress(body)
+    elif entry['encoding'] == 'br':
+        import brotli
+        body = brotli.decompress(body)
+    return body.decode()
+
+
+def measure(app, warm, seconds):
+    client = app.test_client()
+    primed = Browser(client)
+    primed.load_page()
+    # One page load for the byte and request counts
+    browser = Browser(client)
+    if warm:
+        browser.cache = dict(primed.cache)
+    browser.load_page()
+    requests, transferred = browser.requests, browser.bytes
+
+    loads = 0
+    started = time.monotonic()
+    while time.monotonic() - started < seconds:
+        browser = Browser(client)
+        if warm:
+            browser.cache = dict(primed.cache)
+        browser.load_page()
+        loads += 1
+    elapsed = time.monotonic() - started
+    return requests, transferred, loads / elapsed, loads * requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dist', help="frontend build to serve (default: a generated one)")
+    parser.add_argument('--seconds', type=float, default=2.0, help="time per measurement")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="pesu_static_bench_")
+    os.environ['TMPDIR'] = work_dir
+    tempfile.tempdir = None
+    try:
+        dist = os.path.join(work_dir, 'dist')
+        if args.dist:
+            shutil.copytree(args.dist, dist)
+        else:
+            make_dist(dist)
+        from static_assets import precompress
+        precompress(dist)
+
+        apps = (("send_static_file", legacy_app(dist)), ("static assets", current_app(dist)))
+        print(f"{'server':<18}{'load':<6}{'requests':>9}{'bytes':>10}{'pages/s':>10}{'requests/s':>12}")
+        for name, app in apps:
+            for load, warm in (("cold", False), ("warm", True)):
+                requests, transferred, pages, rps = measure(app, warm, args.seconds)
+                print(f"{name:<18}{load:<6}{requests:>9}{transferred:>10}{pages:>10.0f}{rps:>12.0f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+DEFAULT_ROOT = os.environ.get('PESU_BLOB_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'pesu_blob_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('PESU_BLOB_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# Within this window a cached document is served without asking upstream at all
+DEFAULT_FRESH_TTL = int(os.environ.get('PESU_BLOB_CACHE_FRESH_TTL', 10 * 60))
+# Blobs touched this recently are never evicted, so in-progress requests can still link them
+EVICTION_GRACE = 60
+# Interrupted downloads older than this are no longer worth resuming
+PART_TTL = 24 * 60 * 60
+
+
+class IntegrityError(Exception):
+    pass
+
+
+class BlobWriter:
+    """Streams a download into a temp file in the cache while hashing it."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.tmp_dir)
+        self._file = os.fdopen(fd, 'wb')
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.done = False
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def restart(self):
+        self._file.seek(0)
+        self._file.truncate()
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def commit(self, expected_size=None, expected_sha256=None):
+        """Moves the file into the cache; raises IntegrityError if it is not what upstream announced."""
+        self._file.close()
+        self.done = True
+        sha256 = self._hash.hexdigest()
+        problem = None
+        if expected_size is not None and self.size != expected_size:
+            problem = f"expected {expected_size} bytes, got {self.size}"
+        elif expected_sha256 is not None and sha256 != expected_sha256:
+            problem = "sha256 does not match the digest sent by upstream"
+        if problem:
+            self._discard()
+            raise IntegrityError(problem)
+        return self.cache._commit(self.tmp_path, sha256, self.size)
+
+    def abort(self):
+        self._file.close()
+        if not self.done:
+            self._discard()
+
+    def _discard(self):
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class PartialDownload(BlobWriter):
+    """
+    A resumable BlobWriter: bytes go to tmp/<part_id>.part, next to a
+    sidecar recording the validator (strong ETag or Last-Modified) the
+    download started under. If the transfer breaks, the part is kept and
+    a later attempt continues it with Range/If-Range; the hash is rebuilt
+    from the bytes already on disk.
+
+    The part file is locked while in use. If another download holds it,
+    this falls back to a plain temp file that is not resumable.
+    """
+
+    def __init__(self, cache, part_id):
+        self.cache = cache
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.done = False
+        self.validator = None
+        self.resumable = False
+        path = os.path.join(cache.tmp_dir, part_id + '.part')
+        self._meta_path = path + '.json'
+        f = open(path, 'ab')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            fd, self.tmp_path = tempfile.mkstemp(dir=cache.tmp_dir)
+            self._file = os.fdopen(fd, 'wb')
+            return
+        self.tmp_path = path
+        self._file = f
+        self.resumable = True
+        try:
+            with open(self._meta_path) as meta:
+                self.validator = json.load(meta).get('validator')
+        except (OSError, ValueError):
+            self.validator = None
+        if not self.validator:
+            self.restart()
+            return
+        with open(path, 'rb') as existing:
+            for chunk in iter(lambda: existing.read(1024 * 1024), b''):
+                self._hash.update(chunk)
+                self.size += len(chunk)
+
+    def range_headers(self):
+        if not self.resumable or not self.size or not self.validator:
+            return {}
+        # If the document changed since, If-Range makes upstream send all of it again
+        return {'Range': f'bytes={self.size}-', 'If-Range': self.validator, 'Accept-Encoding': 'identity'}
+
+    def begin(self, validator):
+        """Records what the bytes being written belong to, so they can be resumed later."""
+        if not self.resumable:
+            return
+        self.validator = validator
+        with open(self._meta_path, 'w') as meta:
+            json.dump({"validator": validator}, meta)
+
+    def restart(self):
+        super().restart()
+        self.validator = None
+        self._remove_meta()
+
+    def commit(self, expected_size=None, expected_sha256=None):
+        try:
+            return super().commit(expected_size, expected_sha256)
+        finally:
+            self._remove_meta()
+
+    def abort(self):
+        """Keeps the part for a later resume when that is possible, otherwise discards it."""
+        self._file.close()
+        if self.done:
+            return
+        if not (self.resumable and self.validator and self.size):
+            self._discard()
+            self._remove_meta()
+
+    def _remove_meta(self):
+        try:
+            os.remove(self._meta_path)
+        except OSError:
+            pass
+
+
+class BlobCache:
+    """
+    Persistent, content-addressed store for downloaded course documents.
+
+    Blobs live under blobs/<sha[:2]>/<sha> so identical files shared by
+    several classes are stored once. An SQLite index maps a document key
+    (course_id:class_id:resource_type) to the list of blobs it produced along
+    with the upstream validators (ETag, Last-Modified) used to revalidate
+    them. Total size is capped with LRU eviction.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=DEFAULT_MAX_BYTES, fresh_ttl=DEFAULT_FRESH_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.fresh_ttl = fresh_ttl
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._local = threading.local()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, docs TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS blobs_accessed ON blobs (accessed_at)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, 'index.sqlite3'), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(course_id, class_id, resource_type):
+        return f"{course_id}:{class_id}:{resource_type}"
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def writer(self):
+        return BlobWriter(self)
+
+    def partial(self, part_id):
+        return PartialDownload(self, part_id)
+
+    def _commit(self, tmp_path, sha256, size):
+        path = self.blob_path(sha256)
+        if os.path.exists(path):
+            # Same content already stored, drop the duplicate
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO blobs (sha256, size, accessed_at) VALUES (?, ?, ?)",
+            (sha256, size, time.time())
+        )
+        conn.commit()
+        return sha256
+
+    def lookup(self, key):
+        """Returns (docs, stored_at) if every blob of the entry is still on disk."""
+        row = self._conn().execute("SELECT docs, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        docs = json.loads(row[0])
+        if not all(os.path.exists(self.blob_path(d['sha256'])) for d in docs):
+            self.delete(key)
+            return None
+        return docs, row[1]
+
+    def is_fresh(self, stored_at):
+        return time.time() - stored_at < self.fresh_ttl
+
+    def store(self, key, docs):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, docs, stored_at) VALUES (?, ?, ?)",
+            (key, json.dumps(docs), time.time())
+        )
+        conn.commit()
+
+    def touch(self, docs):
+        conn = self._conn()
+        now = time.time()
+        conn.executemany(
+            "UPDATE blobs SET accessed_at = ? WHERE sha256 = ?",
+            [(now, d['sha256']) for d in docs]
+        )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        conn.commit()
+
+    def total_bytes(self):
+        return self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _collect_parts(self):
+        cutoff = time.time() - PART_TTL
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        self._collect_parts()
+        conn = self._conn()
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        cutoff = time.time() - EVICTION_GRACE
+        victims = []
+        for sha256, size in conn.execute(
+            "SELECT sha256, size FROM blobs WHERE accessed_at < ? ORDER BY accessed_at ASC", (cutoff,)
+        ):
+            if total <= self.max_bytes:
+                break
+            victims.append(sha256)
+            total -= size
+
+        for sha256 in victims:
+            try:
+                os.remove(self.blob_path(sha256))
+            except OSError:
+                pass
+            conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            self.evictions += 1
+        conn.commit()
+        # Entries pointing at evicted blobs are dropped lazily by lookup()
+
+    def stats(self):
+        return {
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+def validators(headers):
+    return {
+        "etag": headers.get('ETag'),
+        "last_modified": headers.get('Last-Modified'),
+        "content_length": headers.get('Content-Length')
+    }
+
+
+def resume_validator(headers):
+    """The validator a partial download can be resumed under: a strong ETag, else Last-Modified."""
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def announced_sha256(headers):
+    """sha256 hex digest from a Repr-Digest or Digest header, if upstream sent one."""
+    for header in ('Repr-Digest', 'Digest'):
+        for item in headers.get(header, '').split(','):
+            algorithm, _, value = item.strip().partition('=')
+            if algorithm.lower() == 'sha-256' and value:
+                try:
+                    return base64.b64decode(value.strip(':')).hex()
+                except ValueError:
+                    return None
+    return None
+
+
+def conditional_headers(doc):
+    headers = {}
+    if doc.get('etag'):
+        headers['If-None-Match'] = doc['etag']
+    if doc.get('last_modified'):
+        headers['If-Modified-Since'] = doc['last_modified']
+    return headers
+
+
+def unchanged(status, headers, doc):
+    """True if an upstream response shows the cached doc is still current."""
+    if status == 304:
+        return True
+    etag = headers.get('ETag')
+    last_modified = headers.get('Last-Modified')
+    if etag and doc.get('etag'):
+        return etag == doc['etag']
+    if last_modified and doc.get('last_modified'):
+        return last_modified == doc['last_modified']
+    # Without validators a same-size re-upload looks identical; the body is downloaded
+    # again and, if it is the same, deduplicated by its hash
+    return False
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_blob_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BlobCache()
+        return _cache
@@ -0,0 +1,249 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+
+from catalog import MAX_LIMIT
+from upstream_limiter import BACKGROUND
+
+ENABLED = os.environ.get('PESU_WARMER_ENABLED', '0') == '1'
+USERNAME = os.environ.get('PESU_WARMER_USERNAME', '')
+PASSWORD = os.environ.get('PESU_WARMER_PASSWORD', '')
+# Comma-separated course IDs or subject code prefixes from courses.json; empty warms only requested courses
+COURSES = [c.strip() for c in os.environ.get('PESU_WARMER_COURSES', '').split(',') if c.strip()]
+# Local hours, start-end; may wrap past midnight (e.g. 22-6)
+HOURS = os.environ.get('PESU_WARMER_HOURS', '1-6')
+RATE = float(os.environ.get('PESU_WARMER_RATE', 0.5))
+INTERVAL = int(os.environ.get('PESU_WARMER_INTERVAL', 24 * 60 * 60))
+MAX_COURSES = int(os.environ.get('PESU_WARMER_MAX_COURSES', 50))
+RESOURCE_TYPES = [t.strip() for t in os.environ.get('PESU_WARMER_RESOURCE_TYPES', '2').split(',') if t.strip()]
+
+IDLE_SLEEP = 5 * 60
+LOGIN_RETRY = 30 * 60
+LOCK_PATH = os.path.join(tempfile.gettempdir(), 'pesu_warmer.lock')
+
+
+def in_window(hours, now=None):
+    start, _, end = hours.partition('-')
+    start, end = int(start), int(end)
+    hour = time.localtime(now).tm_hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+class Budget:
+    """
+    Token bucket for the warmer's own share of upstream requests; take()
+    blocks until it fits. A charge larger than the bucket waits for a full
+    bucket and leaves it in debt, so big units still average out to rate.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        # At most a minute's worth accumulates while idle
+        self.capacity = rate * 60
+        self._tokens = 0.0
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, cost=1):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens >= min(cost, self.capacity):
+                    self._tokens -= cost
+                    return
+                wait = (min(cost, self.capacity) - self._tokens) / self.rate
+            time.sleep(min(60, wait))
+
+
+class CacheWarmer:
+    """
+    Opt-in off-peak crawler that fills the caches before students ask.
+
+    Logged in as a service account, it walks courses (most requested
+    first, then the configured ones) through the same paths users hit:
+    unit and class lists through the metadata cache, and each unit through
+    the merged-PDF pipeline, which fills the document, conversion and
+    merged caches. Its upstream requests are queued at background priority
+    in the upstream limiter and additionally capped by its own budget.
+    Only one process per host runs it.
+    """
+
+    def __init__(self, metadata_cache, catalog, access_log, username=USERNAME, password=PASSWORD,
+                 courses=COURSES, hours=HOURS, rate=RATE, interval=INTERVAL, max_courses=MAX_COURSES,
+                 resource_types=RESOURCE_TYPES):
+        self.metadata_cache = metadata_cache
+        self.catalog = catalog
+        self.access_log = access_log
+        self.username = username
+        self.password = password
+        self.courses = courses
+        self.hours = hours
+        self.interval = interval
+        self.max_courses = max_courses
+        self.resource_types = resource_types
+        self.budget = Budget(rate)
+        self._client = None
+        # course_id -> when it last produced nothing even with a fresh login
+        self._failed = {}
+        self._thread = None
+        self._lock_file = None
+        self.state = "idle"
+        self.courses_warmed = 0
+        self.units_warmed = 0
+        self.courses_failed = 0
+        self.errors = 0
+        self.last_pass = None
+
+    def start(self):
+        if not self.username or not self.password:
+            print("Cache warmer enabled but PESU_WARMER_USERNAME/PASSWORD are not set")
+            return False
+        lock_file = open(LOCK_PATH, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Another worker is already warming
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+        return True
+
+    def _login(self):
+        from pesu_client import PESUClient
+        client = PESUClient()
+        client.session.priority = BACKGROUND
+        client.download_priority = BACKGROUND
+        self.budget.take(3)
+        success, message = client.authenticate(self.username, self.password)
+        if not success:
+            client.close()
+            raise RuntimeError(f"Warmer login failed: {message}")
+        return client
+
+    def candidates(self):
+        """Course IDs in warming order: by recent request frequency, then the configured selection."""
+        ordered = [course_id for course_id, _ in self.access_log.top()]
+        self.catalog.reload_if_changed()
+        for entry in self.courses:
+            if self.catalog.get(entry) is not None:
+                ordered.append(entry)
+            else:
+                _, items = self.catalog.search(prefix=entry, limit=MAX_LIMIT)
+                ordered.extend(item['id'] for item in items)
+        seen = set()
+        return [c for c in ordered if not (c in seen or seen.add(c))]
+
+    def _run(self):
+        while True:
+            try:
+                if not in_window(self.hours):
+                    self.state = "waiting"
+                    time.sleep(IDLE_SLEEP)
+                    continue
+                self.state = "warming"
+                warmed = self.warm_pass()
+                self.last_pass = time.time()
+                if not warmed:
+                    self.state = "idle"
+                    time.sleep(IDLE_SLEEP)
+            except Exception as e:
+                self.errors += 1
+                self.state = "error"
+                print(f"Cache warmer error: {e}")
+                self._drop_client()
+                time.sleep(LOGIN_RETRY)
+
+    def _drop_client(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def warm_pass(self):
+        """Warms up to max_courses courses that are due; returns how many were warmed."""
+        due = []
+        now = time.time()
+        for course_id in self.candidates():
+            if now - self._failed.get(course_id, 0) < self.interval:
+                continue
+            warmed_at = self.access_log.warmed_at(course_id)
+            if warmed_at is None or now - warmed_at >= self.interval:
+                due.append(course_id)
+            if len(due) >= self.max_courses:
+                break
+        if not due:
+            return 0
+        fresh = False
+        if self._client is None:
+            self._client = self._login()
+            fresh = True
+        for course_id in due:
+            if not in_window(self.hours):
+                break
+            built = self.warm_course(course_id)
+            if not built and not fresh:
+                # An expired session gets empty unit and class lists rather than an error; log in again and retry
+                self._drop_client()
+                self._client = self._login()
+                fresh = True
+                built = self.warm_course(course_id)
+            if built:
+                fresh = False
+                self.access_log.mark_warmed(course_id)
+                self.courses_warmed += 1
+            else:
+                # Nothing to build even with a fresh session; not tried again until the next interval
+                print(f"Cache warmer built nothing for course {course_id}")
+                self._failed[course_id] = time.time()
+                self.courses_failed += 1
+        return len(due)
+
+    def warm_course(self, course_id):
+        """Builds every unit of the course; returns how many were built."""
+        from pipeline import PipelineError, build_merged_pdf
+        from workspace import get_workspaces
+
+        client = self._client
+        built = 0
+        self.budget.take()
+        units = self.metadata_cache.get_or_fetch(f"units:{course_id}", lambda: client.get_units(course_id))
+        for unit in units or []:
+            unit_id = unit.get("unitId")
+            self.budget.take()
+            classes = self.metadata_cache.get_or_fetch(f"classes:{unit_id}", lambda: client.get_classes(unit_id))
+            files = [{"classId": c.get("classId"), "name": c.get("title", "")} for c in classes or [] if c.get("classId")]
+            if not files:
+                continue
+            for resource_type in self.resource_types:
+                # Roughly one request per class, more if a class links several documents
+                self.budget.take(len(files))
+                with get_workspaces().create() as workspace:
+                    try:
+                        build_merged_pdf(client, course_id, files, resource_type, str(course_id), str(unit_id),
+                                         workspace.path, unit_id=unit_id)
+                        built += 1
+                    except PipelineError:
+                        pass
+        self.units_warmed += built
+        return built
+
+    def stats(self):
+        return {
+            "enabled": self._thread is not None,
+            "state": self.state,
+            "hours": self.hours,
+            "courses_warmed": self.courses_warmed,
+            "units_warmed": self.units_warmed,
+            "courses_failed": self.courses_failed,
+            "errors": self.errors,
+            "last_pass": self.last_pass
+        }
@@ -0,0 +1,171 @@
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def _tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class CourseCatalog:
+    """
+    In-memory index over courses.json.
+
+    The file is parsed once and re-read only when its mtime changes. Records
+    are kept as (id, subjectCode, subjectName) tuples with indexes by id,
+    subject code and name tokens. The full list is pre-serialized together
+    with an ETag so unfiltered requests never touch json; its gzip form is
+    built on first use to keep startup fast.
+    """
+
+    def __init__(self, path, load=True):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._records = []
+        self._by_id = {}
+        self._codes = []        # sorted (lower code, index)
+        self._tokens = {}       # token -> sorted list of record indexes
+        self._vocab = []        # sorted token keys, for prefix lookups
+        self.full_json = b"[]"
+        self._full_gzip = None
+        self.etag = None
+        if load:
+            self.reload_if_changed()
+
+    def available(self):
+        return self._mtime is not None
+
+    def reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            try:
+                self._load(mtime)
+            except Exception as e:
+                print(f"Error reading courses.json: {e}")
+                return False
+        return True
+
+    def _load(self, mtime):
+        with open(self.path, 'rb') as f:
+            raw = json.load(f)
+
+        records = []
+        for entry in raw:
+            course_id = str(entry.get("id", "")).strip()
+            if not course_id:
+                continue
+            records.append((course_id, entry.get("subjectCode", "") or "", entry.get("subjectName", "") or ""))
+
+        by_id = {}
+        codes = []
+        tokens = {}
+        for idx, (course_id, code, name) in enumerate(records):
+            by_id[course_id] = idx
+            codes.append((code.lower(), idx))
+            for token in set(_tokenize(name)) | set(_tokenize(code)):
+                tokens.setdefault(token, []).append(idx)
+        codes.sort()
+
+        full_json = json.dumps([self._as_dict(r) for r in records], separators=(',', ':')).encode('utf-8')
+
+        # Swap everything in at once so readers never see a half-built index
+        self._records = records
+        self._by_id = by_id
+        self._codes = codes
+        self._tokens = tokens
+        self._vocab = sorted(tokens)
+        self.full_json = full_json
+        self._full_gzip = None
+        self.etag = hashlib.sha1(full_json).hexdigest()
+        self._mtime = mtime
+        print(f"Loaded {len(records)} courses from {self.path}")
+
+    @property
+    def full_gzip(self):
+        full_json, compressed = self.full_json, self._full_gzip
+        if compressed is None or compressed[0] is not full_json:
+            compressed = (full_json, gzip.compress(full_json, compresslevel=9))
+            self._full_gzip = compressed
+        return compressed[1]
+
+    @staticmethod
+    def _as_dict(record):
+        return {"id": record[0], "subjectCode": record[1], "subjectName": record[2]}
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, course_id):
+        idx = self._by_id.get(str(course_id))
+        if idx is None:
+            return None
+        return self._as_dict(self._records[idx])
+
+    def all_ids(self):
+        return [r[0] for r in self._records]
+
+    def _match_token(self, token):
+        # Every vocabulary entry starting with token, so "data str" matches "Data Structures"
+        vocab = self._vocab
+        matched = set()
+        i = bisect.bisect_left(vocab, token)
+        while i < len(vocab) and vocab[i].startswith(token):
+            matched.update(self._tokens[vocab[i]])
+            i += 1
+        return matched
+
+    def _match_prefix(self, prefix):
+        prefix = prefix.lower()
+        codes = self._codes
+        i = bisect.bisect_left(codes, (prefix, -1))
+        matched = set()
+        while i < len(codes) and codes[i][0].startswith(prefix):
+            matched.add(codes[i][1])
+            i += 1
+        return matched
+
+    def search(self, q=None, prefix=None, limit=DEFAULT_LIMIT, offset=0):
+        """Returns (total, items) for the given filters, in file order."""
+        limit = max(0, min(int(limit), MAX_LIMIT))
+        offset = max(0, int(offset))
+
+        candidates = None
+        if prefix:
+            candidates = self._match_prefix(prefix)
+        if q:
+            tokens = _tokenize(q)
+            if not tokens:
+                # Only punctuation or spaces: nothing can match, rather than everything
+                return 0, []
+            for token in tokens:
+                matched = self._match_token(token)
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    break
+
+        if candidates is None:
+            total = len(self._records)
+            page = self._records[offset:offset + limit]
+        else:
+            ordered = sorted(candidates)
+            total = len(ordered)
+            page = [self._records[i] for i in ordered[offset:offset + limit]]
+
+        return total, [self._as_dict(r) for r in page]
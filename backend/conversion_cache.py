@@ -0,0 +1,198 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import metrics
+
+DEFAULT_ROOT = os.environ.get('PESU_CONVERSION_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'pesu_conversion_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('PESU_CONVERSION_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+EVICTION_GRACE = 60
+
+# Bump when the conversion code itself changes in a way that alters output
+CONVERTER_REVISION = "1"
+
+_PACKAGES = {"pptx": "Spire.Presentation", "docx": "Spire.Doc"}
+
+
+def converter_version(kind):
+    try:
+        from importlib.metadata import version
+        package_version = version(_PACKAGES[kind])
+    except Exception:
+        package_version = "unknown"
+    return f"{kind}-{package_version}-r{CONVERTER_REVISION}"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ConversionCache:
+    """
+    Cache of converted PDFs keyed by source content hash + converter version.
+
+    Each entry records how long the conversion took and how big the output
+    was, so hits can report the conversion time they saved. Total size is
+    capped with LRU eviction.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.pdf_dir = os.path.join(root, 'pdfs')
+        os.makedirs(self.pdf_dir, exist_ok=True)
+        self._local = threading.local()
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.evictions = 0
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversions ("
+            "key TEXT PRIMARY KEY, source_sha256 TEXT NOT NULL, converter TEXT NOT NULL, "
+            "source_bytes INTEGER NOT NULL, output_bytes INTEGER NOT NULL, "
+            "conversion_seconds REAL NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS conversions_accessed ON conversions (accessed_at)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, 'index.sqlite3'), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _version(self, kind):
+        if kind not in self._versions:
+            self._versions[kind] = converter_version(kind)
+        return self._versions[kind]
+
+    def _path(self, key):
+        return os.path.join(self.pdf_dir, key + '.pdf')
+
+    def convert(self, source_path, pdf_path, kind, convert_fn):
+        """
+        Produce pdf_path from source_path, reusing a cached conversion of
+        byte-identical input when available. convert_fn(source, pdf) -> bool
+        is only called on a miss.
+        """
+        try:
+            source_sha256 = file_sha256(source_path)
+        except OSError as e:
+            print(f"Conversion cache could not hash {source_path}: {e}")
+            return convert_fn(source_path, pdf_path)
+
+        converter = self._version(kind)
+        key = hashlib.sha256(f"{source_sha256}:{converter}".encode()).hexdigest()
+        if self._fetch(key, pdf_path):
+            return True
+
+        self.misses += 1
+        started = time.time()
+        if not convert_fn(source_path, pdf_path):
+            return False
+        elapsed = time.time() - started
+        metrics.CONVERSION_SECONDS.observe(elapsed, kind)
+        try:
+            self._store(key, source_sha256, converter, os.path.getsize(source_path), pdf_path, elapsed)
+        except Exception as e:
+            print(f"Conversion cache write error for {source_path}: {e}")
+        return True
+
+    def _fetch(self, key, pdf_path):
+        conn = self._conn()
+        row = conn.execute("SELECT conversion_seconds FROM conversions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        cached_path = self._path(key)
+        try:
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            os.link(cached_path, pdf_path)
+        except FileNotFoundError:
+            conn.execute("DELETE FROM conversions WHERE key = ?", (key,))
+            conn.commit()
+            return False
+        except OSError:
+            shutil.copyfile(cached_path, pdf_path)
+        conn.execute("UPDATE conversions SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        self.hits += 1
+        self.saved_seconds += row[0]
+        return True
+
+    def _store(self, key, source_sha256, converter, source_bytes, pdf_path, elapsed):
+        fd, tmp_path = tempfile.mkstemp(dir=self.pdf_dir)
+        os.close(fd)
+        shutil.copyfile(pdf_path, tmp_path)
+        os.replace(tmp_path, self._path(key))
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO conversions (key, source_sha256, converter, source_bytes, output_bytes, "
+            "conversion_seconds, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, source_sha256, converter, source_bytes, os.path.getsize(pdf_path), elapsed, now, now)
+        )
+        conn.commit()
+        self.evict()
+
+    def total_bytes(self):
+        return self._conn().execute("SELECT COALESCE(SUM(output_bytes), 0) FROM conversions").fetchone()[0]
+
+    def evict(self):
+        conn = self._conn()
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        cutoff = time.time() - EVICTION_GRACE
+        victims = []
+        for key, size in conn.execute(
+            "SELECT key, output_bytes FROM conversions WHERE accessed_at < ? ORDER BY accessed_at ASC", (cutoff,)
+        ):
+            if total <= self.max_bytes:
+                break
+            victims.append(key)
+            total -= size
+        for key in victims:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            conn.execute("DELETE FROM conversions WHERE key = ?", (key,))
+            self.evictions += 1
+        conn.commit()
+
+    def stats(self):
+        return {
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "evictions": self.evictions
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_conversion_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ConversionCache()
+        return _cache
@@ -0,0 +1,327 @@
+import importlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Every gunicorn worker runs its own pool, so by default they split the CPUs and the memory budget
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY') or 1))
+WORKERS = int(os.environ.get('PESU_CONVERSION_WORKERS', max(1, (os.cpu_count() or 2) // WEB_CONCURRENCY)))
+JOB_TIMEOUT = float(os.environ.get('PESU_CONVERSION_TIMEOUT', 300))
+MAX_JOBS_PER_WORKER = int(os.environ.get('PESU_CONVERSION_MAX_JOBS', 50))
+MAX_WORKER_RSS = int(os.environ.get('PESU_CONVERSION_MAX_RSS_MB', 1536)) * 1024 * 1024
+# 0 means 60% of physical memory, divided between the WEB_CONCURRENCY processes
+MEMORY_BUDGET = int(os.environ.get('PESU_CONVERSION_MEMORY_BUDGET_MB', 0)) * 1024 * 1024
+# Rough peak memory of one Spire conversion beyond the worker's idle RSS
+MIN_JOB_ESTIMATE = 200 * 1024 * 1024
+JOB_SIZE_FACTOR = 20
+
+CONVERTERS = {
+    "pptx": "pdf_utils:convert_pptx_to_pdf",
+    "docx": "pdf_utils:convert_docx_to_pdf",
+}
+
+
+def _rss_bytes(pid="self"):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _total_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return 4 * 1024 ** 3
+
+
+def _resolve(spec):
+    module_name, func_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _worker_main(conn, converters, max_jobs, max_rss):
+    # Must be set before Spire loads the .NET runtime
+    os.environ['DOTNET_SYSTEM_GLOBALIZATION_INVARIANT'] = '1'
+    jobs = 0
+    while True:
+        try:
+            kind, source_path, pdf_path = conn.recv()
+        except (EOFError, OSError):
+            return
+        started = time.time()
+        try:
+            ok = bool(_resolve(converters[kind])(source_path, pdf_path))
+        except Exception as e:
+            print(f"Conversion worker error for {source_path}: {e}")
+            ok = False
+        jobs += 1
+        rss = _rss_bytes()
+        retiring = jobs >= max_jobs or (max_rss and rss > max_rss)
+        conn.send((ok, time.time() - started, rss, retiring))
+        if retiring:
+            return
+
+
+class _Worker:
+    def __init__(self, ctx, converters, max_jobs, max_rss):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, converters, max_jobs, max_rss), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.rss = 0
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(5)
+        except Exception:
+            pass
+        self.conn.close()
+
+
+class ConversionPool:
+    """
+    Runs Spire PPTX/DOCX -> PDF conversions in dedicated worker processes.
+
+    Workers are spawned (not forked) so they never inherit the web worker's
+    threads, and the .NET runtime only ever loads in them. A worker is
+    recycled after max_jobs conversions or once its RSS exceeds max_rss, and
+    killed if a job runs past job_timeout. Jobs are admitted only while the
+    workers' resident memory plus the estimated peak of running jobs fits
+    the memory budget, so large decks queue instead of OOMing the box.
+    """
+
+    def __init__(self, workers=WORKERS, job_timeout=JOB_TIMEOUT, max_jobs=MAX_JOBS_PER_WORKER,
+                 max_rss=MAX_WORKER_RSS, memory_budget=MEMORY_BUDGET, converters=None):
+        self.workers = max(1, workers)
+        self.job_timeout = job_timeout
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.memory_budget = memory_budget or int(_total_memory() * 0.6) // WEB_CONCURRENCY
+        self.converters = dict(converters or CONVERTERS)
+        self._ctx = multiprocessing.get_context('spawn')
+        self._cond = threading.Condition()
+        self._idle = []
+        self._live = set()
+        self._started = 0
+        self._running = 0
+        self._reserved = 0
+        self._waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.recycled = 0
+
+    def _spawn(self):
+        worker = _Worker(self._ctx, self.converters, self.max_jobs, self.max_rss)
+        self._live.add(worker)
+        return worker
+
+    def _drop(self, worker, kill=True):
+        self._live.discard(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.process.join(5)
+            worker.conn.close()
+
+    def _resident(self):
+        return sum(w.rss for w in list(self._live))
+
+    def _admissible(self, estimate):
+        if self._running == 0:
+            # Always let one job through, however big, so nothing starves
+            return True
+        return self._resident() + self._reserved + estimate <= self.memory_budget
+
+    def _acquire(self, estimate):
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._admissible(estimate):
+                        if self._idle:
+                            worker = self._idle.pop()
+                            break
+                        if self._started < self.workers:
+                            self._started += 1
+                            worker = None
+                            break
+                    self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._running += 1
+            self._reserved += estimate
+        if worker is None:
+            try:
+                worker = self._spawn()
+            except Exception:
+                self._release(None, estimate)
+                raise
+        return worker
+
+    def _release(self, worker, estimate):
+        with self._cond:
+            self._running -= 1
+            self._reserved -= estimate
+            if worker is not None:
+                self._idle.append(worker)
+            else:
+                self._started -= 1
+            self._cond.notify_all()
+
+    def convert(self, kind, source_path, pdf_path):
+        try:
+            estimate = max(MIN_JOB_ESTIMATE, os.path.getsize(source_path) * JOB_SIZE_FACTOR)
+        except OSError:
+            estimate = MIN_JOB_ESTIMATE
+
+        worker = self._acquire(estimate)
+        try:
+            if not worker.process.is_alive():
+                self._drop(worker)
+                worker = None
+                worker = self._spawn()
+            worker.conn.send((kind, source_path, pdf_path))
+            if not worker.conn.poll(self.job_timeout):
+                print(f"Conversion of {source_path} timed out after {self.job_timeout}s, killing worker")
+                self.timeouts += 1
+                self._drop(worker)
+                worker = None
+                return False
+            ok, elapsed, rss, retiring = worker.conn.recv()
+            worker.rss = rss
+            if retiring:
+                self.recycled += 1
+                self._drop(worker, kill=False)
+                worker = None
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            return ok
+        except (EOFError, OSError) as e:
+            print(f"Conversion worker died while converting {source_path}: {e}")
+            self.failed += 1
+            if worker is not None:
+                self._drop(worker)
+            worker = None
+            return False
+        finally:
+            self._release(worker, estimate)
+
+    def warm_up(self, samples, count=None):
+        """
+        Starts up to count workers (all by default) and runs every sample
+        (kind, source_path) in each, so the .NET runtime is loaded and the
+        converters are JIT-compiled before real jobs arrive. Jobs submitted
+        meanwhile wait for a warm worker instead of starting a cold one.
+        Returns the number of workers warmed.
+        """
+        with self._cond:
+            count = max(0, min(count or self.workers, self.workers) - self._started)
+            self._started += count
+        out_dir = tempfile.mkdtemp(prefix="pesu_warmup_")
+        warmed = []
+        errors = []
+
+        def warm(index):
+            worker = None
+            try:
+                worker = self._spawn()
+                for kind, source_path in samples:
+                    worker.conn.send((kind, source_path, os.path.join(out_dir, f"{index}_{kind}.pdf")))
+                    if not worker.conn.poll(self.job_timeout):
+                        raise TimeoutError(f"Warm-up conversion of {kind} timed out")
+                    ok, _, rss, retiring = worker.conn.recv()
+                    worker.rss = rss
+                    if retiring:
+                        self._drop(worker, kill=False)
+                        worker = None
+                        break
+                    if not ok:
+                        # The runtime is loaded either way, so the worker is kept
+                        errors.append(RuntimeError(f"Warm-up conversion of {kind} failed"))
+                if worker is not None:
+                    warmed.append(worker)
+            except Exception as e:
+                errors.append(e)
+                if worker is not None:
+                    self._drop(worker)
+                worker = None
+            finally:
+                with self._cond:
+                    if worker is not None:
+                        self._idle.append(worker)
+                    else:
+                        self._started -= 1
+                    self._cond.notify_all()
+
+        threads = [threading.Thread(target=warm, args=(i,), name="conversion-warmup") for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        shutil.rmtree(out_dir, ignore_errors=True)
+        for e in errors:
+            print(f"Conversion warm-up: {e}")
+        if errors and not warmed:
+            raise errors[0]
+        return len(warmed)
+
+    def shutdown(self):
+        with self._cond:
+            workers, self._idle = self._idle, []
+            self._started -= len(workers)
+        for worker in workers:
+            self._drop(worker)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "started": self._started,
+            "running": self._running,
+            "queued": self._waiting,
+            "reserved_bytes": self._reserved,
+            "memory_budget": self.memory_budget,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "recycled": self.recycled
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConversionPool()
+        return _pool
+
+
+def _in_process(kind):
+    from pdf_utils import convert_docx_to_pdf, convert_pptx_to_pdf
+    return convert_pptx_to_pdf if kind == "pptx" else convert_docx_to_pdf
+
+
+def convert_pptx_to_pdf(pptx_path, pdf_path):
+    if WORKERS <= 0:
+        return _in_process("pptx")(pptx_path, pdf_path)
+    return get_pool().convert("pptx", pptx_path, pdf_path)
+
+
+def convert_docx_to_pdf(docx_path, pdf_path):
+    if WORKERS <= 0:
+        return _in_process("docx")(docx_path, pdf_path)
+    return get_pool().convert("docx", docx_path, pdf_path)
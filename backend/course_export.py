@@ -0,0 +1,192 @@
+import os
+import shutil
+import threading
+import time
+import zipfile
+
+from pipeline import PipelineError, detect_type, iter_unit_pdf, output_filename, safe_name
+from workspace import charge_file, get_workspaces
+
+MERGED = "merged"
+ORIGINAL = "original"
+BOTH = "both"
+MODES = (MERGED, ORIGINAL, BOTH)
+
+PREFETCH_UNITS = int(os.environ.get('PESU_EXPORT_PREFETCH_UNITS', 1))
+READ_CHUNK = 256 * 1024
+
+
+class _ChunkSink:
+    """
+    Write-only target for ZipFile. It has tell() but no seek(), so zipfile
+    writes local headers with data descriptors and never goes back; written
+    bytes are handed out by drain() and not kept.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """Builds a ZIP archive incrementally; every method yields the bytes it produced."""
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', compression=zipfile.ZIP_STORED)
+
+    def _info(self, name):
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        info.external_attr = 0o644 << 16
+        return info
+
+    def add_chunks(self, name, chunks):
+        # Size is unknown up front, so always allow ZIP64 for the entry
+        with self._zip.open(self._info(name), 'w', force_zip64=True) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        data = self._sink.drain()
+        if data:
+            yield data
+
+    def add_file(self, name, path):
+        info = self._info(name)
+        info.file_size = os.path.getsize(path)
+        with open(path, 'rb') as f, self._zip.open(info, 'w') as entry:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+                entry.write(chunk)
+                yield self._sink.drain()
+        data = self._sink.drain()
+        if data:
+            yield data
+
+    def add_text(self, name, text):
+        self._zip.writestr(self._info(name), text)
+        yield self._sink.drain()
+
+    def close(self):
+        self._zip.close()
+        yield self._sink.drain()
+
+
+def _class_files(classes):
+    return [{"classId": c.get("classId"), "name": c.get("title", "")} for c in classes if c.get("classId")]
+
+
+def _prefetch(client, course_id, files, resource_type, temp_dir):
+    """Downloads a unit into the document cache ahead of time; its files are not used directly."""
+    os.makedirs(temp_dir, exist_ok=True)
+    items = [(course_id, f['classId'], os.path.join(temp_dir, f"{f['classId']}_temp"), resource_type) for f in files]
+    threading.Thread(target=client.download_files, args=(items,), name="export-prefetch", daemon=True).start()
+
+
+def _iter_originals(client, course_id, files, resource_type, temp_dir, folder, zip_stream, failures):
+    items = [(course_id, f['classId'], os.path.join(temp_dir, f"{f['classId']}_temp"), resource_type) for f in files]
+    # Entries are written in the order downloads finish
+    for index, (success, paths) in client.iter_downloads(items):
+        title = files[index]['name'] or str(files[index]['classId'])
+        if not success:
+            failures.append(f"{folder}: {title} (download failed)")
+            continue
+        for i, path in enumerate(paths):
+            charge_file(path)
+            kind = detect_type(path)
+            suffix = f"_{i + 1}" if len(paths) > 1 else ""
+            extension = f".{kind}" if kind else os.path.splitext(path)[1]
+            name = f"{folder}/{index + 1:02d}_{safe_name(title)}{suffix}{extension}"
+            yield from zip_stream.add_file(name, path)
+            os.remove(path)
+
+
+def iter_course_zip(client, course_id, course_name, units, list_classes, resource_type="2", mode=MERGED,
+                    workspace=None):
+    """
+    Yields a ZIP of a whole course as it is built: per unit, the merged PDF
+    (mode 'merged'), the original files ('original') or both.
+
+    Units are exported one after another while the next PREFETCH_UNITS
+    units download into the document cache in the background; download and
+    conversion concurrency stay bounded by the shared engine, conversion
+    pool and upstream limiter. Merged PDFs come from the merged and
+    conversion caches when possible. Nothing is buffered beyond a read
+    chunk, so memory does not grow with the size of the course. Scratch
+    files live in workspace (a new one if not given), closed at the end.
+    """
+    zip_stream = ZipStream()
+    failures = []
+    if workspace is None:
+        workspace = get_workspaces().create()
+    temp_root = workspace.path
+    unit_files = {}
+
+    def files_for(position):
+        if position not in unit_files:
+            unit_files[position] = _class_files(list_classes(units[position].get("unitId")) or [])
+        return unit_files[position]
+
+    try:
+        for position, unit in enumerate(units):
+            unit_title = unit.get("title") or f"Unit {position + 1}"
+            folder = f"{position + 1:02d}_{safe_name(unit_title)}"
+            files = files_for(position)
+
+            for ahead in range(position + 1, min(len(units), position + 1 + PREFETCH_UNITS)):
+                if ahead not in unit_files:
+                    _prefetch(client, course_id, files_for(ahead), resource_type,
+                              os.path.join(temp_root, f"prefetch_{ahead}"))
+
+            if not files:
+                failures.append(f"{folder}: no classes")
+                continue
+
+            temp_dir = os.path.join(temp_root, f"unit_{position}")
+            os.makedirs(temp_dir, exist_ok=True)
+
+            if mode in (ORIGINAL, BOTH):
+                yield from _iter_originals(client, course_id, files, resource_type, temp_dir, folder,
+                                           zip_stream, failures)
+
+            if mode in (MERGED, BOTH):
+                chunks = iter_unit_pdf(client, course_id, files, resource_type, temp_dir,
+                                       unit_id=unit.get("unitId"))
+                name = f"{folder}.pdf" if mode == MERGED else f"{folder}/{output_filename(course_name, unit_title)}"
+                try:
+                    first_chunk = next(chunks)
+                except PipelineError as e:
+                    failures.append(f"{folder}: {e}")
+                else:
+                    def unit_chunks():
+                        yield first_chunk
+                        yield from chunks
+                    yield from zip_stream.add_chunks(name, unit_chunks())
+                finally:
+                    chunks.close()
+
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        if failures:
+            yield from zip_stream.add_text("export_errors.txt", "\n".join(failures) + "\n")
+        yield from zip_stream.close()
+    finally:
+        # A prefetch still running only loses its links into this directory; the cache keeps the files
+        workspace.close()
@@ -0,0 +1,474 @@
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import os
+import queue
+import shutil
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import aiohttp
+
+import metrics
+from html_extract import extract_download_urls
+from http_transport import (CONNECT_TIMEOUT, READ_TIMEOUT, RETRIES, RETRY_STATUSES, TOTAL_TIMEOUT, backoff_delay,
+                            retry_after)
+from upstream_limiter import BULK, get_limiter
+from blob_cache import (BlobCache, IntegrityError, announced_sha256, conditional_headers, get_blob_cache,
+                        resume_validator, unchanged, validators)
+
+DOWNLOAD_CONCURRENCY = int(os.environ.get('PESU_DOWNLOAD_CONCURRENCY', 16))
+POOL_PER_HOST = int(os.environ.get('PESU_DOWNLOAD_POOL_PER_HOST', 16))
+# 0 adapts the read size to how fast data arrives
+CHUNK_SIZE = int(os.environ.get('PESU_DOWNLOAD_CHUNK_SIZE', 0))
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+DOCUMENT_CONTENT_TYPES = (
+    'application/pdf',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'application/vnd.ms-powerpoint',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/msword',
+    'application/octet-stream',
+    'binary/octet-stream',
+)
+
+_priority = contextvars.ContextVar('download_priority', default=BULK)
+
+# Cache key for documents served directly by studentProfilePESUAdmin
+DIRECT_URL = "studentProfilePESUAdmin"
+
+# Put on a batch's result queue once it has finished, successfully or not
+_BATCH_DONE = object()
+
+
+class DownloadEngine:
+    """
+    Asyncio downloader running on a dedicated event loop thread.
+
+    All users share one aiohttp connector (bounded per host), one global
+    concurrency limit and the upstream limiter (at bulk priority); cookies
+    stay per user because every batch gets its own ClientSession on top of
+    the shared connector. Documents are streamed into the content-addressed
+    blob cache, which is consulted (and revalidated) before going to the
+    network, and then hard-linked into each caller's output path. Identical
+    documents requested concurrently are fetched once.
+
+    download_many() is the synchronous facade used from Flask threads.
+    """
+
+    def __init__(self, concurrency=DOWNLOAD_CONCURRENCY, pool_per_host=POOL_PER_HOST, chunk_size=CHUNK_SIZE):
+        self.concurrency = concurrency
+        self.pool_per_host = pool_per_host
+        self.chunk_size = chunk_size
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._connector = None
+        self._semaphore = None
+        self._in_flight = {}
+        self.blob_cache = get_blob_cache()
+        self.limiter = get_limiter()
+        self.bytes_downloaded = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.resumed = 0
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=loop.run_forever, name="download-engine", daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+            self._loop = loop
+            return loop
+
+    async def _setup(self):
+        # Both must be created on the engine loop
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_per_host)
+
+    def run(self, coro):
+        """Run a coroutine on the engine loop and block until it finishes."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def download_many(self, client, items, priority=BULK):
+        """
+        items: iterable of (course_id, class_id, output_path, resource_type).
+        Returns a list of (success, paths) in the same order.
+        """
+        items = list(items)
+        results = [None] * len(items)
+        for index, result in self.iter_downloads(client, items, priority):
+            results[index] = result
+        return results
+
+    def iter_downloads(self, client, items, priority=BULK):
+        """Yields (index, (success, paths)) for each item as soon as it finishes."""
+        items = list(items)
+        finished = queue.Queue()
+        trace = metrics.current_trace()
+
+        async def run():
+            try:
+                # Every task of this batch inherits the priority its upstream requests are queued at,
+                # and the caller's trace
+                _priority.set(priority)
+                metrics.adopt(trace)
+                async with self._client_session(client) as http:
+                    async def one(index, item):
+                        finished.put((index, await self._download_one(http, *item)))
+                    tasks = [asyncio.ensure_future(one(i, item)) for i, item in enumerate(items)]
+                    try:
+                        await asyncio.gather(*tasks)
+                    finally:
+                        # gather leaves the other downloads running when one of them raises
+                        for task in tasks:
+                            task.cancel()
+                # Every result is linked into its output path by now, safe to trim the cache
+                await asyncio.to_thread(self.blob_cache.evict)
+            finally:
+                # Wakes the caller even if the batch failed before producing every result
+                finished.put(_BATCH_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(run(), self._ensure_loop())
+        try:
+            for _ in items:
+                result = finished.get()
+                if result is _BATCH_DONE:
+                    break
+                yield result
+            # Re-raises whatever stopped the batch early
+            future.result()
+        finally:
+            # Stops the remaining downloads if the caller gave up on them
+            future.cancel()
+
+    def _client_session(self, client):
+        cookies = {c.name: c.value for c in client.session.cookies}
+        return aiohttp.ClientSession(
+            connector=self._connector,
+            connector_owner=False,
+            cookies=cookies,
+            headers=dict(client.session.headers),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        )
+
+    async def _download_one(self, http, course_id, class_id, output_path, resource_type):
+        key = BlobCache.key(course_id, class_id, resource_type)
+        flight = self._in_flight.get(key)
+        shared = flight is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            flight = asyncio.ensure_future(self._fetch_document(http, course_id, class_id, resource_type))
+            self._in_flight[key] = flight
+            flight.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        try:
+            try:
+                docs = await asyncio.shield(flight)
+            except Exception as e:
+                if not shared:
+                    raise
+                print(f"Shared download failed for {class_id}: {e}")
+                docs = None
+            if docs is None and shared:
+                # The leader's failure may be specific to its session
+                docs = await self._fetch_document(http, course_id, class_id, resource_type)
+            if docs:
+                return True, await asyncio.to_thread(self._materialize, docs, output_path)
+        except Exception as e:
+            print(f"Download error for {class_id}: {e}")
+        return False, []
+
+    def _materialize(self, docs, output_path):
+        """Links cached blobs to the paths download_file has always produced."""
+        paths = []
+        for i, doc in enumerate(docs):
+            if doc.get('name'):
+                # Keeps the Content-Disposition name, behind the item's own prefix: classes of a
+                # batch often send the same name (e.g. Lecture.pdf) and share one directory
+                target = f"{output_path}_{i}_{os.path.basename(doc['name'])}"
+            elif len(docs) == 1:
+                target = output_path
+            else:
+                target = f"{output_path}_{i}"
+            _link(self.blob_cache.blob_path(doc['sha256']), target)
+            paths.append(target)
+        return paths
+
+    async def _fetch_document(self, http, course_id, class_id, resource_type):
+        """
+        Returns the list of cached docs for a class resource, consulting the
+        blob cache first and revalidating stale entries against upstream.
+        Returns None if nothing could be downloaded.
+        """
+        from pesu_client import BASE_URL
+
+        cache = self.blob_cache
+        key = BlobCache.key(course_id, class_id, resource_type)
+        # The cache index is SQLite and blocks; it runs off the loop so other users' transfers keep going
+        cached = await asyncio.to_thread(cache.lookup, key)
+        if cached is not None and cache.is_fresh(cached[1]):
+            cache.hits += 1
+            await asyncio.to_thread(cache.touch, cached[0])
+            return cached[0]
+        cached_by_url = {d['url']: d for d in cached[0]} if cached is not None else {}
+
+        url = f"{BASE_URL}/s/studentProfilePESUAdmin"
+        params = {
+            "url": "studentProfilePESUAdmin",
+            "controllerMode": "6403",
+            "actionType": "60",
+            "selectedData": str(course_id),
+            "id": str(resource_type),
+            "unitid": str(class_id)
+        }
+
+        doc, html = await self._fetch(http, url, params=params, cached_doc=cached_by_url.get(DIRECT_URL),
+                                      html_ok=True)
+        if doc is not None:
+            doc['url'] = DIRECT_URL
+            docs = [doc]
+        elif html is None:
+            return None
+        else:
+            download_urls = extract_download_urls(html)
+            if not download_urls:
+                print(f"No download link found for {class_id}")
+                return None
+            docs = await asyncio.gather(*(
+                self._fetch_linked(http, u, cached_by_url.get(u)) for u in download_urls
+            ))
+
+        await asyncio.to_thread(cache.store, key, docs)
+        await asyncio.to_thread(cache.touch, docs)
+        return docs
+
+    async def _fetch_linked(self, http, download_url, cached_doc):
+        from pesu_client import BASE_URL
+
+        if download_url.startswith('/Academy'):
+            full_url = "{0.scheme}://{0.netloc}{1}".format(urlsplit(BASE_URL), download_url)
+        elif download_url.startswith('http'):
+            full_url = download_url
+        else:
+            full_url = f"{BASE_URL}/{download_url.lstrip('/')}"
+
+        doc, _ = await self._fetch(http, full_url, cached_doc=cached_doc)
+        doc['url'] = download_url
+        return doc
+
+    async def _fetch(self, http, url, params=None, cached_doc=None, html_ok=False):
+        """
+        GETs one document into the blob cache, revalidating cached_doc if given.
+
+        Returns (doc, None) for a downloaded or unchanged document, or
+        (None, html) for an HTML page when html_ok. If the connection drops
+        mid-body the transfer resumes from where it stopped with a Range
+        request (whole-body retry if upstream ignores ranges), and an
+        interrupted .part is picked up again by the next download of the
+        same URL.
+        """
+        part_id = _part_id(url, params)
+        # Opening a part re-hashes what an earlier attempt left on disk
+        part = await asyncio.to_thread(self.blob_cache.partial, part_id)
+        attempt = 0
+        try:
+            while True:
+                headers = conditional_headers(cached_doc) if cached_doc else {}
+                headers.update(part.range_headers())
+                try:
+                    async with self._get(http, url, params=params, headers=headers) as response:
+                        if response.status == 416 and part.size and attempt < RETRIES:
+                            # The stored part no longer fits the document; fetch it whole
+                            await asyncio.to_thread(part.restart)
+                            attempt += 1
+                            continue
+                        if cached_doc and unchanged(response.status, response.headers, cached_doc):
+                            self.blob_cache.revalidated += 1
+                            await asyncio.to_thread(part.restart)
+                            return cached_doc, None
+                        content_type = response.headers.get('Content-Type', '')
+                        if html_ok and 'text/html' in content_type and response.status != 206:
+                            return None, await response.text()
+                        if html_ok and not any(t in content_type for t in DOCUMENT_CONTENT_TYPES):
+                            print(f"Unknown content type: {content_type}")
+                            return None, None
+                        doc = await self._stream_to_cache(response, part)
+                        if response.content_disposition and response.content_disposition.filename:
+                            doc['name'] = os.path.basename(response.content_disposition.filename)
+                        return doc, None
+                except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    # Connection errors before a response are already retried by _get; this is a body cut short
+                    if attempt >= RETRIES:
+                        raise
+                    print(f"Download of {url} interrupted after {part.size} bytes ({e}), resuming")
+                    self.resumed += 1
+                    await asyncio.sleep(backoff_delay(attempt))
+                    attempt += 1
+                except IntegrityError as e:
+                    # The bytes are gone with the failed commit, start a clean transfer
+                    if attempt >= RETRIES:
+                        raise
+                    print(f"Download of {url} failed verification ({e}), retrying")
+                    part = await asyncio.to_thread(self.blob_cache.partial, part_id)
+                    attempt += 1
+        finally:
+            # Only closes (or unlinks) the file, and has to run even while being cancelled
+            part.abort()
+
+    @contextlib.asynccontextmanager
+    async def _get(self, http, url, **kwargs):
+        """
+        GET holding a concurrency slot and an upstream limiter slot (at the
+        batch's priority), retried with jittered backoff on connection errors and
+        transient statuses until a response is handed to the caller. Both
+        slots are released while backing off.
+        """
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                # Bounded, since the engine slot is held while waiting
+                await self.limiter.acquire_async(_priority.get(), timeout=TOTAL_TIMEOUT)
+                started = time.monotonic()
+                try:
+                    response = await http.get(url, **kwargs)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    self.limiter.release(overloaded=True)
+                    metrics.upstream(url, started, None, "error")
+                    if attempt >= RETRIES:
+                        raise
+                    delay = backoff_delay(attempt)
+                except BaseException:
+                    self.limiter.release()
+                    raise
+                else:
+                    latency = time.monotonic() - started
+                    metrics.upstream(url, started, latency, response.status)
+                    overloaded = response.status in RETRY_STATUSES
+                    if not overloaded or attempt >= RETRIES:
+                        try:
+                            yield response
+                        finally:
+                            response.release()
+                            self.limiter.release(latency, overloaded)
+                        return
+                    delay = max(backoff_delay(attempt), retry_after(response.headers) or 0)
+                    response.release()
+                    self.limiter.release(latency, overloaded)
+            self.retries += 1
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _stream_to_cache(self, response, part):
+        if response.status == 206:
+            first, total = _content_range(response.headers.get('Content-Range', ''))
+            if first != part.size:
+                # Not the range we asked for; start over next time
+                await asyncio.to_thread(part.restart)
+                raise RuntimeError(f"Upstream sent range starting at {first} for {response.url}, expected {part.size}")
+        elif response.status == 200:
+            if part.size:
+                # Upstream ignored the range or the document changed (If-Range)
+                await asyncio.to_thread(part.restart)
+            total = None if response.headers.get('Content-Encoding') else response.content_length
+        else:
+            raise RuntimeError(f"Upstream returned {response.status} for {response.url}")
+
+        await asyncio.to_thread(part.begin, resume_validator(response.headers))
+        received = 0
+        try:
+            async for chunk in self._iter_chunks(response):
+                # Disk writes and hashing happen on a worker thread, one chunk at a time and in order
+                await asyncio.to_thread(part.write, chunk)
+                received += len(chunk)
+        finally:
+            # Interrupted transfers count too; they went over the wire
+            self.bytes_downloaded += received
+            metrics.DOWNLOAD_BYTES.inc(amount=received)
+        sha256 = await asyncio.to_thread(part.commit, expected_size=total,
+                                         expected_sha256=announced_sha256(response.headers))
+
+        self.blob_cache.misses += 1
+        doc = validators(response.headers)
+        if response.status == 206:
+            # Content-Length of a 206 is just the tail we fetched
+            doc['content_length'] = str(total) if total is not None else None
+        doc.update(sha256=sha256, size=part.size)
+        return doc
+
+    async def _iter_chunks(self, response):
+        if self.chunk_size:
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                yield chunk
+            return
+        # Adaptive: take whatever has arrived, up to a size that grows while
+        # the socket keeps filling it and shrinks when reads come back short
+        size = MIN_CHUNK_SIZE
+        while True:
+            chunk = await response.content.read(size)
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) == size:
+                size = min(MAX_CHUNK_SIZE, size * 2)
+            elif len(chunk) < size // 4:
+                size = max(MIN_CHUNK_SIZE, size // 2)
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "pool_per_host": self.pool_per_host,
+            "in_flight": len(self._in_flight),
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "resumed": self.resumed,
+            "bytes_downloaded": self.bytes_downloaded
+        }
+
+
+def _part_id(url, params=None):
+    if params:
+        url = f"{url}?{urlencode(sorted((str(k), str(v)) for k, v in params.items()))}"
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+def _content_range(value):
+    """Parses 'bytes first-last/total' into (first, total); total is None if unknown."""
+    try:
+        unit, _, spec = value.partition(' ')
+        span, _, total = spec.partition('/')
+        first = int(span.split('-')[0])
+        return first, (int(total) if total and total != '*' else None)
+    except ValueError:
+        return None, None
+
+
+def _link(source, target):
+    # Hard links make a cached blob appear in the job directory without copying it
+    try:
+        if os.path.exists(target):
+            os.remove(target)
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = DownloadEngine()
+        return _engine
@@ -0,0 +1,175 @@
+import io
+import mmap
+import os
+import shutil
+import struct
+
+# ZIP record signatures and layouts (APPNOTE 4.3)
+_LOCAL_HEADER = b'PK\x03\x04'
+_CENTRAL_HEADER = b'PK\x01\x02'
+_END = struct.Struct('<4s4H2LH')
+_END_SIGNATURE = b'PK\x05\x06'
+_ZIP64_LOCATOR = struct.Struct('<4sLQL')
+_ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+_ZIP64_END = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_END_SIGNATURE = b'PK\x06\x06'
+_CENTRAL = struct.Struct('<4s6H3L5H2L')
+_MAX_COMMENT = 0xFFFF
+
+# Member path prefixes that identify an Office Open XML package
+_OFFICE_PREFIXES = ((b'ppt/', 'pptx'), (b'word/', 'docx'))
+
+
+def sniff(path):
+    """
+    Classifies a downloaded file in one open: 'pdf' from its first bytes,
+    or 'pptx', 'docx' or 'zip' from the member names in the ZIP central
+    directory, read from the end of the file without touching the members.
+    Returns (kind, offset) where offset is where the ZIP data starts (more
+    than 0 if junk precedes it), or (None, 0) if the file is neither.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(len(_LOCAL_HEADER))
+            if head.startswith(b'%PDF'):
+                return 'pdf', 0
+            directory = _central_directory(f)
+    except OSError as e:
+        print(f"Error reading file {path}: {e}")
+        return None, 0
+    if directory is None:
+        if head.startswith(b'PK'):
+            print(f"Error inspecting zip {path}: no central directory")
+        return None, 0
+    offset, data = directory
+    return _classify(data), offset
+
+
+def _central_directory(f):
+    """(offset of the ZIP data in f, central directory bytes), or None if f has no valid one."""
+    size = f.seek(0, os.SEEK_END)
+    if size < _END.size:
+        return None
+    tail_size = min(size, _END.size + _MAX_COMMENT)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    position = tail.rfind(_END_SIGNATURE, 0, tail_size - _END.size + len(_END_SIGNATURE))
+    if position < 0:
+        return None
+    end_offset = size - tail_size + position
+    _, _, _, _, entries, cd_size, cd_offset, _ = _END.unpack_from(tail, position)
+
+    if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF or entries == 0xFFFF:
+        # ZIP64: the real sizes live in a record just before the locator
+        locator_offset = end_offset - _ZIP64_LOCATOR.size
+        record_offset = locator_offset - _ZIP64_END.size
+        if record_offset < 0:
+            return None
+        f.seek(record_offset)
+        record = f.read(_ZIP64_END.size + _ZIP64_LOCATOR.size)
+        if (record[:4] != _ZIP64_END_SIGNATURE
+                or record[_ZIP64_END.size:_ZIP64_END.size + 4] != _ZIP64_LOCATOR_SIGNATURE):
+            return None
+        _, _, _, _, _, _, _, entries, cd_size, cd_offset = _ZIP64_END.unpack_from(record)
+        end_offset = record_offset
+
+    # Offsets in the directory are relative to the start of the ZIP data,
+    # which is later than 0 when something was prepended to the file
+    cd_start = end_offset - cd_size
+    offset = cd_start - cd_offset
+    if cd_start < 0 or offset < 0:
+        return None
+    f.seek(cd_start)
+    data = f.read(cd_size)
+    if len(data) != cd_size or (entries and not data.startswith(_CENTRAL_HEADER)):
+        return None
+    return offset, data
+
+
+def _classify(directory):
+    kind = 'zip'
+    position = 0
+    end = len(directory)
+    while position + _CENTRAL.size <= end:
+        fields = _CENTRAL.unpack_from(directory, position)
+        if fields[0] != _CENTRAL_HEADER:
+            break
+        name_start = position + _CENTRAL.size
+        for prefix, office_kind in _OFFICE_PREFIXES:
+            if directory.startswith(prefix, name_start, name_start + fields[10]):
+                if office_kind == 'pptx':
+                    return office_kind
+                kind = office_kind
+        position = name_start + fields[10] + fields[11] + fields[12]
+    return kind
+
+
+def find_zip_start(path):
+    """Offset of the first ZIP local header in path, found through mmap, or -1."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return -1
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm.find(_LOCAL_HEADER)
+
+
+class OffsetView(io.RawIOBase):
+    """
+    Read-only view of a file from offset to its end, so a document with
+    junk in front of it can be opened (e.g. by zipfile) without copying it.
+    """
+
+    def __init__(self, f, offset):
+        super().__init__()
+        self._f = f
+        self._offset = offset
+        self._size = os.fstat(f.fileno()).st_size - offset
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self._position
+        elif whence == os.SEEK_END:
+            position += self._size
+        self._position = max(0, position)
+        return self._position
+
+    def readinto(self, buffer):
+        # Positional read: the underlying file's own position is never moved
+        count = os.preadv(self._f.fileno(), [buffer], self._offset + self._position)
+        self._position += count
+        return count
+
+
+def strip_prefix(path, offset):
+    """
+    Rewrites path without its first offset bytes. The data is copied by
+    the kernel where possible, never through Python, and the new file
+    replaces the old one, since path may be a hard link into the blob cache.
+    """
+    tmp_path = path + ".repair"
+    with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        remaining = os.fstat(src.fileno()).st_size - offset
+        position = offset
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining, position)
+                if copied == 0:
+                    break
+                position += copied
+                remaining -= copied
+        except (AttributeError, OSError):
+            # No copy_file_range (or not across these filesystems): stream through a small buffer
+            dst.seek(position - offset)
+            dst.truncate()
+            shutil.copyfileobj(OffsetView(src, position), dst, 1024 * 1024)
+    os.replace(tmp_path, path)
@@ -0,0 +1,149 @@
+import html as html_lib
+import re
+
+# Precompiled patterns for the handful of fragments we read from PESU pages.
+# Tag patterns skip over quoted attribute values so a '>' inside onclick
+# doesn't end the tag early; possessive quantifiers keep a malformed tag
+# from backtracking.
+TAG_ATTRS = r"""((?:[^>"']++|"[^"]*"|'[^']*')*+)"""
+OPTION_RE = re.compile(r"<option\b" + TAG_ATTRS + r">(.*?)</option\s*>", re.S | re.I)
+OPTION_OPEN_RE = re.compile(r"<option\b", re.I)
+INPUT_RE = re.compile(r"<input\b" + TAG_ATTRS + ">", re.I)
+LINK_TAG_RE = re.compile(r"<(?:a|div|span|i|p)\b" + TAG_ATTRS + ">", re.I)
+# PESU sometimes returns HTML that was JSON-escaped (value=\"123\"), so quotes may carry a backslash
+ATTR_VALUE = r"""\s*=\s*(?:\\?"((?:[^"\\]|\\(?!"))*)\\?"|\\?'((?:[^'\\]|\\(?!'))*)\\?'|([^\s>]+))"""
+ATTR_RE = re.compile(r"""([^\s=/>\\]+)(?:""" + ATTR_VALUE + ")?")
+VALUE_ATTR_RE = re.compile(r"(?:^|\s)value" + ATTR_VALUE, re.I)
+TAG_RE = re.compile(r"<[^>]*>")
+LOAD_IFRAME_RE = re.compile(r"loadIframe\('([^']+)'")
+DOWNLOAD_COURSE_DOC_RE = re.compile(r"downloadcoursedoc\(['\"]([^'\"]+)['\"]\)")
+
+DOWNLOAD_MARKERS = ('downloadslidecoursedoc', 'downloadcoursedoc')
+
+
+def _attrs(attr_text):
+    attrs = {}
+    for match in ATTR_RE.finditer(attr_text):
+        name = match.group(1).lower()
+        if name in attrs:
+            continue
+        value = match.group(2)
+        if value is None:
+            value = match.group(3)
+        if value is None:
+            value = match.group(4)
+        attrs[name] = html_lib.unescape(value) if value else ""
+    return attrs
+
+
+# --- BeautifulSoup reference implementations, used as fallback ---
+
+def _soup(content):
+    # Imported on first use; the fast paths above never need it
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, "html.parser")
+
+
+def options_bs4(content):
+    soup = _soup(content)
+    return [(option.get("value"), option.text.strip()) for option in soup.find_all("option")]
+
+
+def csrf_token_bs4(content):
+    soup = _soup(content)
+    csrf_input = soup.find("input", {"name": "_csrf"})
+    if csrf_input:
+        return csrf_input.get("value")
+    return None
+
+
+def _download_url(onclick, href):
+    if 'downloadslidecoursedoc' in onclick:
+        match = LOAD_IFRAME_RE.search(onclick)
+        if match:
+            return match.group(1)
+    elif 'downloadslidecoursedoc' in href:
+        return href
+    elif 'downloadcoursedoc' in onclick:
+        match = DOWNLOAD_COURSE_DOC_RE.search(onclick)
+        if match:
+            doc_id = match.group(1)
+            # Updated URL based on user feedback (step 160)
+            return f"/Academy/a/referenceMeterials/downloadslidecoursedoc/{doc_id}"
+    return None
+
+
+def _collect_urls(pairs):
+    download_urls = []
+    for onclick, href in pairs:
+        url_to_add = _download_url(onclick or '', href or '')
+        if url_to_add:
+            # Normalize URL
+            url_to_add = url_to_add.split('#')[0]
+            if url_to_add not in download_urls:
+                download_urls.append(url_to_add)
+    return download_urls
+
+
+def download_urls_bs4(content):
+    soup = _soup(content)
+    # Check for loadIframe or downloadslidecoursedoc or downloadcoursedoc
+    return _collect_urls(
+        (link.get('onclick', ''), link.get('href', ''))
+        for link in soup.find_all(['a', 'div', 'span', 'i', 'p'])
+    )
+
+
+# --- Fast paths ---
+
+def extract_options(content):
+    """Returns [(value, text)] for every <option>, like BeautifulSoup's find_all("option")."""
+    matches = OPTION_RE.findall(content)
+    if len(matches) != len(OPTION_OPEN_RE.findall(content)):
+        # Unclosed or nested options; let the real parser sort it out
+        return options_bs4(content)
+    options = []
+    for attr_text, inner in matches:
+        # Only the value is needed, so skip tokenizing every attribute
+        match = VALUE_ATTR_RE.search(attr_text)
+        value = None
+        if match:
+            value = next((v for v in match.groups() if v is not None), "")
+            if '&' in value:
+                value = html_lib.unescape(value)
+        if '<' in inner:
+            inner = TAG_RE.sub("", inner)
+        if '&' in inner:
+            inner = html_lib.unescape(inner)
+        options.append((value, inner.strip()))
+    return options
+
+
+def extract_csrf_token(content):
+    if '_csrf' not in content:
+        return None
+    for match in INPUT_RE.finditer(content):
+        if '_csrf' not in match.group(1):
+            continue
+        attrs = _attrs(match.group(1))
+        if attrs.get("name") == "_csrf":
+            return attrs.get("value")
+    return csrf_token_bs4(content)
+
+
+def extract_download_urls(content):
+    """Pulls document download URLs out of a studentProfilePESUAdmin HTML response."""
+    if not any(marker in content for marker in DOWNLOAD_MARKERS):
+        return []
+    pairs = []
+    for match in LINK_TAG_RE.finditer(content):
+        attr_text = match.group(1)
+        if not any(marker in attr_text for marker in DOWNLOAD_MARKERS):
+            continue
+        attrs = _attrs(attr_text)
+        pairs.append((attrs.get('onclick', ''), attrs.get('href', '')))
+    download_urls = _collect_urls(pairs)
+    if not download_urls:
+        # Markers are present but not in a shape we recognise
+        return download_urls_bs4(content)
+    return download_urls
@@ -0,0 +1,185 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from upstream_limiter import INTERACTIVE, LimiterTimeout, get_limiter
+
+POOL_SIZE = int(os.environ.get('PESU_HTTP_POOL_SIZE', 20))
+CONNECT_TIMEOUT = float(os.environ.get('PESU_HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('PESU_HTTP_READ_TIMEOUT', 30))
+TOTAL_TIMEOUT = float(os.environ.get('PESU_HTTP_TOTAL_TIMEOUT', 60))
+RETRIES = int(os.environ.get('PESU_HTTP_RETRIES', 3))
+BACKOFF_BASE = float(os.environ.get('PESU_HTTP_BACKOFF_BASE', 0.5))
+BACKOFF_MAX = float(os.environ.get('PESU_HTTP_BACKOFF_MAX', 8))
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after(headers):
+    value = headers.get('Retry-After', '')
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class SharedAdapter(HTTPAdapter):
+    """HTTPAdapter mounted on every user's session; closing a session must not close the shared pools."""
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+class TransportSession(requests.Session):
+    """
+    A per-user requests.Session (own cookie jar and headers) that sends
+    through the shared adapter, applies the default connect/read timeouts
+    and a total deadline, and retries idempotent requests on connection
+    errors and transient statuses. Every attempt passes through the
+    upstream limiter at the session's priority, or a per-call priority=.
+    """
+
+    def __init__(self, transport, priority=INTERACTIVE):
+        super().__init__()
+        self.transport = transport
+        self.priority = priority
+        self.mount('https://', transport.adapter)
+        self.mount('http://', transport.adapter)
+
+    def request(self, method, url, **kwargs):
+        transport = self.transport
+        limiter = transport.limiter
+        priority = kwargs.pop('priority', self.priority)
+        retries = transport.retries if method.upper() in IDEMPOTENT_METHODS else 0
+        explicit_timeout = kwargs.pop('timeout', None)
+        deadline = time.monotonic() + transport.total_timeout
+        transport.count('requests')
+
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                transport.count('deadline_exceeded')
+                raise requests.Timeout(f"{method} {url} exceeded {transport.total_timeout}s")
+            timeout = explicit_timeout or (min(transport.connect_timeout, remaining), min(transport.read_timeout, remaining))
+            transport.count('attempts')
+            try:
+                # A limit cut to its floor must not hold this thread past the deadline
+                limiter.acquire(priority, timeout=remaining)
+            except LimiterTimeout:
+                transport.count('deadline_exceeded')
+                raise requests.Timeout(f"{method} {url} waited {transport.total_timeout}s for an upstream slot") from None
+            started = time.monotonic()
+            try:
+                response = super().request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                limiter.release(overloaded=True)
+                metrics.upstream(url, started, None, "error")
+                if attempt >= retries:
+                    transport.count('failures')
+                    raise
+                delay = backoff_delay(attempt, transport.backoff_base, transport.backoff_max)
+            except BaseException:
+                limiter.release()
+                raise
+            else:
+                limiter.release(response.elapsed.total_seconds(), response.status_code in RETRY_STATUSES)
+                metrics.upstream(url, started, response.elapsed.total_seconds(), response.status_code)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                delay = backoff_delay(attempt, transport.backoff_base, transport.backoff_max)
+                delay = max(delay, retry_after(response.headers) or 0)
+                response.close()
+
+            if time.monotonic() + delay >= deadline:
+                transport.count('deadline_exceeded')
+                raise requests.Timeout(f"{method} {url} exceeded {transport.total_timeout}s while retrying")
+            transport.count('retries')
+            time.sleep(delay)
+            attempt += 1
+
+
+class Transport:
+    """
+    One connection pool per upstream host, shared by every logged-in user.
+
+    Keep-alive connections (and their TLS sessions) are reused across users;
+    cookies stay isolated because each user still gets their own
+    TransportSession with its own jar.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 total_timeout=TOTAL_TIMEOUT, retries=RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 limiter=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = limiter or get_limiter()
+        # Retries are handled in TransportSession so the total deadline covers them
+        self.adapter = SharedAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "attempts": 0, "retries": 0, "failures": 0, "deadline_exceeded": 0}
+
+    def session(self, priority=INTERACTIVE):
+        return TransportSession(self, priority)
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        pools = []
+        manager = self.adapter.poolmanager
+        with manager.pools.lock:
+            pool_list = list(manager.pools._container.values())
+        for pool in pool_list:
+            # Every request beyond the first on a connection rode an existing keep-alive connection
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "reused": max(0, pool.num_requests - pool.num_connections),
+                "idle": sum(1 for conn in list(pool.pool.queue) if conn) if pool.pool is not None else 0
+            })
+        opened = sum(p["connections_opened"] for p in pools)
+        sent = sum(p["requests"] for p in pools)
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "pool_size": self.pool_size,
+            "timeouts": {"connect": self.connect_timeout, "read": self.read_timeout, "total": self.total_timeout},
+            **counters,
+            "connections_opened": opened,
+            "reuse_rate": round(1 - opened / sent, 4) if sent else 0.0,
+            "pools": pools
+        }
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from workspace import FILE_ESTIMATE, get_workspaces
+
+JOB_WORKERS = int(os.environ.get('PESU_JOB_WORKERS', 2))
+MAX_QUEUED = int(os.environ.get('PESU_JOB_QUEUE_SIZE', 100))
+MAX_PER_USER = int(os.environ.get('PESU_JOB_MAX_PER_USER', 3))
+RESULT_TTL = int(os.environ.get('PESU_JOB_RESULT_TTL', 30 * 60))
+# How often idle workers remove expired results when no new jobs arrive
+SWEEP_INTERVAL = 60
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, user_id, params):
+        self.id = job_id
+        self.user_id = user_id
+        self.params = params
+        self.status = QUEUED
+        self.error = None
+        self.result_path = None
+        self.workspace = None
+        self.temp_dir = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self.cancel_requested = False
+        self._cond = threading.Condition()
+
+    def emit(self, event, **data):
+        with self._cond:
+            data["seq"] = len(self.events)
+            data["event"] = event
+            data["time"] = round(time.time(), 3)
+            self.events.append(data)
+            self._cond.notify_all()
+
+    def set_status(self, status):
+        # Status and its event change together so streams never miss the final event
+        with self._cond:
+            self.status = status
+            if status in FINISHED:
+                self.finished_at = time.time()
+            self.emit("status", status=status, error=self.error)
+
+    def progress(self, stage, **info):
+        """Pipeline callback; also the point where cancellation takes effect."""
+        if self.cancel_requested:
+            raise JobCancelled()
+        self.emit("progress", stage=stage, **info)
+
+    def events_after(self, seq, timeout):
+        """Blocks until there are events with seq > given seq, or timeout."""
+        with self._cond:
+            if len(self.events) <= seq + 1 and self.status not in FINISHED:
+                self._cond.wait(timeout)
+            return self.events[seq + 1:]
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "events": len(self.events)
+        }
+
+
+class JobScheduler:
+    """
+    In-process job broker for download jobs.
+
+    Jobs wait in per-user queues that workers serve round-robin, so one user
+    queueing many downloads cannot starve everyone else. The total queue and
+    each user's outstanding jobs are bounded. Finished results are kept for
+    RESULT_TTL seconds and then removed together with their workspace.
+    """
+
+    def __init__(self, run_job, workers=JOB_WORKERS, max_queued=MAX_QUEUED,
+                 max_per_user=MAX_PER_USER, result_ttl=RESULT_TTL):
+        self.run_job = run_job
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._queues = {}          # user_id -> deque of jobs
+        self._rotation = deque()   # users with queued jobs, in service order
+        self._queued = 0
+        self._lock = threading.Condition()
+        self._threads = []
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, user_id, params):
+        with self._lock:
+            self._collect_expired()
+            if self._queued >= self.max_queued:
+                raise QueueFull("Too many downloads queued, try again shortly")
+            outstanding = sum(1 for j in self._jobs.values() if j.user_id == user_id and j.status not in FINISHED)
+            if outstanding >= self.max_per_user:
+                raise QueueFull(f"At most {self.max_per_user} downloads per user at a time")
+
+            job = Job(os.urandom(12).hex(), user_id, params)
+            job.emit("status", status=QUEUED)
+            self._jobs[job.id] = job
+            if user_id not in self._queues:
+                self._queues[user_id] = deque()
+                self._rotation.append(user_id)
+            self._queues[user_id].append(job)
+            self._queued += 1
+            self._ensure_workers()
+            self._lock.notify()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job):
+        with self._lock:
+            if job.status in FINISHED:
+                return False
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                queue = self._queues.get(job.user_id)
+                if queue is not None and job in queue:
+                    queue.remove(job)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[job.user_id]
+                        self._rotation.remove(job.user_id)
+                self._finish(job, CANCELLED)
+        return True
+
+    def _next_job(self):
+        with self._lock:
+            while not self._rotation:
+                # Expired results would otherwise only go away on the next submit(),
+                # holding their workspace's space until then
+                if not self._lock.wait(max(1, min(SWEEP_INTERVAL, self.result_ttl))):
+                    self._collect_expired()
+            user_id = self._rotation.popleft()
+            queue = self._queues[user_id]
+            job = queue.popleft()
+            if queue:
+                self._rotation.append(user_id)
+            else:
+                del self._queues[user_id]
+            self._queued -= 1
+            job.set_status(RUNNING)
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            try:
+                # Waits here while scratch space is exhausted, so queued jobs don't pile onto a full disk
+                job.workspace = get_workspaces().create(len(job.params.get('files', ())) * FILE_ESTIMATE)
+                job.temp_dir = job.workspace.path
+                job.result_path = self.run_job(job)
+                self._finish(job, DONE)
+            except JobCancelled:
+                self._finish(job, CANCELLED)
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                self._finish(job, FAILED)
+
+    def _finish(self, job, status):
+        if status != DONE and job.workspace:
+            job.workspace.close()
+        job.set_status(status)
+
+    def _collect_expired(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.status in FINISHED and now - job.finished_at > self.result_ttl:
+                if job.workspace:
+                    job.workspace.close()
+                del self._jobs[job_id]
+
+    def stats(self):
+        running = sum(1 for j in self._jobs.values() if j.status == RUNNING)
+        return {
+            "workers": self.workers,
+            "queued": self._queued,
+            "running": running,
+            "users_waiting": len(self._rotation),
+            "tracked": len(self._jobs)
+        }
+
+
+def sse_stream(job, last_seq=-1, heartbeat=15):
+    """Yields Server-Sent Events for a job until it finishes."""
+    seq = last_seq
+    while True:
+        events = job.events_after(seq, heartbeat)
+        if not events:
+            if job.status in FINISHED and seq >= len(job.events) - 1:
+                return
+            yield ": keep-alive\n\n"
+            continue
+        for event in events:
+            seq = event["seq"]
+            yield f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        if job.status in FINISHED and seq >= len(job.events) - 1:
+            return
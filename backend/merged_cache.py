@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from blob_cache import BlobCache, get_blob_cache
+from conversion_cache import converter_version
+
+DEFAULT_ROOT = os.environ.get('PESU_MERGED_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'pesu_merged_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('PESU_MERGED_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+EVICTION_GRACE = 60
+
+
+def class_fingerprint(course_id, class_id, resource_type, require_fresh=False):
+    """
+    Identifies the current source documents of a class from the blob cache:
+    the content hashes of its downloaded files plus the converter versions.
+    Returns None if the class is not cached (or not fresh when required).
+    """
+    blob_cache = get_blob_cache()
+    cached = blob_cache.lookup(BlobCache.key(course_id, class_id, resource_type))
+    if cached is None:
+        return None
+    docs, stored_at = cached
+    if require_fresh and not blob_cache.is_fresh(stored_at):
+        return None
+    payload = json.dumps([[d['sha256'] for d in docs], converter_version('pptx'), converter_version('docx')])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ArtifactWriter:
+    """Tees a streamed merged PDF into the cache, committing only if it completes."""
+
+    def __init__(self, cache, key, meta):
+        self.cache = cache
+        self.key = key
+        self.meta = meta
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.tmp_dir)
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self._file.write(chunk)
+
+    def commit(self, segments):
+        self._file.close()
+        self.cache._commit(self, segments)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class MergedCache:
+    """
+    Materialized merged PDFs per (course, resource_type, ordered class set).
+
+    Each artifact records, per class, the fingerprint of the source it was
+    built from and the page range its segment occupies. An artifact is
+    served as-is while every fingerprint still matches, and a request for a
+    subset of its classes is answered by slicing those page ranges out of it
+    instead of converting again.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.pdf_dir = os.path.join(root, 'pdfs')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.pdf_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._local = threading.local()
+        self.hits = 0
+        self.slices = 0
+        self.builds = 0
+        self.evictions = 0
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "key TEXT PRIMARY KEY, course_id TEXT NOT NULL, resource_type TEXT NOT NULL, "
+            "unit_id TEXT, class_ids TEXT NOT NULL, segments TEXT NOT NULL, "
+            "bytes INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS artifacts_course ON artifacts (course_id, resource_type)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, 'index.sqlite3'), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(course_id, resource_type, class_ids):
+        return hashlib.sha256(f"{course_id}:{resource_type}:{','.join(class_ids)}".encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.pdf_dir, key + '.pdf')
+
+    def find(self, course_id, resource_type, class_ids, fingerprints):
+        """
+        Returns (path, page_ranges) for the requested classes, or None.
+        page_ranges is None when the artifact matches exactly; otherwise it
+        lists the range of pages to slice for each class, in request order.
+        """
+        conn = self._conn()
+        key = self.key(course_id, resource_type, class_ids)
+        rows = conn.execute(
+            "SELECT key, segments FROM artifacts WHERE course_id = ? AND resource_type = ? "
+            "ORDER BY key = ? DESC, accessed_at DESC",
+            (str(course_id), str(resource_type), key)
+        ).fetchall()
+        for row_key, segments_json in rows:
+            segments = {s['class_id']: s for s in json.loads(segments_json)}
+            if any(c not in segments or segments[c]['fingerprint'] != fingerprints.get(c) for c in class_ids):
+                continue
+            path = self.path(row_key)
+            if not os.path.exists(path):
+                conn.execute("DELETE FROM artifacts WHERE key = ?", (row_key,))
+                conn.commit()
+                continue
+            conn.execute("UPDATE artifacts SET accessed_at = ? WHERE key = ?", (time.time(), row_key))
+            conn.commit()
+            if row_key == key:
+                self.hits += 1
+                return path, None
+            self.slices += 1
+            ranges = [range(segments[c]['start'], segments[c]['start'] + segments[c]['count']) for c in class_ids]
+            return path, ranges
+        return None
+
+    def writer(self, course_id, resource_type, class_ids, unit_id=None):
+        meta = {
+            "course_id": str(course_id),
+            "resource_type": str(resource_type),
+            "class_ids": list(class_ids),
+            "unit_id": unit_id
+        }
+        return ArtifactWriter(self, self.key(course_id, resource_type, class_ids), meta)
+
+    def _commit(self, writer, segments):
+        os.replace(writer.tmp_path, self.path(writer.key))
+        now = time.time()
+        meta = writer.meta
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO artifacts (key, course_id, resource_type, unit_id, class_ids, segments, "
+            "bytes, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (writer.key, meta['course_id'], meta['resource_type'], meta['unit_id'],
+             json.dumps(meta['class_ids']), json.dumps(segments),
+             os.path.getsize(self.path(writer.key)), now, now)
+        )
+        conn.commit()
+        self.builds += 1
+        self.evict()
+
+    def total_bytes(self):
+        return self._conn().execute("SELECT COALESCE(SUM(bytes), 0) FROM artifacts").fetchone()[0]
+
+    def evict(self):
+        conn = self._conn()
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        cutoff = time.time() - EVICTION_GRACE
+        victims = []
+        for key, size in conn.execute(
+            "SELECT key, bytes FROM artifacts WHERE accessed_at < ? ORDER BY accessed_at ASC", (cutoff,)
+        ):
+            if total <= self.max_bytes:
+                break
+            victims.append(key)
+            total -= size
+        for key in victims:
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+            conn.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+            self.evictions += 1
+        conn.commit()
+
+    def stats(self):
+        return {
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "slices": self.slices,
+            "builds": self.builds,
+            "evictions": self.evictions
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_merged_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MergedCache()
+        return _cache
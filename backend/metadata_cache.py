@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = int(os.environ.get('PESU_METADATA_TTL', 6 * 60 * 60))
+DEFAULT_STALE_TTL = int(os.environ.get('PESU_METADATA_STALE_TTL', 7 * 24 * 60 * 60))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('PESU_METADATA_MAX_ENTRIES', 5000))
+
+
+class MemoryBackend:
+    """Per-process LRU store. Values are kept as-is."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+            return item
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._data[key] = (value, stored_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    On-disk LRU store shared by every worker pointing at the same file.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, table='cache'):
+        self.path = path
+        self.max_entries = max_entries
+        self.table = table
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at):
+        conn = self._conn()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), stored_at, time.time())
+        )
+        count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        conn.commit()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table}")
+        conn.commit()
+
+    def __len__(self):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def create_backend(kind=None, path=None, max_entries=DEFAULT_MAX_ENTRIES, table='cache'):
+    kind = kind or os.environ.get('PESU_CACHE_BACKEND', 'memory')
+    if kind == 'sqlite':
+        import tempfile
+        path = path or os.environ.get('PESU_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'pesu_cache.sqlite3')
+        return SQLiteBackend(path, max_entries=max_entries, table=table)
+    return MemoryBackend(max_entries=max_entries)
+
+
+class MetadataCache:
+    """
+    TTL cache with stale-while-revalidate.
+
+    Entries younger than ttl are served directly. Entries older than ttl but
+    within ttl + stale_ttl are served immediately while a background thread
+    refreshes them. Anything older is fetched synchronously.
+    """
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL):
+        self.backend = backend if backend is not None else create_backend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Returns the cached value for key, calling fetch() on a miss.
+        Empty results are not cached since they usually mean the upstream
+        session expired rather than that the list is really empty.
+        """
+        item = None
+        try:
+            item = self.backend.get(key)
+        except Exception as e:
+            print(f"Metadata cache read error for {key}: {e}")
+
+        now = time.time()
+        if item is not None:
+            value, stored_at = item
+            age = now - stored_at
+            if age < self.ttl:
+                with self._lock:
+                    self.hits += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                with self._lock:
+                    self.stale_hits += 1
+                self._refresh_in_background(key, fetch)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        value = fetch()
+        self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        if not value:
+            return
+        try:
+            self.backend.set(key, value, time.time())
+        except Exception as e:
+            print(f"Metadata cache write error for {key}: {e}")
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, fetch())
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                print(f"Background refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def stats(self):
+        with self._lock:
+            hits, stale_hits, misses, refresh_errors = self.hits, self.stale_hits, self.misses, self.refresh_errors
+        lookups = hits + stale_hits + misses
+        return {
+            "entries": len(self.backend),
+            "hits": hits,
+            "stale_hits": stale_hits,
+            "misses": misses,
+            "refresh_errors": refresh_errors,
+            "hit_rate": round((hits + stale_hits) / lookups, 4) if lookups else None
+        }
@@ -0,0 +1,305 @@
+import bisect
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+ENABLED = os.environ.get('PESU_METRICS_ENABLED', '1') == '1'
+TRACE = os.environ.get('PESU_TRACE', '0') == '1'
+# Only traces at least this long are logged
+TRACE_MIN_MS = float(os.environ.get('PESU_TRACE_MIN_MS', 0))
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+_INF_LABEL = 'le="+Inf"'
+_ID_SEGMENT = re.compile(r'/[^/]*\d[^/]*')
+
+
+def endpoint(url):
+    """Upstream path with query and id-like segments dropped, so labels stay few."""
+    path = url.split('://', 1)[-1].partition('?')[0]
+    path = path[path.find('/'):] if '/' in path else '/'
+    return _ID_SEGMENT.sub('/:id', path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labels, key)} {_number(v)}" for key, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._values = {}   # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                row[index] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            values = {key: list(row) for key, row in self._values.items()}
+        lines = []
+        for key, row in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels, key, [_INF_LABEL])} {row[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(row[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {row[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Read at scrape time from fn(), which returns a number or a dict of
+    label-value tuples to numbers; nothing is tracked in between. kind may
+    be 'counter' for totals that other modules already keep.
+    """
+
+    def __init__(self, name, help, fn, labels=(), kind="gauge"):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self.kind = kind
+
+    def _samples(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} failed: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_labels(self.labels, key)} {_number(v)}"
+                for key, v in sorted(values.items()) if v is not None]
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Tracing: one record per request (or job) with a span for each stage it went through
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+class Trace:
+    __slots__ = ("id", "name", "attrs", "started", "spans")
+
+    def __init__(self, name, attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.monotonic()
+        self.spans = []
+
+
+def start_trace(name, **attrs):
+    """Makes a new trace current in this context; returns it, or None when tracing is off."""
+    if not TRACE:
+        return None
+    trace = Trace(name, attrs)
+    _current.set(trace)
+    return trace
+
+
+def finish_trace(trace, **attrs):
+    if trace is None:
+        return
+    if _current.get() is trace:
+        _current.set(None)
+    duration = (time.monotonic() - trace.started) * 1000
+    if duration < TRACE_MIN_MS:
+        return
+    record = {"trace": trace.id, "name": trace.name, "duration_ms": round(duration, 1)}
+    record.update(trace.attrs)
+    record.update(attrs)
+    record["spans"] = list(trace.spans)
+    print(json.dumps(record, default=str), flush=True)
+
+
+def current_trace():
+    return _current.get()
+
+
+def adopt(trace):
+    """Makes trace current in this context, e.g. in a task on another thread's event loop."""
+    if trace is not None:
+        _current.set(trace)
+
+
+def propagate(fn):
+    """fn bound to a copy of the caller's context, so spans it records land in the current trace."""
+    if _current.get() is None:
+        return fn
+    return _Bound(contextvars.copy_context(), fn)
+
+
+class _Bound:
+    __slots__ = ("context", "fn")
+
+    def __init__(self, context, fn):
+        self.context = context
+        self.fn = fn
+
+    def __call__(self, *args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return self.context.copy().run(self.fn, *args, **kwargs)
+
+
+def record_span(name, started, duration, **attrs):
+    """Adds an already measured span (monotonic start, seconds) to the current trace."""
+    trace = _current.get()
+    if trace is None:
+        return
+    span = {"name": name, "start_ms": round((started - trace.started) * 1000, 1),
+            "duration_ms": round(duration * 1000, 1)}
+    span.update(attrs)
+    trace.spans.append(span)
+
+
+class _Span:
+    __slots__ = ("name", "histogram", "labels", "attrs", "started")
+
+    def __init__(self, name, histogram, labels, attrs):
+        self.name = name
+        self.histogram = histogram
+        self.labels = labels
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.monotonic() - self.started
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        elif self.histogram is not None:
+            self.histogram.observe(duration, *self.labels)
+        record_span(self.name, self.started, duration, **self.attrs)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, histogram=None, labels=(), **attrs):
+    """
+    Times a stage: observes histogram (with labels) if metrics are on and
+    records a span if a trace is current. When neither applies this
+    returns a shared no-op, so instrumented code pays one call.
+    """
+    if (histogram is None or not ENABLED) and _current.get() is None:
+        return _NULL_SPAN
+    return _Span(name, histogram if ENABLED else None, labels, attrs)
+
+
+def upstream(url, started, latency, status):
+    """Records one upstream attempt; status is the HTTP status or 'error' if none arrived."""
+    if not ENABLED and _current.get() is None:
+        return
+    name = endpoint(url)
+    if latency is not None:
+        UPSTREAM_SECONDS.observe(latency, name)
+    UPSTREAM_RESPONSES.inc(name, str(status))
+    record_span("upstream", started, latency or time.monotonic() - started, endpoint=name, status=status)
+
+
+UPSTREAM_SECONDS = Histogram(
+    "pesu_upstream_request_seconds", "Time to response headers from PESU Academy.", ("endpoint",))
+UPSTREAM_RESPONSES = Counter(
+    "pesu_upstream_responses_total", "Responses from PESU Academy by status.", ("endpoint", "status"))
+DOWNLOAD_BYTES = Counter("pesu_download_bytes_total", "Document bytes downloaded from upstream.")
+CONVERSION_SECONDS = Histogram(
+    "pesu_conversion_seconds", "Office to PDF conversion time (cache misses only).", ("kind",), STAGE_BUCKETS)
+MERGE_SECONDS = Histogram("pesu_merge_seconds", "Time to append one PDF to a merged document.",
+                          buckets=STAGE_BUCKETS)
+PAGES = Counter("pesu_merged_pages_total", "Pages written into merged PDFs.")
+OPTIMIZE_SECONDS = Histogram("pesu_pdf_optimize_seconds", "Time to optimize a merged PDF.", ("quality",),
+                             STAGE_BUCKETS)
+OPTIMIZE_SAVED_BYTES = Counter("pesu_pdf_optimize_saved_bytes_total", "Bytes removed from merged PDFs by optimizing.",
+                               ("quality",))
+REQUEST_SECONDS = Histogram("pesu_http_request_seconds", "Time to handle API requests, until the response starts.",
+                            ("endpoint", "status"), STAGE_BUCKETS)
@@ -0,0 +1,200 @@
+import hashlib
+import io
+import os
+import time
+import zlib
+
+# Named output qualities for merged PDFs: None keeps the merged file as
+# written, otherwise the DPI images are downsampled to (0 = lossless only)
+QUALITIES = {
+    "original": None,
+    "optimized": 0,
+    "ebook": 150,
+    "screen": 72,
+}
+DEFAULT_QUALITY = os.environ.get('PESU_PDF_QUALITY', 'original')
+JPEG_QUALITY = int(os.environ.get('PESU_PDF_JPEG_QUALITY', 75))
+
+# Objects that must stay distinct even when their content is identical
+_UNIQUE_TYPES = {"/Page", "/Pages", "/Catalog", "/Annot"}
+# Only images at least this much larger than needed are resampled
+_DOWNSAMPLE_THRESHOLD = 1.2
+
+
+def optimize_pdf(src_path, dst_path, dpi=0):
+    """
+    Writes an optimized copy of the merged PDF at src_path to dst_path.
+
+    Byte-identical objects are stored once: fonts, images and templates
+    that several appended decks embed, then the dictionaries that pointed
+    at them. Streams are compressed, small objects are packed into object
+    streams, images are downsampled to dpi if given, and the file is
+    linearized so viewers can show the first page before the rest
+    arrives. Returns a dict with the sizes, the time taken and what was
+    changed.
+    """
+    import pikepdf
+
+    started = time.monotonic()
+    with pikepdf.open(src_path) as pdf:
+        duplicates = _dedupe(pdf)
+        downsampled = _downsample(pdf, dpi) if dpi else 0
+        pdf.remove_unreferenced_resources()
+        pdf.save(dst_path, compress_streams=True, object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                 linearize=True)
+    input_bytes = os.path.getsize(src_path)
+    output_bytes = os.path.getsize(dst_path)
+    return {
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "saved_bytes": input_bytes - output_bytes,
+        "ratio": round(output_bytes / input_bytes, 3) if input_bytes else 1.0,
+        "seconds": round(time.monotonic() - started, 3),
+        "duplicates": duplicates,
+        "downsampled": downsampled,
+    }
+
+
+def _dedupe(pdf):
+    """Points every reference at one copy of each identical object; returns how many copies were dropped."""
+    import pikepdf
+
+    stream_hashes = {}
+    dropped = set()
+    while True:
+        canonical = {}
+        remap = {}
+        for obj in pdf.objects:
+            if not isinstance(obj, (pikepdf.Stream, pikepdf.Dictionary)) or obj.objgen in dropped:
+                # Dropped copies are unreferenced now; qpdf leaves them out when saving
+                continue
+            if isinstance(obj, pikepdf.Stream):
+                digest = stream_hashes.get(obj.objgen)
+                if digest is None:
+                    digest = stream_hashes[obj.objgen] = hashlib.sha256(obj.read_raw_bytes()).digest()
+                # The dictionary may refer to objects that were merged in the previous round
+                key = (digest, obj.stream_dict.unparse())
+            elif obj.get("/Type") in _UNIQUE_TYPES:
+                continue
+            else:
+                key = obj.unparse(resolved=True)
+            first = canonical.setdefault(key, obj)
+            if first is not obj:
+                remap[obj.objgen] = first
+        if not remap:
+            return len(dropped)
+        dropped.update(remap)
+        # Objects pointing at merged duplicates may now be identical themselves
+        for obj in pdf.objects:
+            _relink(obj, remap)
+        _relink(pdf.trailer, remap)
+
+
+def _relink(obj, remap):
+    import pikepdf
+
+    if isinstance(obj, pikepdf.Stream):
+        obj = obj.stream_dict
+    if isinstance(obj, pikepdf.Dictionary):
+        items = [(key, obj.get(key)) for key in obj.keys()]
+    elif isinstance(obj, pikepdf.Array):
+        items = list(enumerate(obj))
+    else:
+        return
+    for key, value in items:
+        if not isinstance(value, (pikepdf.Dictionary, pikepdf.Array, pikepdf.Stream)):
+            continue
+        if value.is_indirect:
+            target = remap.get(value.objgen)
+            if target is not None:
+                obj[key] = target
+        else:
+            _relink(value, remap)
+
+
+def _downsample(pdf, dpi):
+    """Resamples images larger than dpi at the size of the largest page they appear on; returns the count."""
+    import pikepdf
+    from PIL import Image
+
+    # Without parsing content streams the drawn size is unknown; an image
+    # shown full-page is the largest case, so this never undershoots the DPI
+    page_inches = {}
+    for page in pdf.pages:
+        box = [float(v) for v in page.mediabox]
+        size = (abs(box[2] - box[0]) / 72, abs(box[3] - box[1]) / 72)
+        for image in _page_images(page):
+            current = page_inches.get(image.objgen, (0, 0))
+            page_inches[image.objgen] = (max(current[0], size[0]), max(current[1], size[1]))
+
+    count = 0
+    for obj in pdf.objects:
+        inches = page_inches.get(obj.objgen) if isinstance(obj, pikepdf.Stream) else None
+        if inches is None:
+            continue
+        try:
+            if _resample(obj, inches, dpi, pikepdf, Image):
+                count += 1
+        except Exception as e:
+            print(f"Skipping image {obj.objgen} in PDF optimization: {e}")
+    return count
+
+
+def _page_images(page):
+    return _resource_images(page.obj.get("/Resources"), set())
+
+
+def _resource_images(resources, seen):
+    import pikepdf
+
+    if not isinstance(resources, pikepdf.Dictionary):
+        return
+    # Spire draws slide pictures through tiling patterns, so those are searched like forms
+    for category in ("/XObject", "/Pattern"):
+        entries = resources.get(category)
+        if not isinstance(entries, pikepdf.Dictionary):
+            continue
+        for key in entries.keys():
+            entry = entries[key]
+            if not isinstance(entry, pikepdf.Stream) or not entry.is_indirect or entry.objgen in seen:
+                continue
+            seen.add(entry.objgen)
+            if entry.get("/Subtype") == "/Image":
+                yield entry
+            else:
+                # Images inside forms and patterns are drawn at most at page size too
+                yield from _resource_images(entry.get("/Resources"), seen)
+
+
+def _resample(image, inches, dpi, pikepdf, Image):
+    if any(key in image for key in ("/SMask", "/Mask", "/ImageMask", "/Decode")):
+        return False
+    if image.get("/BitsPerComponent") != 8:
+        return False
+    width, height = int(image.Width), int(image.Height)
+    target = (max(1, round(inches[0] * dpi)), max(1, round(inches[1] * dpi)))
+    scale = min(target[0] / width, target[1] / height)
+    if scale * _DOWNSAMPLE_THRESHOLD > 1:
+        return False
+
+    pil = pikepdf.PdfImage(image).as_pil_image()
+    if pil.mode not in ("RGB", "L"):
+        return False
+    resized = pil.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+    colorspace = pikepdf.Name.DeviceRGB if resized.mode == "RGB" else pikepdf.Name.DeviceGray
+    if image.get("/Filter") == "/DCTDecode":
+        buffer = io.BytesIO()
+        resized.save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        data, filter_name = buffer.getvalue(), pikepdf.Name.DCTDecode
+    else:
+        # Flat-colour graphics stay lossless
+        data, filter_name = zlib.compress(resized.tobytes(), 6), pikepdf.Name.FlateDecode
+    if len(data) >= len(image.read_raw_bytes()):
+        return False
+    image.write(data, filter=filter_name)
+    image.Width, image.Height = resized.size
+    image.ColorSpace = colorspace
+    image.BitsPerComponent = 8
+    if "/DecodeParms" in image:
+        del image["/DecodeParms"]
+    return True
@@ -1,70 +1,49 @@
-import os
-import requests
-from pypdf import PdfWriter
-import img2pdf
-from spire.presentation import Presentation, FileFormat
-
-def download_file(url, session, output_path):
-    response = session.get(url, stream=True)
-    if response.status_code == 200:
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        return True
-    return False
+import io
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
 
 def repair_pptx(pptx_path):
     """
     Attempts to repair a broken PPTX file by fixing common corruptions like
-    garbage bytes before the PK header or simple truncation.
+    garbage bytes before the PK header.
     Returns True if repaired or valid, False otherwise.
+
+    The PK header is found through mmap and the archive is checked through
+    an offset view of the file, so the deck is never read into memory; only
+    a deck that needs slicing is rewritten, by a kernel-side copy.
     """
     try:
         import zipfile
-        
-        # Check if it's a valid zip first
-        if zipfile.is_zipfile(pptx_path):
+        from file_sniff import OffsetView, find_zip_start, strip_prefix
+
+        pk_offset = find_zip_start(pptx_path)
+        if pk_offset < 0:
+            print(f"Failed to repair {pptx_path}: no PK header")
+            return False
+
+        with open(pptx_path, 'rb') as f:
             try:
-                with zipfile.ZipFile(pptx_path, 'r') as z:
+                with zipfile.ZipFile(OffsetView(f, pk_offset), 'r') as z:
                     if z.testzip() is not None:
                         print(f"Zip file {pptx_path} has corrupted contents")
                         return False
-                return True # Already valid
             except zipfile.BadZipFile:
-                pass # Proceed to repair
-        
-        print(f"Attempting to repair {pptx_path}...")
-        
-        # Read file content
-        with open(pptx_path, 'rb') as f:
-            content = f.read()
-            
-        # 1. Look for PK header
-        pk_offset = content.find(b'PK\x03\x04')
+                # Truncation can't be fixed without recovery tools
+                print(f"Failed to repair {pptx_path}: Invalid zip structure")
+                return False
+
         if pk_offset > 0:
-            print(f"Found PK header at offset {pk_offset}, slicing...")
-            content = content[pk_offset:]
-            with open(pptx_path, 'wb') as f:
-                f.write(content)
-            
-            if zipfile.is_zipfile(pptx_path):
-                print(f"Repair successful: Sliced garbage bytes")
-                return True
-                
-        # 2. Check for unexpected end of file (truncation) - harder to fix without recovery tools
-        # But sometimes valid zips just have trailing garbage or are slightly off.
-        
-        # If we still can't open it as a zip, we can't do much without python-pptx
-        if not zipfile.is_zipfile(pptx_path):
-            print(f"Failed to repair {pptx_path}: Invalid zip structure")
-            return False
-            
+            print(f"Found PK header at offset {pk_offset} in {pptx_path}, slicing...")
+            strip_prefix(pptx_path, pk_offset)
+            print(f"Repair successful: Sliced garbage bytes")
         return True
     except Exception as e:
         print(f"Error repairing PPTX: {e}")
         return False
 
 def convert_pptx_to_pdf(pptx_path, pdf_path):
+    # Spire loads the .NET runtime on import, so only conversion workers pay for it
+    from spire.presentation import Presentation, FileFormat
     try:
         presentation = Presentation()
         presentation.LoadFromFile(pptx_path)
@@ -87,9 +66,9 @@ def convert_pptx_to_pdf(pptx_path, pdf_path):
              
         return False
 
-from spire.doc import Document, FileFormat as DocFileFormat
-
 def convert_docx_to_pdf(docx_path, pdf_path):
+    # Spire loads the .NET runtime on import, so only conversion workers pay for it
+    from spire.doc import Document, FileFormat as DocFileFormat
     try:
         document = Document()
         document.LoadFromFile(docx_path)
@@ -100,13 +79,177 @@ def convert_docx_to_pdf(docx_path, pdf_path):
         print(f"Error converting DOCX: {e}")
         return False
 
-def merge_pdfs(pdf_paths, output_path):
-    merger = PdfWriter()
-    for pdf in pdf_paths:
+class PdfStreamWriter:
+    """
+    Concatenates PDFs into one document while writing it out incrementally.
+
+    Each part is read, its page objects (and everything they reference) are
+    renumbered and serialized straight away, so memory holds one part at a
+    time instead of the whole merged document. add() and finish() return
+    the bytes to append to the output. Outlines and forms of the inputs are
+    not carried over; pages, their content and annotations are.
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+    # Page attributes a page may take from its ancestors in the page tree (PDF 1.7, 7.7.3.4)
+    INHERITABLE = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.parts = 0
+        self._next_id = 3
+
+    def _emit(self, buf, data):
+        buf.write(data)
+        self.offset += len(data)
+
+    def header(self):
+        buf = io.BytesIO()
+        self._emit(buf, b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        return buf.getvalue()
+
+    def add(self, pdf_path, pages=None):
+        """
+        Returns the serialized objects of pdf_path, or b'' if it can't be read.
+        pages optionally selects page indexes (e.g. a range) to copy.
+        """
+        try:
+            reader = PdfReader(pdf_path)
+            if reader.is_encrypted:
+                reader.decrypt("")
+            if pages is None:
+                pages = range(len(reader.pages))
+            page_refs = [reader.pages[i].indirect_reference for i in pages]
+        except Exception as e:
+            print(f"Error appending PDF {pdf_path}: {e}")
+            return b""
+
+        mapping = {}
+        queue = []
+
+        def new_ref(ref):
+            key = (ref.idnum, ref.generation)
+            if key not in mapping:
+                mapping[key] = self._next_id
+                self._next_id += 1
+                queue.append(ref)
+            return mapping[key]
+
+        page_keys = set()
+        new_page_ids = []
+        for ref in page_refs:
+            page_keys.add((ref.idnum, ref.generation))
+            new_page_ids.append(new_ref(ref))
+
+        buf = io.BytesIO()
+        start_offset = self.offset
         try:
-            merger.append(pdf)
+            while queue:
+                ref = queue.pop()
+                obj_id = mapping[(ref.idnum, ref.generation)]
+                obj = ref.get_object()
+                is_page = (ref.idnum, ref.generation) in page_keys
+                # Pages are re-parented to one flat /Pages node, so whatever they
+                # inherited from their old ancestors has to move onto the page itself
+                inherited = self._inherited(obj) if is_page else {}
+                self.offsets[obj_id] = self.offset
+                self._emit(buf, f"{obj_id} 0 obj\n".encode())
+                self._emit(buf, self._serialize(obj, new_ref, is_page, inherited))
+                self._emit(buf, b"\nendobj\n")
         except Exception as e:
-            print(f"Error appending PDF {pdf}: {e}")
-    
-    merger.write(output_path)
-    merger.close()
+            # Drop the whole part rather than emit a document with dangling references
+            print(f"Error appending PDF {pdf_path}: {e}")
+            for obj_id in mapping.values():
+                self.offsets.pop(obj_id, None)
+            self.offset = start_offset
+            return b""
+
+        self.page_ids.extend(new_page_ids)
+        self.parts += 1
+        return buf.getvalue()
+
+    def _inherited(self, page):
+        """Inheritable attributes page lacks, taken from the nearest ancestor that has them."""
+        found = {}
+        node = page.get("/Parent")
+        seen = set()
+        while node is not None:
+            node = node.get_object()
+            if not isinstance(node, DictionaryObject) or id(node) in seen:
+                break
+            seen.add(id(node))
+            for key in self.INHERITABLE:
+                if key not in page and key not in found and key in node:
+                    # Unresolved, so a shared /Resources dictionary stays one object
+                    found[key] = node.raw_get(key)
+            node = node.get("/Parent")
+        return found
+
+    def _serialize(self, obj, new_ref, is_page=False, inherited=None):
+        out = io.BytesIO()
+
+        def write(value):
+            if isinstance(value, IndirectObject):
+                out.write(f"{new_ref(value)} 0 R".encode())
+            elif isinstance(value, DictionaryObject):
+                out.write(b"<<")
+                for key, item in value.items():
+                    if key == "/Length" and isinstance(value, StreamObject):
+                        continue
+                    if is_page and value is obj and key == "/Parent":
+                        continue
+                    out.write(b"\n")
+                    NameObject(key).write_to_stream(out)
+                    out.write(b" ")
+                    write(item)
+                if isinstance(value, StreamObject):
+                    out.write(f"\n/Length {len(value._data)}".encode())
+                if is_page and value is obj:
+                    out.write(f"\n/Parent {self.PAGES_ID} 0 R".encode())
+                    for key, item in (inherited or {}).items():
+                        out.write(b"\n")
+                        NameObject(key).write_to_stream(out)
+                        out.write(b" ")
+                        write(item)
+                out.write(b"\n>>")
+                if isinstance(value, StreamObject):
+                    out.write(b"\nstream\n")
+                    out.write(value._data)
+                    out.write(b"\nendstream")
+            elif isinstance(value, ArrayObject):
+                out.write(b"[")
+                for i, item in enumerate(value):
+                    if i:
+                        out.write(b" ")
+                    write(item)
+                out.write(b"]")
+            else:
+                value.write_to_stream(out)
+
+        write(obj)
+        return out.getvalue()
+
+    def finish(self):
+        """Returns the page tree, catalog, xref table and trailer."""
+        buf = io.BytesIO()
+
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.offsets[self.PAGES_ID] = self.offset
+        self._emit(buf, f"{self.PAGES_ID} 0 obj\n<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>\nendobj\n".encode())
+        self.offsets[self.CATALOG_ID] = self.offset
+        self._emit(buf, f"{self.CATALOG_ID} 0 obj\n<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>\nendobj\n".encode())
+
+        xref_offset = self.offset
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            if obj_id in self.offsets:
+                lines.append(f"{self.offsets[obj_id]:010d} 00000 n \n")
+            else:
+                lines.append("0000000000 65535 f \n")
+        lines.append(f"trailer\n<< /Size {size} /Root {self.CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self._emit(buf, "".join(lines).encode())
+        return buf.getvalue()
@@ -0,0 +1,311 @@
+import concurrent.futures
+import contextlib
+import os
+import re
+import threading
+
+import metrics
+from conversion_cache import get_conversion_cache
+from conversion_pool import WORKERS as CONVERSION_WORKERS, convert_docx_to_pdf, convert_pptx_to_pdf
+from file_sniff import sniff, strip_prefix
+from merged_cache import class_fingerprint, get_merged_cache
+from pdf_optimize import QUALITIES, optimize_pdf
+from pdf_utils import PdfStreamWriter
+from workspace import charge, charge_file, refresh
+
+
+class PipelineError(Exception):
+    pass
+
+
+def _no_progress(stage, **info):
+    pass
+
+
+def safe_name(name):
+    # Sanitize filename
+    return re.sub(r'[^\w\-_.]', '_', name)
+
+
+def output_filename(course_name, unit_name):
+    return f"{safe_name(course_name)}_{safe_name(unit_name)}.pdf"
+
+
+def detect_type(path):
+    """Returns 'pdf', 'pptx', 'docx' or 'zip' from a downloaded file's content, or None."""
+    return sniff(path)[0]
+
+
+def process_file(file_info, download_result, progress=_no_progress):
+    """Turns one class's downloaded files into PDFs, converting Office documents."""
+    name = file_info.get('name', 'unknown')
+    success, final_paths = download_result
+    conversions = get_conversion_cache()
+
+    processed_pdfs = []
+
+    if success:
+        for final_path in final_paths:
+            print(f"Successfully downloaded to {final_path}")
+            charge_file(final_path)
+            kind, zip_offset = sniff(final_path)
+
+            if kind == 'pdf':
+                new_path = final_path + ".pdf"
+                os.rename(final_path, new_path)
+                processed_pdfs.append(new_path)
+            elif kind in ('pptx', 'docx'):
+                source_path = f"{final_path}.{kind}"
+                os.rename(final_path, source_path)
+                if zip_offset:
+                    # Junk before the archive (e.g. an error page prepended upstream) makes the converters fail
+                    print(f"Stripping {zip_offset} bytes before the {kind} data in {name}")
+                    try:
+                        strip_prefix(source_path, zip_offset)
+                    except OSError as e:
+                        print(f"Error stripping {name}: {e}")
+                pdf_path = source_path[:-len(kind)] + 'pdf'
+                convert_fn = convert_pptx_to_pdf if kind == 'pptx' else convert_docx_to_pdf
+                progress("convert", name=name, status="started")
+                converted = False
+                try:
+                    with metrics.span("convert", kind=kind, file=name):
+                        converted = conversions.convert(source_path, pdf_path, kind, convert_fn)
+                except Exception as e:
+                    print(f"Error converting {name}: {e}")
+                if converted:
+                    # Outside the try: running out of scratch space fails the job rather than this file
+                    charge_file(pdf_path)
+                    processed_pdfs.append(pdf_path)
+            elif kind == 'zip':
+                # Fallback or unknown zip
+                print(f"Unknown zip content for {name}")
+            else:
+                print(f"File {name} is not a PDF or Office file")
+    else:
+        print(f"Failed to download {name}")
+
+    progress("convert", name=name, status="done" if processed_pdfs else "failed", pdfs=len(processed_pdfs))
+    return processed_pdfs
+
+
+def iter_class_pdfs(client, course_id, files, resource_type, temp_dir, progress=_no_progress):
+    """
+    Yields (file_info, pdf_paths) in the order of files.
+
+    Downloads run concurrently and each file is handed to the conversion
+    pool the moment its download lands, so converting file 1 overlaps
+    downloading file 2. A file is yielded as soon as it and every file
+    before it are ready. Closing the generator early stops the downloads
+    and waits for conversions already running, so nothing writes into
+    temp_dir once it returns.
+    """
+    download_items = []
+    for file_info in files:
+        class_id = file_info.get('classId')
+        print(f"Downloading file: {file_info.get('name', 'unknown')} (Class ID: {class_id}, Type: {resource_type})")
+        download_items.append((course_id, class_id, os.path.join(temp_dir, f"{class_id}_temp"), resource_type))
+
+    ready = [concurrent.futures.Future() for _ in files]
+    # Conversions run in the process pool, which applies its own memory-aware admission,
+    # so these threads only wait on it
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(2, CONVERSION_WORKERS))
+    stopped = threading.Event()
+
+    def convert(index, download_result):
+        if stopped.is_set():
+            ready[index].cancel()
+            return
+        try:
+            ready[index].set_result(process_file(files[index], download_result, progress))
+        except BaseException as e:
+            ready[index].set_exception(e)
+
+    def produce():
+        try:
+            progress("download", status="started", files=len(download_items))
+            with metrics.span("download", files=len(download_items)):
+                # Closing the downloads cancels the rest of the batch
+                with contextlib.closing(client.iter_downloads(download_items)) as downloads:
+                    for index, result in downloads:
+                        if stopped.is_set():
+                            break
+                        progress("download", name=files[index].get('name', 'unknown'),
+                                 status="done" if result[0] else "failed")
+                        executor.submit(metrics.propagate(convert), index, result)
+        except BaseException as e:
+            for future in ready:
+                if not future.done():
+                    future.set_exception(e)
+
+    producer = threading.Thread(target=metrics.propagate(produce), name="pipeline-downloads", daemon=True)
+    producer.start()
+    try:
+        for file_info, future in zip(files, ready):
+            yield file_info, future.result()
+    finally:
+        # The caller removes temp_dir next (e.g. a client that disconnected mid-stream), so
+        # downloads and conversions still writing into it are stopped or waited for first
+        stopped.set()
+        producer.join()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_merged_pdf(client, course_id, files, resource_type, temp_dir, progress=_no_progress, segments=None):
+    """
+    Yields the merged PDF as byte chunks, appending each class in order as
+    soon as it is ready. Raises PipelineError before yielding anything if no
+    file could be downloaded and converted. If a segments list is given, the
+    page range each class ended up in is appended to it.
+    """
+    writer = PdfStreamWriter()
+    # Taken up front so object offsets account for it; only sent once a part succeeds
+    header = writer.header()
+    started = False
+    for file_info, pdfs in iter_class_pdfs(client, course_id, files, resource_type, temp_dir, progress):
+        start = len(writer.page_ids)
+        for pdf in pdfs:
+            pages = len(writer.page_ids)
+            with metrics.span("merge", metrics.MERGE_SECONDS) as span:
+                data = writer.add(pdf)
+                span.set(pages=len(writer.page_ids) - pages)
+            metrics.PAGES.inc(amount=len(writer.page_ids) - pages)
+            if not data:
+                continue
+            if not started:
+                started = True
+                yield header
+            yield data
+        if segments is not None:
+            segments.append({"class_id": str(file_info.get('classId')), "start": start,
+                             "count": len(writer.page_ids) - start})
+        if pdfs:
+            progress("merge", name=file_info.get('name', 'unknown'), status="done", pages=len(writer.page_ids))
+
+    if not started:
+        raise PipelineError("Failed to download or convert any files")
+    yield writer.finish()
+
+
+def _iter_file(path, chunk_size=256 * 1024):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            yield chunk
+
+
+def _iter_slices(path, page_ranges):
+    writer = PdfStreamWriter()
+    yield writer.header()
+    for pages in page_ranges:
+        yield writer.add(path, pages)
+    yield writer.finish()
+
+
+def iter_unit_pdf(client, course_id, files, resource_type, temp_dir, progress=_no_progress, unit_id=None):
+    """
+    Merged PDF for a unit, served from the materialized merged cache when possible.
+
+    If every selected class is fresh in the document cache and a merged
+    artifact was built from exactly those sources, it is streamed as-is (or
+    the requested classes are sliced out of a larger one) without touching
+    upstream. Otherwise the pipeline runs, reusing cached conversions for
+    unchanged classes, and its output is stored as the new artifact.
+    """
+    merged_cache = get_merged_cache()
+    class_ids = [str(f.get('classId')) for f in files]
+
+    fingerprints = {c: class_fingerprint(course_id, c, resource_type, require_fresh=True) for c in class_ids}
+    if all(fingerprints.values()):
+        found = merged_cache.find(course_id, resource_type, class_ids, fingerprints)
+        if found is not None:
+            path, page_ranges = found
+            progress("merge", status="cached", sliced=page_ranges is not None)
+            if page_ranges is None:
+                yield from _iter_file(path)
+            else:
+                yield from _iter_slices(path, page_ranges)
+            return
+
+    segments = []
+    artifact = merged_cache.writer(course_id, resource_type, class_ids, unit_id)
+    try:
+        for chunk in iter_merged_pdf(client, course_id, files, resource_type, temp_dir, progress, segments):
+            artifact.write(chunk)
+            yield chunk
+    except BaseException:
+        artifact.abort()
+        raise
+
+    # Only a complete artifact is worth keeping; a class that failed should be retried next time
+    if any(s['count'] == 0 for s in segments):
+        artifact.abort()
+        return
+    for segment in segments:
+        segment['fingerprint'] = class_fingerprint(course_id, segment['class_id'], resource_type)
+    if not all(s['fingerprint'] for s in segments):
+        artifact.abort()
+        return
+    try:
+        artifact.commit(segments)
+    except Exception as e:
+        print(f"Failed to store merged PDF: {e}")
+        artifact.abort()
+
+
+def optimize_output(path, quality, progress=_no_progress):
+    """
+    Replaces the merged PDF at path with its optimized form for quality
+    (see pdf_optimize.QUALITIES). Returns the optimization stats, or None
+    if the quality keeps the file as merged or optimizing failed, in which
+    case the file is left untouched.
+    """
+    dpi = QUALITIES[quality]
+    if dpi is None:
+        return None
+    optimized_path = path + ".optimized"
+    progress("optimize", status="started", quality=quality)
+    try:
+        with metrics.span("optimize", metrics.OPTIMIZE_SECONDS, (quality,), quality=quality) as span:
+            stats = optimize_pdf(path, optimized_path, dpi)
+            span.set(saved_bytes=stats["saved_bytes"])
+        charge_file(optimized_path)
+    except Exception as e:
+        print(f"Error optimizing {path}, keeping it as merged: {e}")
+        if os.path.exists(optimized_path):
+            os.remove(optimized_path)
+        refresh(path)
+        progress("optimize", status="failed")
+        return None
+    if stats["saved_bytes"] > 0:
+        os.replace(optimized_path, path)
+    else:
+        # Nothing to gain (e.g. already compact scans); never send a bigger file
+        os.remove(optimized_path)
+        stats.update(output_bytes=stats["input_bytes"], saved_bytes=0, ratio=1.0)
+    # Only one of the two copies is left
+    refresh(path)
+    metrics.OPTIMIZE_SAVED_BYTES.inc(quality, amount=stats["saved_bytes"])
+    progress("optimize", status="done", **stats)
+    return stats
+
+
+def build_merged_pdf(client, course_id, files, resource_type, course_name, unit_name, temp_dir,
+                     progress=_no_progress, unit_id=None, quality="original"):
+    """
+    Runs fetch -> convert -> merge for the selected classes and returns the
+    path of the merged PDF inside temp_dir, optimized for quality. progress(stage, **info)
+    is called as work completes and may raise to abort the pipeline.
+    """
+    output_path = os.path.join(temp_dir, output_filename(course_name, unit_name))
+    try:
+        with open(output_path, 'wb') as f:
+            for chunk in iter_unit_pdf(client, course_id, files, resource_type, temp_dir, progress, unit_id):
+                charge(output_path, len(chunk))
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    progress("merge", status="done", bytes=os.path.getsize(output_path))
+    optimize_output(output_path, quality, progress)
+    return output_path
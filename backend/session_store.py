@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metadata_cache import create_backend
+from pesu_client import PESUClient
+
+DEFAULT_MAX_SESSIONS = int(os.environ.get('PESU_MAX_SESSIONS', 200))
+DEFAULT_IDLE_TIMEOUT = int(os.environ.get('PESU_SESSION_IDLE_TIMEOUT', 30 * 60))
+DEFAULT_COOKIE_TTL = int(os.environ.get('PESU_SESSION_COOKIE_TTL', 12 * 60 * 60))
+
+
+class SessionStore:
+    """
+    Keeps live PESUClient instances per user with LRU and idle eviction.
+
+    Evicted clients have their requests.Session closed, but their cookie
+    jar is persisted to the backend first (in-process memory or SQLite via
+    PESU_SESSION_BACKEND=sqlite), so the next request from that user
+    rebuilds the client without logging in again, even in another worker.
+    """
+
+    def __init__(self, backend=None, max_sessions=DEFAULT_MAX_SESSIONS,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, cookie_ttl=DEFAULT_COOKIE_TTL):
+        if backend is None:
+            backend = create_backend(
+                kind=os.environ.get('PESU_SESSION_BACKEND'),
+                path=os.environ.get('PESU_SESSION_PATH'),
+                max_entries=max(max_sessions * 10, 1000),
+                table='sessions'
+            )
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.cookie_ttl = cookie_ttl
+        self._live = OrderedDict()   # user_id -> (client, last_used)
+        self._lock = threading.Lock()
+        self.restored = 0
+        self.evicted = 0
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            evicted = self._sweep(now)
+            item = self._live.get(user_id)
+            if item is not None:
+                self._live[user_id] = (item[0], now)
+                self._live.move_to_end(user_id)
+                client = item[0]
+            else:
+                client = self._restore(user_id)
+                self._live[user_id] = (client, now)
+                evicted += self._trim()
+        for evicted_id, evicted_client in evicted:
+            self._close(evicted_id, evicted_client)
+        return client
+
+    def save(self, user_id, client=None):
+        """Persist the client's cookie jar, e.g. right after a successful login."""
+        if client is None:
+            item = self._live.get(user_id)
+            if item is None:
+                return
+            client = item[0]
+        try:
+            self.backend.set(user_id, client.export_cookies(), time.time())
+        except Exception as e:
+            print(f"Failed to persist session {user_id}: {e}")
+
+    def discard(self, user_id):
+        with self._lock:
+            item = self._live.pop(user_id, None)
+        if item is not None:
+            item[0].close()
+        self.backend.delete(user_id)
+
+    def _restore(self, user_id):
+        client = PESUClient()
+        try:
+            item = self.backend.get(user_id)
+        except Exception as e:
+            print(f"Failed to read persisted session {user_id}: {e}")
+            item = None
+        if item is not None:
+            cookies, stored_at = item
+            if time.time() - stored_at < self.cookie_ttl:
+                client.load_cookies(cookies)
+                self.restored += 1
+            else:
+                self.backend.delete(user_id)
+        return client
+
+    def _sweep(self, now):
+        evicted = []
+        while self._live:
+            user_id, (client, last_used) = next(iter(self._live.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            self._live.popitem(last=False)
+            evicted.append((user_id, client))
+        return evicted
+
+    def _trim(self):
+        evicted = []
+        while len(self._live) > self.max_sessions:
+            user_id, (client, _) = self._live.popitem(last=False)
+            evicted.append((user_id, client))
+        return evicted
+
+    def _close(self, user_id, client):
+        self.evicted += 1
+        self.save(user_id, client)
+        client.close()
+
+    def __len__(self):
+        return len(self._live)
+
+    def stats(self):
+        return {
+            "live": len(self._live),
+            "max_sessions": self.max_sessions,
+            "restored": self.restored,
+            "evicted": self.evicted
+        }
@@ -0,0 +1,68 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+
+    The first caller for a key (the leader) runs the function; everyone who
+    asks for the same key while it is running waits and receives the same
+    result or exception. Once the call finishes the key is forgotten, so
+    later callers trigger a fresh call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.executions += 1
+            return call, True
+
+    def _run(self, key, call, leader, fn):
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+    def do(self, key, fn):
+        """Returns (result, shared) where shared is True for callers that did not run fn."""
+        call, leader = self._join(key)
+        self._run(key, call, leader, fn)
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced
+        }
+
+
+# Shared by every PESUClient in the process
+upstream_flight = SingleFlight()
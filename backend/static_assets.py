@@ -0,0 +1,203 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+import sys
+import threading
+
+from flask import Response, request, send_file
+from werkzeug.security import safe_join
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+INDEX = 'index.html'
+
+# Vite writes bundles as assets/<name>-<8 character content hash>.<ext>, so
+# their content never changes under the same URL
+_HASHED = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Everything else (index.html, files from public/) is revalidated with its ETag
+REVALIDATE = 'no-cache'
+
+# Pre-compressed variants in order of preference, stored next to the file
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE = {'.html', '.js', '.mjs', '.css', '.json', '.map', '.svg', '.txt', '.xml', '.webmanifest', '.ico',
+                '.wasm'}
+# A variant is only kept if it saves at least this fraction of the file
+MIN_SAVING = 0.05
+
+
+class _Asset:
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = f"{key[0]:x}-{key[1]:x}"
+
+
+class _Page:
+    def __init__(self, key, body, variants):
+        self.key = key
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        # encoding (None for identity) -> bytes
+        self.bodies = {None: body, **variants}
+
+
+class StaticAssets:
+    """
+    Serves the frontend build. Files under assets/ carry a content hash
+    in their name and are cached by browsers for a year without
+    revalidation; other files are revalidated with an ETag. Each request
+    gets the smallest pre-built variant (.br, .gz) the client accepts, and
+    file bodies are handed to the server's wsgi.file_wrapper, which sends
+    them with sendfile(2) under gunicorn. index.html, served for / and
+    every client-side route, is kept in memory with its compressed forms.
+    Files are stat'ed per request, so a rebuilt frontend is picked up
+    without a restart.
+    """
+
+    def __init__(self, directory=STATIC_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._index = None
+
+    def send(self, filename):
+        """Response for filename under the build directory, or None if there is no such file."""
+        if filename == INDEX:
+            return self.send_index()
+        path = safe_join(self.directory, filename)
+        if path is None:
+            return None
+        asset = self._asset(filename, path)
+        if asset is None:
+            return None
+        # Looked up per request, so variants written after the first request are used
+        variants = {encoding: path + suffix for encoding, suffix in ENCODINGS
+                    if _fresh_variant(path + suffix, asset.key)}
+        encoding = _choose(variants)
+        response = send_file(variants[encoding] if encoding else asset.path, mimetype=asset.mimetype,
+                             etag=f"{asset.etag}-{encoding}" if encoding else asset.etag, conditional=True)
+        response.headers['Cache-Control'] = IMMUTABLE if _HASHED.match(filename) else REVALIDATE
+        if variants:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def send_index(self):
+        """index.html from memory, or None if the frontend has not been built."""
+        page = self._page()
+        if page is None:
+            return None
+        encoding = _choose(page.bodies)
+        response = Response(page.bodies[encoding], mimetype='text/html')
+        response.set_etag(f"{page.etag}-{encoding}" if encoding else page.etag)
+        response.headers['Cache-Control'] = REVALIDATE
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response.make_conditional(request)
+
+    def _asset(self, filename, path):
+        key = _stat_key(path)
+        if key is None:
+            return None
+        with self._lock:
+            asset = self._assets.get(filename)
+        if asset is None or asset.key != key:
+            asset = _Asset(path, key)
+            with self._lock:
+                self._assets[filename] = asset
+        return asset
+
+    def _page(self):
+        path = os.path.join(self.directory, INDEX)
+        key = _stat_key(path)
+        if key is None:
+            return None
+        page = self._index
+        if page is None or page.key != key:
+            with open(path, 'rb') as f:
+                body = f.read()
+            variants = {}
+            for encoding, suffix in ENCODINGS:
+                if _fresh_variant(path + suffix, key):
+                    with open(path + suffix, 'rb') as f:
+                        variants[encoding] = f.read()
+            # It is small enough to compress here when the build was not pre-compressed
+            variants.setdefault('gzip', gzip.compress(body, compresslevel=9, mtime=0))
+            page = self._index = _Page(key, body, variants)
+        return page
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _fresh_variant(path, key):
+    # Variants older than their source are left over from a previous build
+    try:
+        return os.stat(path).st_mtime_ns >= key[0]
+    except OSError:
+        return False
+
+
+def _choose(variants):
+    accepted = request.accept_encodings
+    for encoding, _ in ENCODINGS:
+        if encoding in variants and accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+def precompress(directory=STATIC_DIR):
+    """
+    Writes .gz and, if the brotli package is installed, .br copies of every
+    compressible file in the build at maximum compression. Run once after
+    building the frontend (the Docker image does); returns the number of
+    variants written.
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("brotli is not installed, writing gzip variants only")
+    compressors = {'.gz': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['.br'] = lambda data: brotli.compress(data, quality=11)
+
+    written = 0
+    original_bytes = compressed_bytes = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+                continue
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for suffix, compress in compressors.items():
+                compressed = compress(data)
+                if len(compressed) > len(data) * (1 - MIN_SAVING):
+                    # Not worth a variant; drop one left by an earlier build
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                    continue
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                written += 1
+                original_bytes += len(data)
+                compressed_bytes += len(compressed)
+    print(f"Wrote {written} compressed variants in {directory}: {original_bytes} -> {compressed_bytes} bytes")
+    return written
+
+
+if __name__ == '__main__':
+    precompress(sys.argv[1] if len(sys.argv) > 1 else STATIC_DIR)
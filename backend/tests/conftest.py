@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Caches, workspaces and logs default to the temp directory; keep them out of the real one
+os.environ['TMPDIR'] = tempfile.mkdtemp(prefix="pesu_tests_")
+tempfile.tempdir = None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.handle_request_with(self)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, status=200, content_type='text/html', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server():
+    """
+    Starts local HTTP servers for a test: stub_server(handle) calls
+    handle(request) for every request, where request is a StubHandler,
+    and returns the server's base URL.
+    """
+    servers = []
+
+    def start(handle):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        server.daemon_threads = True
+        server.handle_request_with = handle
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
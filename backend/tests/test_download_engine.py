@@ -0,0 +1,122 @@
+import hashlib
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import pesu_client
+from download_engine import DownloadEngine
+from pesu_client import PESUClient
+
+
+@pytest.fixture(scope='module')
+def engine():
+    # One engine for the module, as the app has; each keeps a connection pool on its own loop
+    engine = DownloadEngine()
+    yield engine
+
+    async def close():
+        await engine._connector.close()
+
+    engine.run(close())
+
+
+def _query(request):
+    return {k: v[0] for k, v in parse_qs(urlsplit(request.path).query).items()}
+
+
+def test_same_content_disposition_name_does_not_collide(engine, stub_server, monkeypatch, tmp_path):
+    def handle(request):
+        class_id = _query(request)['unitid']
+        # Every class sends its slides under the same file name
+        request.send_body(f"%PDF-1.4 class {class_id}".encode(), content_type='application/pdf',
+                          headers={'Content-Disposition': 'attachment; filename="Lecture.pdf"'})
+
+    monkeypatch.setattr(pesu_client, 'BASE_URL', stub_server(handle) + "/Academy")
+    items = [("30001", class_id, str(tmp_path / f"{class_id}_temp"), "2") for class_id in ("301", "302", "303")]
+    results = engine.download_many(PESUClient(), items)
+
+    paths = [path for success, paths in results for path in paths]
+    assert all(success for success, _ in results)
+    assert len(set(paths)) == 3
+    for (_, class_id, _, _), (_, (path,)) in zip(items, results):
+        assert os.path.basename(path).endswith("Lecture.pdf")
+        with open(path, 'rb') as f:
+            assert f.read() == f"%PDF-1.4 class {class_id}".encode()
+
+
+def _serve_with_cut(document, cut_at):
+    """
+    Handler serving document() -> (body, etag) with Range/If-Range support.
+    The first response drops the connection after cut_at bytes of the body.
+    Records (Range, If-Range, status) for every request.
+    """
+    seen = []
+
+    def handle(request):
+        body, etag = document()
+        requested = request.headers.get('Range')
+        if requested and request.headers.get('If-Range') == etag:
+            first = int(requested.split('=')[1].rstrip('-'))
+            seen.append((requested, request.headers.get('If-Range'), 206))
+            request.send_body(body[first:], status=206, content_type='application/pdf',
+                              headers={'ETag': etag, 'Content-Range': f"bytes {first}-{len(body) - 1}/{len(body)}"})
+            return
+        seen.append((requested, request.headers.get('If-Range'), 200))
+        if len(seen) > 1:
+            request.send_body(body, content_type='application/pdf', headers={'ETag': etag})
+            return
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/pdf')
+        request.send_header('Content-Length', str(len(body)))
+        request.send_header('ETag', etag)
+        request.end_headers()
+        request.wfile.write(body[:cut_at])
+        # Lets the client read what was sent; aiohttp drops buffered bytes once the connection errors
+        time.sleep(0.2)
+        request.close_connection = True
+
+    return handle, seen
+
+
+def _download_one(engine, monkeypatch, base, class_id, tmp_path):
+    monkeypatch.setattr(pesu_client, 'BASE_URL', base + "/Academy")
+    [(success, paths)] = engine.download_many(PESUClient(), [("30002", class_id, str(tmp_path / class_id), "2")])
+    assert success
+    with open(paths[0], 'rb') as f:
+        return f.read()
+
+
+def test_cut_transfer_resumes_with_range_into_an_identical_blob(engine, stub_server, monkeypatch, tmp_path):
+    body = b"%PDF-1.4\n" + os.urandom(256 * 1024)
+    handle, seen = _serve_with_cut(lambda: (body, '"v1"'), cut_at=100 * 1024)
+    resumed = engine.resumed
+
+    downloaded = _download_one(engine, monkeypatch, stub_server(handle), "311", tmp_path)
+
+    # The resume starts wherever the bytes written to the part ended
+    assert [status for _, _, status in seen] == [200, 206]
+    assert seen[1][1] == '"v1"'
+    assert 0 < int(seen[1][0].split('=')[1].rstrip('-')) <= 100 * 1024
+    assert engine.resumed == resumed + 1
+    assert hashlib.sha256(downloaded).digest() == hashlib.sha256(body).digest()
+
+
+def test_changed_validator_restarts_the_download_from_zero(engine, stub_server, monkeypatch, tmp_path):
+    original = (b"%PDF-1.4\n" + os.urandom(256 * 1024), '"v1"')
+    replaced = (b"%PDF-1.4\n" + os.urandom(200 * 1024), '"v2"')
+    requests_served = []
+
+    def document():
+        # The document is replaced while the client is reconnecting
+        requests_served.append(None)
+        return original if len(requests_served) == 1 else replaced
+
+    handle, seen = _serve_with_cut(document, cut_at=100 * 1024)
+    downloaded = _download_one(engine, monkeypatch, stub_server(handle), "312", tmp_path)
+
+    # If-Range no longer matches, so upstream sends the new document whole
+    assert [status for _, _, status in seen] == [200, 200]
+    assert seen[1][0].startswith("bytes=") and seen[1][1] == '"v1"'
+    assert downloaded == replaced[0]
@@ -0,0 +1,72 @@
+import io
+
+from pypdf import PdfReader
+
+from pdf_utils import PdfStreamWriter
+
+
+def _write_pdf(path, objects):
+    """Writes objects (bytes, numbered from 1, the first being the catalog) as a PDF file."""
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    path.write_bytes(out.getvalue())
+
+
+def _content(text):
+    data = b"BT /F1 24 Tf 72 720 Td (%s) Tj ET" % text
+    return b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data)
+
+
+def _merge(*paths):
+    writer = PdfStreamWriter()
+    data = writer.header() + b"".join(writer.add(str(path)) for path in paths) + writer.finish()
+    return PdfReader(io.BytesIO(data))
+
+
+def test_pages_keep_attributes_inherited_from_the_page_tree(tmp_path):
+    # MediaBox, Rotate and Resources only on the root /Pages node, as some generators write them
+    inherited = tmp_path / "inherited.pdf"
+    _write_pdf(inherited, [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 /MediaBox [0 0 612 792] /Rotate 90"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Type /Page /Parent 2 0 R /Contents 4 0 R >>",
+        _content(b"Hello"),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ])
+    # Two levels: the nearest ancestor wins, and the page's own values are kept
+    nested = tmp_path / "nested.pdf"
+    _write_pdf(nested, [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 2 /MediaBox [0 0 100 100] /CropBox [0 0 90 90] >>",
+        b"<< /Type /Pages /Parent 2 0 R /Kids [4 0 R 5 0 R] /Count 2 /MediaBox [0 0 842 595] /Resources 8 0 R >>",
+        b"<< /Type /Page /Parent 3 0 R /Contents 6 0 R >>",
+        b"<< /Type /Page /Parent 3 0 R /Contents 7 0 R /MediaBox [0 0 200 200] >>",
+        _content(b"First"),
+        _content(b"Second"),
+        b"<< /Font << /F1 9 0 R >> >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ])
+
+    pages = _merge(inherited, nested).pages
+
+    assert len(pages) == 3
+    assert list(pages[0]["/MediaBox"]) == [0, 0, 612, 792]
+    assert pages[0]["/Rotate"] == 90
+    assert "Hello" in pages[0].extract_text()
+    assert list(pages[1]["/MediaBox"]) == [0, 0, 842, 595]
+    assert list(pages[1]["/CropBox"]) == [0, 0, 90, 90]
+    assert "First" in pages[1].extract_text()
+    assert list(pages[2]["/MediaBox"]) == [0, 0, 200, 200]
+    assert "Second" in pages[2].extract_text()
+    # The shared resources dictionary is still one object
+    assert pages[1].raw_get("/Resources") == pages[2].raw_get("/Resources")
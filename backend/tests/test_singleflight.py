@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pesu_client
+from pesu_client import PESUClient
+from singleflight import SingleFlight
+
+
+def test_concurrent_unit_requests_hit_upstream_once(stub_server, monkeypatch):
+    hits = []
+    lock = threading.Lock()
+
+    def handle(request):
+        with lock:
+            hits.append(request.path)
+        # Long enough for every caller to arrive while the first request is in flight
+        time.sleep(0.3)
+        request.send_body(b'<option value="101">Unit 1</option><option value="102">Unit 2</option>')
+
+    monkeypatch.setattr(pesu_client, 'BASE_URL', stub_server(handle))
+    callers = 20
+    start = threading.Barrier(callers)
+    results = [None] * callers
+
+    def call(index):
+        client = PESUClient()
+        start.wait()
+        results[index] = client.get_units("20001")
+
+    threads = [threading.Thread(target=call, args=(n,)) for n in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert hits == ["/a/i/getCourse/20001"]
+    assert all(result == results[0] for result in results)
+    assert [unit["unitId"] for unit in results[0]] == ["101", "102"]
+
+
+def test_errors_are_shared_and_keys_are_forgotten():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    errors = []
+
+    def failing():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    def call():
+        try:
+            flight.do("key", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.coalesced < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(errors) == 5
+    # The key is forgotten once the call finishes, so the next caller runs again
+    assert flight.do("key", lambda: 42) == (42, False)
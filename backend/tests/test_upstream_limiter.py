@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from http_transport import Transport
+from upstream_limiter import BULK, INTERACTIVE, AdaptiveLimiter, LimiterTimeout
+
+
+def _run(count, target):
+    threads = [threading.Thread(target=target, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_token_bucket_caps_the_request_rate(stub_server):
+    arrivals = []
+    lock = threading.Lock()
+
+    def handle(request):
+        with lock:
+            arrivals.append(time.monotonic())
+        request.send_body(b'ok')
+
+    base = stub_server(handle)
+    rate = 20
+    transport = Transport(limiter=AdaptiveLimiter(rate=rate, burst=1, initial=8), retries=0)
+    session = transport.session()
+    requests_sent = 21
+
+    def call(n):
+        assert session.get(f"{base}/{n}").status_code == 200
+
+    _run(requests_sent, call)
+
+    assert len(arrivals) == requests_sent
+    # The first request spends the burst token, each later one waits for a refill
+    observed = (requests_sent - 1) / (arrivals[-1] - arrivals[0])
+    assert rate * 0.7 < observed <= rate * 1.1
+
+
+def test_overload_cuts_the_limit_and_healthy_responses_grow_it(stub_server):
+    statuses = {'/busy': 503, '/throttled': 429}
+    concurrent = peak = 0
+    lock = threading.Lock()
+
+    def handle(request):
+        nonlocal concurrent, peak
+        with lock:
+            concurrent += 1
+            peak = max(peak, concurrent)
+        time.sleep(0.05)
+        with lock:
+            concurrent -= 1
+        request.send_body(b'ok', status=statuses.get(request.path, 200))
+
+    base = stub_server(handle)
+    limiter = AdaptiveLimiter(rate=0, initial=8, min_limit=2, max_limit=16)
+    session = Transport(limiter=limiter, retries=0).session()
+
+    assert session.get(f"{base}/busy").status_code == 503
+    assert limiter.stats()["limit"] == 4
+    assert session.get(f"{base}/throttled").status_code == 429
+    assert limiter.stats()["limit"] == 2
+    assert limiter.stats()["overloads"] == 2
+
+    # Upstream sees no more concurrent requests than the reduced limit, which
+    # then grows additively (1/limit per healthy response) while it is in use
+    _run(4, lambda n: session.get(f"{base}/{n}"))
+    assert peak == 2
+    grown = limiter.stats()["limit"]
+    assert 3 < grown < 4
+
+    # One request at a time does not use the limit, so it stops growing
+    for n in range(4):
+        session.get(f"{base}/{n}")
+    assert limiter.stats()["limit"] == grown
+
+
+def test_interactive_requests_are_served_before_queued_bulk(stub_server):
+    arrivals = []
+    unblock = threading.Event()
+    lock = threading.Lock()
+
+    def handle(request):
+        with lock:
+            arrivals.append(request.path)
+        if request.path.startswith('/hold'):
+            unblock.wait(5)
+        request.send_body(b'ok')
+
+    base = stub_server(handle)
+    limiter = AdaptiveLimiter(rate=0, initial=2, min_limit=2, max_limit=2)
+    session = Transport(limiter=limiter, retries=0).session()
+
+    # Fill both slots so everything after this has to queue
+    holders = [threading.Thread(target=session.get, args=(f"{base}/hold{n}",)) for n in range(2)]
+    for thread in holders:
+        thread.start()
+    _wait_until(lambda: len(arrivals) == 2)
+
+    # Bulk callers queue first, so only the priority can put interactive ones ahead
+    queued = []
+    for n in range(3):
+        queued.append(threading.Thread(target=session.get, args=(f"{base}/bulk{n}",), kwargs={'priority': BULK}))
+        queued[-1].start()
+        _wait_until(lambda: limiter.stats()["waiting"]["bulk"] == n + 1)
+    for n in range(3):
+        queued.append(threading.Thread(target=session.get, args=(f"{base}/interactive{n}",),
+                                       kwargs={'priority': INTERACTIVE}))
+        queued[-1].start()
+        _wait_until(lambda: limiter.stats()["waiting"]["interactive"] == n + 1)
+
+    unblock.set()
+    for thread in holders + queued:
+        thread.join(10)
+
+    served = [path.strip('/').rstrip('0123456789') for path in arrivals[2:]]
+    assert served == ["interactive"] * 3 + ["bulk"] * 3
+    assert limiter.stats()["granted"] == {"interactive": 5, "bulk": 3, "background": 0}
+
+
+def test_waiting_for_a_slot_gives_up_at_the_deadline(stub_server):
+    arrivals = []
+    unblock = threading.Event()
+
+    def handle(request):
+        arrivals.append(request.path)
+        unblock.wait(5)
+        request.send_body(b'ok')
+
+    base = stub_server(handle)
+    limiter = AdaptiveLimiter(rate=0, initial=1, min_limit=1, max_limit=1)
+    holder = threading.Thread(target=Transport(limiter=limiter, retries=0).session().get, args=(f"{base}/hold",))
+    holder.start()
+    _wait_until(lambda: arrivals == ["/hold"])
+
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        Transport(limiter=limiter, retries=0, total_timeout=0.3).session().get(f"{base}/queued", priority=BULK)
+    assert time.monotonic() - started < 1
+    assert arrivals == ["/hold"]
+    assert limiter.stats()["timeouts"] == 1
+    assert limiter.stats()["waiting"]["bulk"] == 0
+
+    # The abandoned waiter does not keep the slot once it is free
+    unblock.set()
+    holder.join(10)
+    limiter.acquire(BULK, timeout=1)
+    with pytest.raises(LimiterTimeout):
+        limiter.acquire(INTERACTIVE, timeout=0.1)
+    limiter.release()
+    assert limiter.stats()["in_flight"] == 0
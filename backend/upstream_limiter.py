@@ -0,0 +1,248 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+RATE = float(os.environ.get('PESU_UPSTREAM_RATE', 20))
+BURST = int(os.environ.get('PESU_UPSTREAM_BURST', 40))
+INITIAL_CONCURRENCY = int(os.environ.get('PESU_UPSTREAM_INITIAL_CONCURRENCY', 8))
+MIN_CONCURRENCY = int(os.environ.get('PESU_UPSTREAM_MIN_CONCURRENCY', 2))
+MAX_CONCURRENCY = int(os.environ.get('PESU_UPSTREAM_MAX_CONCURRENCY', 64))
+LATENCY_TOLERANCE = float(os.environ.get('PESU_UPSTREAM_LATENCY_TOLERANCE', 2.0))
+
+# Lower value is served first
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+
+# Slots bulk traffic leaves free so interactive calls are not stuck behind long downloads
+INTERACTIVE_RESERVE = 1
+OVERLOAD_DECREASE = 0.5
+LATENCY_DECREASE = 0.8
+# Latencies below this are never treated as spikes
+MIN_SPIKE_LATENCY = 0.05
+BASELINE_ALPHA = 0.05
+
+
+class LimiterTimeout(Exception):
+    """No slot was granted within the caller's timeout."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "wake", "granted", "cancelled", "queued_at")
+
+    def __init__(self, priority, wake):
+        self.priority = priority
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+        self.queued_at = time.monotonic()
+
+
+class AdaptiveLimiter:
+    """
+    Global gate in front of every request to PESU Academy.
+
+    A token bucket caps the request rate, and an AIMD concurrency limit
+    adapts to how upstream is coping: it grows by about one slot per
+    window of healthy responses and is cut multiplicatively on 429/5xx,
+    connection failures, or when latency climbs well above its running
+    baseline. Waiters are served by priority class; bulk traffic always
+    leaves INTERACTIVE_RESERVE slots free for interactive calls, and
+    background traffic uses at most half the limit.
+
+    Usable from threads (acquire) and from the download engine's event
+    loop (acquire_async); every grant must be paired with release(). Both
+    take a timeout and raise LimiterTimeout when it runs out, so callers
+    are not stuck behind a limit cut to its floor.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, initial=INITIAL_CONCURRENCY, min_limit=MIN_CONCURRENCY,
+                 max_limit=MAX_CONCURRENCY, latency_tolerance=LATENCY_TOLERANCE):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._baseline = None
+        self._last_decrease = 0.0
+        self.overloads = 0
+        self.latency_spikes = 0
+        self.decreases = 0
+        self.timeouts = 0
+        self._granted = {p: 0 for p in PRIORITY_NAMES}
+        self._waited = {p: 0.0 for p in PRIORITY_NAMES}
+
+    def _capacity(self, priority):
+        limit = int(self.limit)
+        if priority == BULK:
+            limit = max(1, limit - INTERACTIVE_RESERVE)
+        elif priority == BACKGROUND:
+            # Cache warming never takes more than half of what upstream is coping with
+            limit = max(1, limit // 2)
+        return limit
+
+    def _take_token(self, now):
+        """Returns 0 if a token was taken, otherwise seconds until one is available."""
+        if self.rate <= 0:
+            return 0
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def _dispatch(self):
+        # Caller holds the lock
+        while self._waiters:
+            priority, _, waiter = self._waiters[0]
+            if waiter.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= self._capacity(priority):
+                return
+            now = time.monotonic()
+            wait = self._take_token(now)
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            waiter.granted = True
+            self._granted[priority] += 1
+            self._waited[priority] += now - waiter.queued_at
+            waiter.wake()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _enqueue(self, waiter):
+        with self._lock:
+            heapq.heappush(self._waiters, (waiter.priority, next(self._seq), waiter))
+            self._dispatch()
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        event = threading.Event()
+        waiter = _Waiter(priority, event.set)
+        self._enqueue(waiter)
+        if event.wait(timeout):
+            return
+        with self._lock:
+            if waiter.granted:
+                # Granted just as the wait ran out
+                return
+            waiter.cancelled = True
+            self.timeouts += 1
+        raise LimiterTimeout(f"No upstream slot within {timeout:.1f}s")
+
+    async def acquire_async(self, priority=BULK, timeout=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(None)
+
+        waiter = _Waiter(priority, lambda: loop.call_soon_threadsafe(resolve))
+        self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            with self._lock:
+                if waiter.granted:
+                    self.in_flight -= 1
+                    self._dispatch()
+                else:
+                    waiter.cancelled = True
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise LimiterTimeout(f"No upstream slot within {timeout:.1f}s") from None
+            raise
+
+    def release(self, latency=None, overloaded=False):
+        """
+        Returns a slot. latency is the time to the response headers, and
+        overloaded marks a 429/5xx or a failed connection.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self._adjust(latency, overloaded)
+            self._dispatch()
+
+    def _adjust(self, latency, overloaded):
+        spike = False
+        if latency is not None and not overloaded:
+            if self._baseline is None:
+                self._baseline = latency
+            spike = latency > max(self._baseline * self.latency_tolerance, MIN_SPIKE_LATENCY)
+            self._baseline += BASELINE_ALPHA * (latency - self._baseline)
+
+        if overloaded or spike:
+            if overloaded:
+                self.overloads += 1
+            else:
+                self.latency_spikes += 1
+            now = time.monotonic()
+            # At most one cut per round trip, since a burst of failures reports the same congestion
+            if now - self._last_decrease >= (self._baseline or 0):
+                self._last_decrease = now
+                factor = OVERLOAD_DECREASE if overloaded else LATENCY_DECREASE
+                self.limit = max(self.min_limit, self.limit * factor)
+                self.decreases += 1
+        elif self.in_flight + 1 >= self.limit / 2:
+            # Only grow a limit that is actually being used, or it drifts far above what upstream has proven
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self):
+        with self._lock:
+            waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, waiter in self._waiters:
+                if not waiter.cancelled:
+                    waiting[PRIORITY_NAMES[priority]] += 1
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "rate": self.rate,
+                "tokens": round(self._tokens, 2),
+                "baseline_latency": round(self._baseline, 4) if self._baseline is not None else None,
+                "overloads": self.overloads,
+                "latency_spikes": self.latency_spikes,
+                "decreases": self.decreases,
+                "timeouts": self.timeouts,
+                "waiting": waiting,
+                "granted": {PRIORITY_NAMES[p]: n for p, n in self._granted.items()},
+                "avg_wait": {
+                    PRIORITY_NAMES[p]: round(self._waited[p] / n, 4) if n else 0.0
+                    for p, n in self._granted.items()
+                }
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter()
+        return _limiter
@@ -0,0 +1,130 @@
+import multiprocessing
+import os
+import threading
+import time
+
+PRELOAD = os.environ.get('PESU_PRELOAD', '1') == '1'
+# Conversion workers to start and warm, at most the pool size; 0 means the whole pool. By default each
+# gunicorn worker warms its share of the CPUs, so startup spawns no more converters than the host has CPUs
+PRELOAD_WORKERS = int(os.environ.get('PESU_CONVERSION_PRELOAD') or
+                      max(1, (os.cpu_count() or 2) // max(1, int(os.environ.get('WEB_CONCURRENCY') or 1))))
+# Importing app should stay under this, so health and browse routes come up fast
+IMPORT_BUDGET_MS = float(os.environ.get('PESU_IMPORT_BUDGET_MS', 1000))
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'warmup')
+SAMPLES = [("pptx", os.path.join(SAMPLES_DIR, 'sample.pptx')), ("docx", os.path.join(SAMPLES_DIR, 'sample.docx'))]
+
+PENDING = "pending"
+WARMING = "warming"
+READY = "ready"
+DISABLED = "disabled"
+
+
+class Warmup:
+    """
+    Startup phase that runs after the app is importable: loads the modules
+    the download path imports lazily and converts a tiny built-in PPTX and
+    DOCX in the conversion workers, so the first real download does not pay
+    for loading and JIT-compiling the .NET runtime. Runs in a background
+    thread; ready() turns true once it has finished, even if a step failed.
+    """
+
+    def __init__(self, preload=PRELOAD, workers=PRELOAD_WORKERS):
+        self.preload = preload
+        self.workers = workers
+        self.state = PENDING if preload else DISABLED
+        self.steps = {}
+        self.errors = {}
+        self.import_seconds = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not preload:
+            self._done.set()
+
+    def imported(self, seconds):
+        """Records how long importing the app took and warns when it is over budget."""
+        self.import_seconds = seconds
+        if seconds * 1000 > IMPORT_BUDGET_MS:
+            print(f"App import took {seconds * 1000:.0f} ms, over the {IMPORT_BUDGET_MS:.0f} ms budget")
+
+    def start(self):
+        # Conversion workers are multiprocessing children and cannot start a pool of their own;
+        # warm-up belongs to the serving process (gunicorn's forked workers are not such children)
+        if multiprocessing.current_process().name != 'MainProcess':
+            return
+        with self._lock:
+            # Once per process; a forked worker starts its own
+            if not self.preload or self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.state = WARMING
+            self._done.clear()
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    def _step(self, name, fn):
+        started = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            self.errors[name] = str(e)
+            print(f"Warm-up step {name} failed: {e}")
+            result = None
+        self.steps[name] = round(time.monotonic() - started, 3)
+        return result
+
+    def _run(self):
+        try:
+            self._step("modules", _import_download_path)
+            self._step("conversion", lambda: _warm_converters(self.workers))
+            print(f"Warm-up finished in {sum(self.steps.values()):.1f}s: {self.steps}")
+        finally:
+            self.state = READY
+            self._done.set()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "ready": self.ready(),
+            "import_ms": round(self.import_seconds * 1000, 1) if self.import_seconds is not None else None,
+            "import_budget_ms": IMPORT_BUDGET_MS,
+            "steps": dict(self.steps),
+            "errors": dict(self.errors)
+        }
+
+
+def _import_download_path():
+    # The request handlers import these on first use; pay for it here instead
+    import course_export  # noqa: F401
+    import pipeline  # noqa: F401
+    from download_engine import get_engine
+    get_engine()
+
+
+def _warm_converters(workers):
+    from conversion_pool import WORKERS, _in_process, get_pool
+    if WORKERS <= 0:
+        import tempfile
+        with tempfile.TemporaryDirectory(prefix="pesu_warmup_") as out_dir:
+            for kind, source_path in SAMPLES:
+                _in_process(kind)(source_path, os.path.join(out_dir, f"{kind}.pdf"))
+        return 0
+    return get_pool().warm_up(SAMPLES, workers or None)
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup():
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = Warmup()
+        return _warmup
@@ -0,0 +1,363 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+ROOT = os.environ.get('PESU_WORKSPACE_DIR') or os.path.join(tempfile.gettempdir(), 'pesu_work')
+# Optional RAM-backed directory (e.g. /dev/shm) for jobs expected to stay small
+TMPFS_ROOT = os.environ.get('PESU_WORKSPACE_TMPFS', '')
+TMPFS_JOB_BYTES = int(os.environ.get('PESU_WORKSPACE_TMPFS_JOB_MB', 64)) * 1024 * 1024
+TMPFS_MAX_BYTES = int(os.environ.get('PESU_WORKSPACE_TMPFS_MAX_MB', 512)) * 1024 * 1024
+JOB_QUOTA = int(os.environ.get('PESU_WORKSPACE_JOB_MB', 2048)) * 1024 * 1024
+MAX_BYTES = int(os.environ.get('PESU_WORKSPACE_MAX_MB', 10240)) * 1024 * 1024
+# How long a job waits for space held by other jobs before giving up
+WAIT_TIMEOUT = float(os.environ.get('PESU_WORKSPACE_WAIT', 120))
+GC_INTERVAL = int(os.environ.get('PESU_WORKSPACE_GC_INTERVAL', 10 * 60))
+# Workspaces older than this are removed even if their process seems alive (its PID may be reused)
+ORPHAN_AGE = int(os.environ.get('PESU_WORKSPACE_ORPHAN_AGE', 6 * 60 * 60))
+# This process's own unregistered directories are only removed once they are this old
+OWN_GRACE = 10 * 60
+# Used to pick tmpfs before sizes are known
+FILE_ESTIMATE = 16 * 1024 * 1024
+
+# Per-request directories used before workspaces, collected once they are old enough
+LEGACY_PREFIXES = ("pesu_temp_", "pesu_job_", "pesu_export_", "pesu_warm_")
+
+
+class WorkspaceFull(Exception):
+    """No space became free within WAIT_TIMEOUT."""
+
+
+class QuotaExceeded(WorkspaceFull):
+    """A single job went over JOB_QUOTA."""
+
+
+def _disk_bytes(path):
+    """Bytes actually allocated under path; files hard-linked from a cache are not counted."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            if st.st_nlink == 1:
+                total += st.st_blocks * 512
+    return total
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Workspace:
+    """
+    A job's private scratch directory. Writers charge() the bytes they put
+    in it; close() deletes it and hands the space back.
+    """
+
+    def __init__(self, manager, path, tmpfs_reserved, quota):
+        self.manager = manager
+        self.path = path
+        # Expected size held against the tmpfs budget, 0 for workspaces on disk
+        self.tmpfs_reserved = tmpfs_reserved
+        self.quota = quota
+        self.used = 0
+        # Every byte ever charged; charges made while the tree is being measured are added on top
+        self.charged = 0
+        self.created_at = time.time()
+        self.closed = False
+
+    def __fspath__(self):
+        return self.path
+
+    def charge(self, nbytes):
+        self.manager._charge(self, nbytes)
+
+    def charge_file(self, path):
+        """Charges for a file written into the workspace, unless it is a hard link to a cached copy."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if st.st_nlink == 1:
+            self.charge(st.st_size)
+
+    def refresh(self):
+        """Re-measures the workspace after files were deleted or replaced, freeing their charge."""
+        self.manager._refresh(self)
+
+    def close(self):
+        self.manager._close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class WorkspaceManager:
+    """
+    Hands out one isolated directory per job under ROOT (or TMPFS_ROOT for
+    jobs expected to be small), named <pid>_<n> so concurrent jobs of the
+    same user, and workers sharing the directory, never collide.
+
+    Bytes are accounted as jobs write: a job over JOB_QUOTA fails, and a
+    job that would take this process over MAX_BYTES waits until others
+    release space (backpressure) and fails after WAIT_TIMEOUT. Totals are
+    re-measured on disk before anything is refused, since files get
+    deleted as jobs progress. Workspaces left by crashed processes are
+    collected at startup and every GC_INTERVAL.
+    """
+
+    def __init__(self, root=ROOT, tmpfs_root=TMPFS_ROOT, job_quota=JOB_QUOTA, max_bytes=MAX_BYTES,
+                 tmpfs_job_bytes=TMPFS_JOB_BYTES, tmpfs_max_bytes=TMPFS_MAX_BYTES, wait_timeout=WAIT_TIMEOUT):
+        self.root = root
+        self.tmpfs_root = os.path.join(tmpfs_root, 'pesu_work') if tmpfs_root else None
+        self.job_quota = job_quota
+        self.max_bytes = max_bytes
+        self.tmpfs_job_bytes = tmpfs_job_bytes
+        self.tmpfs_max_bytes = tmpfs_max_bytes
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._live = {}
+        self._next_id = 0
+        self._gc_thread = None
+        self.used = 0
+        self.tmpfs_reserved = 0
+        self.waits = 0
+        self.rejected = 0
+        self.collected = 0
+        for directory in filter(None, (self.root, self.tmpfs_root)):
+            os.makedirs(directory, exist_ok=True)
+
+    def create(self, expected_bytes=0):
+        """
+        Returns a new Workspace; waits while this process is at MAX_BYTES.
+        expected_bytes (0 if unknown) decides whether it goes on tmpfs.
+        """
+        with self._cond:
+            self._wait_for(0)
+            tmpfs = (self.tmpfs_root is not None and 0 < expected_bytes <= self.tmpfs_job_bytes
+                     and self.tmpfs_reserved + expected_bytes <= self.tmpfs_max_bytes)
+            self._next_id += 1
+            name = f"{os.getpid()}_{self._next_id}_{os.urandom(4).hex()}"
+            path = os.path.join(self.tmpfs_root if tmpfs else self.root, name)
+            os.makedirs(path)
+            workspace = Workspace(self, path, expected_bytes if tmpfs else 0, self.job_quota)
+            if tmpfs:
+                self.tmpfs_reserved += expected_bytes
+            self._live[path] = workspace
+            return workspace
+
+    def find(self, path):
+        """The live workspace containing path, or None."""
+        path = os.path.abspath(path)
+        with self._cond:
+            while True:
+                workspace = self._live.get(path)
+                if workspace is not None:
+                    return workspace
+                parent = os.path.dirname(path)
+                if parent == path:
+                    return None
+                path = parent
+
+    def _charge(self, workspace, nbytes):
+        with self._cond:
+            if workspace.used + nbytes > workspace.quota:
+                self._remeasure([workspace])
+                if workspace.used + nbytes > workspace.quota:
+                    self.rejected += 1
+                    raise QuotaExceeded(f"Job used more than {workspace.quota // (1024 * 1024)} MB of scratch space")
+            self._wait_for(nbytes, workspace)
+            workspace.charged += nbytes
+            if not workspace.closed:
+                workspace.used += nbytes
+                self.used += nbytes
+
+    def _wait_for(self, nbytes, workspace=None):
+        # Called with the lock held
+        if self.used + nbytes <= self.max_bytes:
+            return
+        self._remeasure(list(self._live.values()))
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while self.used + nbytes > self.max_bytes:
+            # A job alone over the limit can't be helped by waiting for others
+            if workspace is not None and workspace.used == self.used:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.rejected += 1
+                raise WorkspaceFull("Scratch space is full, try again later")
+            if not waited:
+                self.waits += 1
+                waited = True
+            self._cond.wait(min(remaining, 5))
+            self._remeasure(list(self._live.values()))
+
+    def _remeasure(self, workspaces):
+        # Called with the lock held. Walking large trees is slow, so like a wait it
+        # releases the lock meanwhile; callers re-check what they need afterwards
+        marks = [(workspace, workspace.charged) for workspace in workspaces if not workspace.closed]
+        self._cond.release()
+        try:
+            measured = [(workspace, mark, _disk_bytes(workspace.path)) for workspace, mark in marks]
+        finally:
+            self._cond.acquire()
+        for workspace, mark, actual in measured:
+            if workspace.closed:
+                continue
+            actual += workspace.charged - mark
+            self.used += actual - workspace.used
+            workspace.used = actual
+
+    def _refresh(self, workspace):
+        with self._cond:
+            self._remeasure([workspace])
+            self._cond.notify_all()
+
+    def _close(self, workspace):
+        with self._cond:
+            if workspace.closed:
+                return
+            workspace.closed = True
+            self._live.pop(workspace.path, None)
+            self.used -= workspace.used
+            self.tmpfs_reserved -= workspace.tmpfs_reserved
+            self._cond.notify_all()
+        shutil.rmtree(workspace.path, ignore_errors=True)
+
+    def collect(self):
+        """Removes workspaces of dead processes and old leftovers; returns how many were removed."""
+        removed = 0
+        now = time.time()
+        for directory in filter(None, (self.root, self.tmpfs_root)):
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                try:
+                    pid = int(entry.name.split('_', 1)[0])
+                    age = now - entry.stat(follow_symlinks=False).st_mtime
+                except (ValueError, OSError):
+                    continue
+                # Our own unregistered directories are leaks (e.g. from an earlier process with the same PID)
+                # once past the grace period; other processes' only once they have exited
+                if pid == os.getpid():
+                    orphaned = age > OWN_GRACE
+                else:
+                    orphaned = not _pid_alive(pid) or age > ORPHAN_AGE
+                if not orphaned:
+                    continue
+                with self._cond:
+                    # Checked just before removing: create() may have registered it since the scan.
+                    # Names are never reused, so once it is not live here it cannot become live
+                    if entry.path in self._live:
+                        continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        removed += self._collect_legacy(now)
+        self.collected += removed
+        return removed
+
+    def _collect_legacy(self, now):
+        removed = 0
+        base = tempfile.gettempdir()
+        try:
+            entries = list(os.scandir(base))
+        except OSError:
+            return 0
+        for entry in entries:
+            if not entry.name.startswith(LEGACY_PREFIXES) or not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                if now - entry.stat(follow_symlinks=False).st_mtime <= ORPHAN_AGE:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+        return removed
+
+    def start_gc(self, interval=GC_INTERVAL):
+        removed = self.collect()
+        if removed:
+            print(f"Removed {removed} orphaned workspaces")
+        if interval > 0 and self._gc_thread is None:
+            self._gc_thread = threading.Thread(target=self._gc_loop, args=(interval,), name="workspace-gc",
+                                               daemon=True)
+            self._gc_thread.start()
+
+    def _gc_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Workspace GC error: {e}")
+
+    def stats(self):
+        with self._cond:
+            result = {
+                "root": self.root,
+                "tmpfs_root": self.tmpfs_root,
+                "workspaces": len(self._live),
+                "tmpfs_workspaces": sum(1 for w in self._live.values() if w.tmpfs_reserved),
+                "used_bytes": self.used,
+                "max_bytes": self.max_bytes,
+                "job_quota_bytes": self.job_quota,
+                "tmpfs_reserved_bytes": self.tmpfs_reserved,
+                "waits": self.waits,
+                "rejected": self.rejected,
+                "collected": self.collected
+            }
+        for key, directory in (("disk", self.root), ("tmpfs", self.tmpfs_root)):
+            if directory:
+                usage = shutil.disk_usage(directory)
+                result[key] = {"total_bytes": usage.total, "free_bytes": usage.free}
+        return result
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_workspaces():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WorkspaceManager()
+        return _manager
+
+
+def charge(path, nbytes):
+    """Charges nbytes written under path to its workspace, if it is in one."""
+    workspace = get_workspaces().find(path)
+    if workspace is not None:
+        workspace.charge(nbytes)
+
+
+def charge_file(path):
+    workspace = get_workspaces().find(path)
+    if workspace is not None:
+        workspace.charge_file(path)
+
+
+def refresh(path):
+    workspace = get_workspaces().find(path)
+    if workspace is not None:
+        workspace.refresh()